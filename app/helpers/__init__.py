@@ -1,6 +1,8 @@
 import app.helpers.memory_utils as mem_utils
 import app.helpers.process_utils as ps_utils
 from app.helpers.aob_file import AOBFile
+from app.helpers.aob_matcher import AOBMatcher
+from app.helpers.aob_pattern import AOBPattern
 from app.helpers.aob_value import AOBValue
 from app.helpers.aob_walk import AOBWalk
 from app.helpers.data_store import DataStore
@@ -8,4 +10,5 @@ from app.helpers.dyn_html import DynamicHTML
 from app.helpers.exceptions import ScriptException, SearchException, AOBException
 from app.helpers.memory_handler import MemoryHandler
 from app.helpers.operation_control import OperationControl
+from app.helpers.pointer_resolver import PointerResolver
 from app.helpers.progress import Progress
@@ -0,0 +1,197 @@
+from mem_edit import Process
+
+from app.helpers.aob_value import AOBValue
+from app.helpers.buffer_pool import BufferPool
+from app.helpers.byte_frequency import ByteFrequency
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class AOBMatcher:
+    """
+    Finds every match of many AOBs, wildcards included, in one pass over memory.
+
+    Each AOB is anchored on one run of fixed bytes, the rarest one when a ByteFrequency is given, otherwise the run
+    AOBValue picks for its search value. With a few anchors every anchor is found with find(). With more, the first two
+    bytes of every anchor are set in a 65536 entry table and a region is filtered against the table for all anchors at
+    once, so the cost of a refresh grows with the size of memory, not with the number of AOBs. The candidates are then
+    checked against the fixed bytes of the full patterns, vectorized when numpy is available.
+
+    BACKEND_REGEX matches each AOB with its compiled AOBPattern instead and is used by default without numpy.
+    """
+    BACKEND_FIND = 'find'
+    BACKEND_REGEX = 'regex'
+    chunk_size = 25600000
+    filter_block = 1048576
+    table_anchors = 4
+
+    def __init__(self, aobs=(), frequency: ByteFrequency = None, backend: str = None):
+        self.frequency = frequency
+        self.backend = backend if backend is not None else (self.BACKEND_FIND if np is not None else self.BACKEND_REGEX)
+        self.patterns = {}
+        self._anchors = None
+        self._table = None
+        self._max_size = 0
+        for aob in aobs:
+            self.add(aob)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def add(self, aob):
+        value = aob if isinstance(aob, AOBValue) else AOBValue(aob)
+        aob_string = value.get_string()
+        if aob_string in self.patterns:
+            return
+        aob_bytes = value.aob_item['aob_bytes']
+        segments = []
+        for i, b in enumerate(aob_bytes):
+            if b >= 256:
+                continue
+            if segments and segments[-1][0] + len(segments[-1][1]) == i:
+                segments[-1][1].append(b)
+            else:
+                segments.append((i, bytearray([b])))
+        if self.frequency is not None:
+            offset, length = self.frequency.best_anchor(aob_bytes)
+            anchor = bytes(aob_bytes[offset:offset+length])
+        else:
+            offset, anchor = value.get_offset(), bytes(value.get_search_value())
+        self.patterns[aob_string] = {
+            'anchor': anchor,
+            'offset': offset,
+            'size': len(aob_bytes),
+            'regex': value.get_pattern(),
+            'segments': [(offset, bytes(data)) for offset, data in segments]
+        }
+        self._anchors = None
+
+    def compile(self):
+        self._anchors = {}
+        for aob_string, pattern in self.patterns.items():
+            self._anchors.setdefault(pattern['anchor'], []).append((aob_string, pattern))
+        self._max_size = max([x['size'] for x in self.patterns.values()], default=0)
+        if np is None or self.backend != self.BACKEND_FIND or len(self._anchors) < self.table_anchors:
+            self._table = None
+            return
+        self._table = np.zeros(65536, dtype=bool)
+        for anchor in self._anchors:
+            if len(anchor) == 1:
+                self._table[anchor[0] | (np.arange(256) << 8)] = True
+            else:
+                self._table[anchor[0] | (anchor[1] << 8)] = True
+
+    @staticmethod
+    def _verify(data, start: int, segments):
+        for offset, literal in segments:
+            if data[start+offset:start+offset+len(literal)] != literal:
+                return False
+        return True
+
+    def _add_found(self, results: dict, aob_string: str, addresses, limit: int):
+        found = results.setdefault(aob_string, [])
+        if limit:
+            addresses = addresses[:max(0, limit - len(found))]
+        found.extend(addresses)
+
+    def _verify_starts(self, memory, starts, pattern, length: int, last: int):
+        #keeps the pattern starts inside the chunk whose fixed bytes all match
+        starts = starts[(starts >= 0) & (starts < last) & (starts + pattern['size'] <= length)]
+        for offset, literal in pattern['segments']:
+            for i, b in enumerate(literal):
+                starts = starts[memory[starts + offset + i] == b]
+        return starts
+
+    def _search_table(self, data, memory, base_address: int, length: int, results: dict, limit: int, last: int):
+        pairs = np.ndarray(shape=(length - 1,), dtype='<u2', buffer=data, strides=(1,))
+        #filter in blocks, indexing the table converts the pairs to a temporary intp array
+        positions = np.concatenate([np.flatnonzero(self._table[pairs[i:i+self.filter_block]]) + i for i in range(0, len(pairs), self.filter_block)])
+        if self._table[memory[-1]]:
+            positions = np.append(positions, length - 1) #a one byte anchor on the last byte has no pair
+        for anchor, patterns in self._anchors.items():
+            hits = positions[memory[positions] == anchor[0]]
+            for aob_string, pattern in patterns:
+                starts = self._verify_starts(memory, hits - pattern['offset'], pattern, length, last)
+                self._add_found(results, aob_string, (starts + base_address).tolist(), limit)
+
+    def _search_find(self, data, memory, base_address: int, length: int, results: dict, limit: int, last: int):
+        for anchor, patterns in self._anchors.items():
+            hits = []
+            pos = data.find(anchor, 0, length)
+            while pos != -1:
+                hits.append(pos)
+                pos = data.find(anchor, pos + 1, length)
+            for aob_string, pattern in patterns:
+                if memory is not None:
+                    starts = self._verify_starts(memory, np.array(hits, dtype=np.int64) - pattern['offset'], pattern, length, last)
+                    self._add_found(results, aob_string, (starts + base_address).tolist(), limit)
+                    continue
+                for pos in hits:
+                    start = pos - pattern['offset']
+                    if 0 <= start < last and start + pattern['size'] <= length and self._verify(data, start, pattern['segments']):
+                        self._add_found(results, aob_string, [base_address + start], limit)
+
+    def _search_regex(self, data, base_address: int, length: int, results: dict, limit: int, last: int):
+        for aob_string, pattern in self.patterns.items():
+            found = []
+            for start in pattern['regex'].finditer(data, length):
+                if start >= last or (limit and len(found) >= limit):
+                    break
+                found.append(base_address + start)
+            self._add_found(results, aob_string, found, limit)
+
+    def search(self, data, base_address: int = 0, length: int = None, results: dict = None, limit: int = 0, last: int = None):
+        """
+        Match every AOB against data[:length], which can be bytes, a memory map or any other buffer with find().
+
+        Addresses are added to results keyed by AOB string. Only matches starting before last are kept, the rest
+        belong to the next chunk. An AOB stops collecting addresses once it has limit of them.
+        """
+        if self._anchors is None:
+            self.compile()
+        results = {} if results is None else results
+        length = len(data) if length is None else length
+        last = length if last is None else last
+        if self.backend == self.BACKEND_REGEX:
+            self._search_regex(data, base_address, length, results, limit, last)
+            return results
+        memory = np.frombuffer(data, dtype=np.uint8, count=length) if np is not None and length > 0 else None
+        if self._table is not None and length >= 2:
+            self._search_table(data, memory, base_address, length, results, limit, last)
+        else:
+            self._search_find(data, memory, base_address, length, results, limit, last)
+        return results
+
+    def search_memory(self, memory: Process, regions, limit: int = 0, check_cancel: callable = None):
+        """
+        Read every (start, stop) region once in chunks and match all AOBs against it. Chunks overlap by the longest
+        AOB so matches crossing a chunk boundary are found. Returns a dict of address lists keyed by AOB string.
+        """
+        results = {x: [] for x in self.patterns}
+        if not self.patterns:
+            return results
+        if self._anchors is None:
+            self.compile()
+        pool = BufferPool.shared()
+        overlap = self._max_size - 1
+        for start, stop in regions:
+            pos = start
+            while pos < stop:
+                if check_cancel:
+                    check_cancel()
+                size = min(stop - pos, self.chunk_size + overlap)
+                with pool.buffer(size) as buffer:
+                    try:
+                        memory.read_memory(pos, buffer)
+                    except OSError:
+                        break
+                    data = pool.source(buffer)
+                    done = pos + size >= stop
+                    self.search(data if data is not None else bytes(buffer), pos, size, results, limit, size if done else size - overlap)
+                if done:
+                    break
+                pos += size - overlap
+        return results
@@ -0,0 +1,90 @@
+import re
+import threading
+
+
+class AOBPattern:
+    """
+    AOBs compiled to byte regular expressions, so matching runs inside the re module instead of a Python loop.
+
+    Fixed bytes are escaped literals and every run of wildcards becomes one .{n} with DOTALL, so a wildcard matches any
+    byte. Leading wildcards are left out of the expression, a search starting on them would try every position, and
+    are added back to the match position instead. Compiled patterns are cached by AOB string and by byte list.
+    """
+    max_cache = 4096
+    _lock = threading.Lock()
+    _strings = {}
+    _patterns = {}
+
+    def __init__(self, aob_bytes):
+        self.size = len(aob_bytes)
+        self.lead = 0
+        while self.lead < self.size and aob_bytes[self.lead] >= 256:
+            self.lead += 1
+        parts = []
+        pos = self.lead
+        while pos < self.size:
+            end = pos
+            if aob_bytes[pos] >= 256:
+                while end < self.size and aob_bytes[end] >= 256:
+                    end += 1
+                parts.append(b'.' if end - pos == 1 else b'.{%d}' % (end - pos))
+            else:
+                while end < self.size and aob_bytes[end] < 256:
+                    end += 1
+                parts.append(re.escape(bytes(aob_bytes[pos:end])))
+            pos = end
+        self.regex = re.compile(b''.join(parts), re.DOTALL)
+
+    @classmethod
+    def compile(cls, aob_bytes) -> "AOBPattern":
+        """
+        The cached pattern of a list of bytes, 256 marks a wildcard.
+        """
+        key = tuple(aob_bytes)
+        pattern = cls._patterns.get(key, None)
+        if pattern is None:
+            pattern = AOBPattern(key)
+            with cls._lock:
+                if len(cls._patterns) >= cls.max_cache:
+                    cls._patterns.clear()
+                cls._patterns[key] = pattern
+        return pattern
+
+    @classmethod
+    def from_string(cls, aob_string: str) -> "AOBPattern":
+        """
+        The cached pattern of an AOB string like 'DE AD ?? EF'.
+        """
+        pattern = cls._strings.get(aob_string, None)
+        if pattern is None:
+            pattern = cls.compile([int(x, 16) if x != '??' else 256 for x in aob_string.split(" ")])
+            with cls._lock:
+                if len(cls._strings) >= cls.max_cache:
+                    cls._strings.clear()
+                cls._strings[aob_string] = pattern
+        return pattern
+
+    def match(self, data, pos: int = 0) -> bool:
+        """
+        True if the AOB matches data, any bytes-like object, at pos.
+        """
+        if pos < 0 or pos + self.size > len(data):
+            return False
+        return self.regex.match(data, pos + self.lead, pos + self.size) is not None
+
+    def finditer(self, data, length: int = None, start: int = 0):
+        """
+        Yield the start of every match in data[start:length], overlapping matches included like the other search
+        backends. data can be bytes, a memoryview or a memory map, it is searched in place.
+        """
+        length = len(data) if length is None else length
+        #search again one byte after every match, a lookahead expression would find the same but loses the literal
+        #prefix scan of the re module
+        pos = start + self.lead
+        last = length - self.size + self.lead
+        while pos <= last:
+            m = self.regex.search(data, pos, length)
+            if m is None or m.start() > last:
+                break
+            yield m.start() - self.lead
+            pos = m.start() + 1
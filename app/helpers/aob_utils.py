@@ -3,6 +3,7 @@ from typing import Union
 
 from mem_edit import Process
 
+from app.helpers.buffer_pool import BufferPool
 from app.helpers.operation_control import OperationControl
 from app.helpers.progress import Progress
 
@@ -21,8 +22,8 @@ class AOBUtilities:
         _end = ls[-1][1]
         for start, stop in self.mem.list_mapped_regions():
             try:
-                region_buffer = (ctypes.c_byte * (stop - start))()
-                self.mem.read_memory(start, region_buffer)
+                with BufferPool.shared().buffer(stop - start, ctypes.c_byte) as region_buffer:
+                    self.mem.read_memory(start, region_buffer)
                 total += (stop-start)
             except OSError:
                 continue
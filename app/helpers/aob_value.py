@@ -1,5 +1,6 @@
 import ctypes
 
+from app.helpers.aob_pattern import AOBPattern
 from app.helpers.exceptions import AOBException
 
 
@@ -95,13 +96,18 @@ class AOBValue:
         mem = args[0]
         cap = args[1]
         user = args[2]
-        for i in range(0, self.aob_item['size']):
-            bt = self.aob_item['aob_bytes'][i]
-            if bt >= 256:
-                continue
-            if bt != mem[i]:
-                return False
-        return True
+        return self.get_pattern().match(bytes(mem))
+
+    def get_pattern(self) -> AOBPattern:
+        return AOBPattern.from_string(self.aob_item['aob_string'])
+
+    def select_anchor(self, frequency):
+        """
+        Search on the rarest run of fixed bytes according to a ByteFrequency instead of the first usable run.
+        """
+        offset, length = frequency.best_anchor(self.aob_item['aob_bytes'])
+        self.aob_search_value = (ctypes.c_ubyte * length)(*bytes(self.aob_item['aob_bytes'][offset:offset+length]))
+        self.offset = offset
 
     def get_search_value(self):
         return self.aob_search_value
@@ -3,6 +3,8 @@ import ctypes
 from mem_edit import Process
 
 from app.helpers.aob_file import AOBFile
+from app.helpers.aob_matcher import AOBMatcher
+from app.helpers.byte_frequency import ByteFrequency
 from app.helpers.data_store import DataStore
 from app.helpers.exceptions import AOBException, BreakException
 from app.helpers.memory_utils import value_to_bytes
@@ -108,38 +110,24 @@ class AOBWalk:
         self.create()
         if len(self.aob_tree) == 0:
             raise AOBException('No AOBs to be searched')
-        index = 0
+        elements = [b for bucket in self.aob_tree.values() for b in bucket]
+        matcher = AOBMatcher([b['aob_data']['aob_string'] for b in elements], ByteFrequency.sample(memory, memory.list_mapped_regions()))
+        found = {}
         for start, end in memory.list_mapped_regions():
-            try:
-                size = end-start
-                region_buffer = (ctypes.c_byte * size)()
-                memory.read_memory(start, region_buffer)
-                data = bytes(region_buffer)
-                keys = [int(x,16) for x in list(self.aob_tree.keys())]
-                pos = 0
-                #for k in keys:
-                #    while pos >= 0 and pos < size:
-                #        if self.operation_control.is_control_break():
-                #            raise BreakException()
-                #        pos = data.find(k, pos)
-                #        if pos > -1:
-                #            self.process_match(data, pos, data[pos], start)
-                #            pos += 1
-                #data.find(keys[0])
-                for i in range(0, len(data)):
-                    if self.operation_control.is_control_break():
-                        raise BreakException()
-                    if data[i] in keys:
-                        self.process_match(data, i, data[i], start)
-                    if progress:
-                        progress.increment(1)
-            except OSError:
-                if progress:
-                    progress.increment(end-start)
-            finally:
-                index += 1
+            for aob_string, addresses in matcher.search_memory(memory, [(start, end)], check_cancel=self._check_break).items():
+                found.setdefault(aob_string, []).extend(addresses)
+            if progress:
+                progress.increment(end-start)
+        for b in elements:
+            addresses = found.get(b['aob_data']['aob_string'], [])
+            b['addresses'].extend(addresses)
+            self.aob_map[b['aob_data']['aob_string']]['addresses'].extend(addresses)
         self.filter()
 
+    def _check_break(self):
+        if self.operation_control.is_control_break():
+            raise BreakException()
+
     def filter(self):
         self.remove_zero_matches()
         if self.filter_result_size > 0:
@@ -0,0 +1,97 @@
+import ctypes
+import mmap
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+class BufferPool:
+    """
+    Pool of reusable scan buffers shared by every scan path.
+
+    Buffers are anonymous memory maps rounded up to a power of two. Their pages are only committed when they are first
+    written and are reused by the next chunk instead of allocating and zero filling a new ctypes array every time.
+    Buffers handed out by the pool can be searched in place with find(), see source(). The pool only holds a weak
+    reference to a buffer in use, a buffer dropped without release() gives its map up instead of keeping it forever.
+    """
+    min_size = 65536
+    max_idle = 128 * 1048576
+    _shared = None
+
+    def __init__(self, max_idle: int = None):
+        self.max_idle = max_idle if max_idle is not None else self.max_idle
+        self._lock = threading.RLock() #the weakref callback of a dropped buffer can run while the lock is held
+        self._idle = {}
+        self._idle_size = 0
+        self._in_use = {}
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = BufferPool()
+        return cls._shared
+
+    def _bucket(self, size: int):
+        return max(self.min_size, 1 << (max(1, size) - 1).bit_length())
+
+    def acquire(self, size: int, ctype=ctypes.c_ubyte) -> ctypes.Array:
+        """
+        A ctypes array of size elements backed by a pooled map. The content is left over from the last user.
+        """
+        bucket = self._bucket(size * ctypes.sizeof(ctype))
+        with self._lock:
+            blocks = self._idle.get(bucket, None)
+            block = blocks.pop() if blocks else None
+            if block is not None:
+                self._idle_size -= bucket
+        if block is None:
+            block = mmap.mmap(-1, bucket)
+        buffer = (ctype * size).from_buffer(block)
+        key = ctypes.addressof(buffer)
+        with self._lock:
+            self._in_use[key] = (weakref.ref(buffer, lambda ref: self._forget(key, ref)), block)
+        return buffer
+
+    def _forget(self, key: int, ref):
+        #a recycled map gets the same address, only drop the entry if it still belongs to the dead buffer
+        with self._lock:
+            entry = self._in_use.get(key, None)
+            if entry is not None and entry[0] is ref:
+                del self._in_use[key]
+
+    def _entry(self, buffer: ctypes.Array):
+        entry = self._in_use.get(ctypes.addressof(buffer), None)
+        return entry if entry is not None and entry[0]() is buffer else None
+
+    def release(self, buffer: ctypes.Array):
+        with self._lock:
+            entry = self._entry(buffer)
+            if entry is None:
+                return
+            del self._in_use[ctypes.addressof(buffer)]
+            block = entry[1]
+            if self._idle_size + len(block) > self.max_idle:
+                return
+            self._idle.setdefault(len(block), []).append(block)
+            self._idle_size += len(block)
+
+    @contextmanager
+    def buffer(self, size: int, ctype=ctypes.c_ubyte):
+        buffer = self.acquire(size, ctype)
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
+
+    def source(self, buffer: ctypes.Array):
+        """
+        The map behind a buffer from acquire(), or None for any other buffer. The map supports find() and slicing, so
+        it can be searched without copying the buffer to bytes first. Only the first sizeof(buffer) bytes belong to it.
+        """
+        entry = self._entry(buffer)
+        return entry[1] if entry is not None else None
+
+    def trim(self):
+        with self._lock:
+            self._idle = {}
+            self._idle_size = 0
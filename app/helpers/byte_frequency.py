@@ -0,0 +1,91 @@
+import math
+
+from mem_edit import Process
+
+from app.helpers.buffer_pool import BufferPool
+from app.helpers.exceptions import AOBException
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ByteFrequency:
+    """
+    Byte histogram of a process, used to anchor AOB searches on their rarest run of fixed bytes.
+
+    Every byte gets a cost, the information it carries in the sampled memory. The anchor of an AOB is the run of fixed
+    bytes with the highest total cost, the run least likely to show up by chance and so the one with the fewest false
+    candidates to verify.
+    """
+    sample_size = 65536
+    max_samples = 256
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts is not None else self._default_counts()
+        total = sum(self.counts) + 256
+        self.cost = [-math.log((c + 1) / total) for c in self.counts]
+
+    @staticmethod
+    def _default_counts():
+        #used until memory was sampled, zero and the small integers dominate most data
+        counts = [16] * 256
+        counts[0x00] = 2048
+        counts[0xFF] = 256
+        counts[0x01] = 128
+        return counts
+
+    @classmethod
+    def sample(cls, memory: Process, regions):
+        """
+        Count the bytes of up to max_samples evenly spread blocks of the regions.
+        """
+        regions = [(start, stop) for start, stop in regions if stop - start >= cls.sample_size]
+        step = max(1, sum(stop - start for start, stop in regions) // (cls.max_samples * cls.sample_size))
+        counts = np.zeros(256, dtype=np.int64) if np is not None else [0] * 256
+        index = 0
+        with BufferPool.shared().buffer(cls.sample_size) as buffer:
+            for start, stop in regions:
+                for pos in range(start, stop - cls.sample_size + 1, cls.sample_size):
+                    index += 1
+                    if index % step != 0:
+                        continue
+                    try:
+                        memory.read_memory(pos, buffer)
+                    except OSError:
+                        break
+                    if np is not None:
+                        counts += np.bincount(np.frombuffer(buffer, dtype=np.uint8), minlength=256)
+                    else:
+                        data = bytes(buffer)
+                        for b in range(0, 256):
+                            counts[b] += data.count(b)
+        counts = [int(x) for x in counts]
+        return cls(counts) if sum(counts) > 0 else cls()
+
+    def run_cost(self, data):
+        return sum(self.cost[b] for b in data)
+
+    def best_anchor(self, aob_bytes):
+        """
+        (offset, length) of the rarest run of fixed bytes, aob_bytes uses 256 for a wildcard. Raises AOBException if
+        every byte is a wildcard, there is nothing to anchor on.
+        """
+        best = None
+        best_cost = -1
+        pos = 0
+        while pos < len(aob_bytes):
+            if aob_bytes[pos] >= 256:
+                pos += 1
+                continue
+            end = pos
+            while end < len(aob_bytes) and aob_bytes[end] < 256:
+                end += 1
+            cost = self.run_cost(aob_bytes[pos:end])
+            if cost > best_cost:
+                best, best_cost = (pos, end - pos), cost
+            pos = end
+        if best is None:
+            raise AOBException('Invalid AOB, it has no fixed bytes')
+        return best
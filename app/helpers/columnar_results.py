@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+
+from app.helpers.directory_utils import memory_directory
+from app.helpers.search_results import SearchResults
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class DeltaAddresses:
+    """
+    Sorted addresses stored as LEB128 varint deltas.
+
+    Every block of BLOCK addresses starts over from a base address kept in a skip index with the byte offset of the
+    block, so any range can be decoded without touching the blocks before it.
+    """
+    BLOCK = 128
+
+    def __init__(self, stream, bases, offsets, count: int):
+        self.stream = stream
+        self.bases = bases
+        self.offsets = offsets
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.stream.nbytes + self.bases.nbytes + self.offsets.nbytes
+
+    @classmethod
+    def encode(cls, addresses):
+        count = len(addresses)
+        if count == 0:
+            return cls(np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64), 0)
+        addresses = np.asarray(addresses, dtype=np.uint64)
+        deltas = np.empty(count, dtype=np.uint64)
+        deltas[0] = 0
+        np.subtract(addresses[1:], addresses[:-1], out=deltas[1:])
+        deltas[::cls.BLOCK] = 0
+        lengths = np.ones(count, dtype=np.int64)
+        for shift in range(7, 64, 7):
+            lengths += (deltas >> np.uint64(shift)) != 0
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        stream = np.zeros(int(ends[-1]), dtype=np.uint8)
+        for byte in range(0, int(lengths.max())):
+            rows = np.flatnonzero(lengths > byte)
+            part = ((deltas[rows] >> np.uint64(7 * byte)) & np.uint64(0x7f)).astype(np.uint8)
+            part[lengths[rows] > byte + 1] |= 0x80
+            stream[starts[rows] + byte] = part
+        return cls(stream, addresses[::cls.BLOCK].copy(), starts[::cls.BLOCK].astype(np.uint64), count)
+
+    def _decode_blocks(self, first: int, last: int):
+        stream_start = int(self.offsets[first])
+        stream_stop = int(self.offsets[last]) if last < len(self.offsets) else len(self.stream)
+        data = np.asarray(self.stream[stream_start:stream_stop])
+        ends = np.flatnonzero((data & 0x80) == 0)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+        deltas = np.add.reduceat((data & 0x7f).astype(np.uint64) << shifts.astype(np.uint64), starts)
+        #deltas restart at every block, so subtract the running sum at each block start and add the block base
+        sums = np.cumsum(deltas)
+        block_starts = np.arange(0, len(deltas), self.BLOCK)
+        sizes = np.diff(np.append(block_starts, len(deltas)))
+        return np.repeat(self.bases[first:last], sizes) + sums - np.repeat(sums[block_starts], sizes)
+
+    def slice(self, start: int, stop: int):
+        stop = min(stop, self.count)
+        if start >= stop:
+            return np.zeros(0, dtype=np.uint64)
+        first = start // self.BLOCK
+        last = (stop - 1) // self.BLOCK + 1
+        decoded = self._decode_blocks(first, last)
+        return decoded[start - first * self.BLOCK:stop - first * self.BLOCK]
+
+    def decode(self):
+        return self.slice(0, self.count)
+
+
+class ResultCursor:
+    """
+    Cursor over the finished columns of a result table that behaves like the sqlite3 cursor returned by SearchResults.
+    """
+    def __init__(self, columns: tuple = None, _offset=0, _count=-1):
+        self.addresses, self.values = columns if columns is not None else (None, None)
+        length = len(self.addresses) if self.addresses is not None else 0
+        stop = length if _count < 0 else min(length, _offset + _count)
+        self.pos = min(_offset, stop)
+        self.stop = stop
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(10000)
+            if not rows:
+                return
+            yield from rows
+
+    def fetchmany(self, size=1):
+        start = self.pos
+        self.pos = min(self.stop, self.pos + size)
+        if start >= self.pos:
+            return []
+        data = self.values[start:self.pos].tobytes()
+        width = self.values.shape[1]
+        return list(zip(self.addresses.slice(start, self.pos).tolist(), [data[i:i+width] for i in range(0, len(data), width)]))
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchall(self):
+        return self.fetchmany(self.stop - self.pos)
+
+
+class ResultTable:
+    """
+    Two parallel columns, sorted addresses and fixed width values.
+
+    Rows are collected in memory and spilled to raw files once they grow past spill_size. When the table is finished the
+    rows are sorted, the addresses are delta encoded and spilled columns are memory mapped from their files.
+    """
+    chunk_rows = 1000000
+
+    def __init__(self, path, spill_size: int):
+        self.path = path
+        self.spill_size = spill_size
+        self.width = 0
+        self.addresses: DeltaAddresses = None
+        self.values = None
+        self._pending_addresses = []
+        self._pending_values = bytearray()
+        self._chunks = []
+        self._chunk_size = 0
+        self._spilled = 0
+        #a continue round adds rows while the UI reads the table, finishing and adding must not interleave
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        if self.addresses is not None:
+            return len(self.addresses)
+        return len(self._pending_addresses) + sum(len(x[0]) for x in self._chunks) + self._spilled
+
+    def _address_path(self):
+        return self.path.with_suffix('.addr')
+
+    def _value_path(self):
+        return self.path.with_suffix('.val')
+
+    def _reopen(self):
+        #more rows after the table was finished, go back to plain columns
+        if self.addresses is None:
+            return
+        addresses = self.addresses.decode()
+        if self._spilled:
+            self._write_file(addresses, self._address_path())
+        else:
+            self._chunks = [(addresses, np.asarray(self.values))]
+            self._chunk_size = addresses.nbytes + self.values.nbytes
+        self.addresses = None
+        self.values = None
+
+    def add_rows(self, rows: list):
+        if not rows:
+            return
+        with self._lock:
+            self._reopen()
+            if self.width == 0:
+                self.width = len(rows[0][1])
+            for address, value in rows:
+                self._pending_addresses.append(address)
+                self._pending_values += value
+            if len(self._pending_addresses) >= self.chunk_rows:
+                self._flush_pending()
+
+    def add_arrays(self, addresses, values):
+        if len(addresses) == 0:
+            return
+        with self._lock:
+            self._reopen()
+            if self.width == 0:
+                self.width = values.shape[1]
+            self._flush_pending()
+            self._add_chunk(np.ascontiguousarray(addresses, dtype=np.uint64), np.ascontiguousarray(values, dtype=np.uint8))
+
+    def _flush_pending(self):
+        if not self._pending_addresses:
+            return
+        addresses = np.array(self._pending_addresses, dtype=np.uint64)
+        values = np.frombuffer(bytes(self._pending_values), dtype=np.uint8).reshape(-1, self.width)
+        self._pending_addresses = []
+        self._pending_values = bytearray()
+        self._add_chunk(addresses, values)
+
+    def _add_chunk(self, addresses, values):
+        self._chunks.append((addresses, values))
+        self._chunk_size += addresses.nbytes + values.nbytes
+        if self._spilled or self._chunk_size >= self.spill_size:
+            self._spill()
+
+    def _spill(self):
+        with open(self._address_path(), 'ab') as addr_file, open(self._value_path(), 'ab') as value_file:
+            for addresses, values in self._chunks:
+                addresses.tofile(addr_file)
+                values.tofile(value_file)
+                self._spilled += len(addresses)
+        self._chunks = []
+        self._chunk_size = 0
+
+    def _map_values(self):
+        return np.memmap(self._value_path(), dtype=np.uint8, mode='r', shape=(self._spilled, self.width))
+
+    def finish(self):
+        with self._lock:
+            self._finish()
+
+    def columns(self):
+        """
+        Finish the table and return its (addresses, values) columns. They stay valid when rows are added afterwards,
+        the table then builds new columns instead of changing these.
+        """
+        with self._lock:
+            self._finish()
+            return self.addresses, self.values
+
+    def _finish(self):
+        if self.addresses is not None:
+            return
+        self._flush_pending()
+        if self._spilled:
+            self._spill()
+            addresses = np.fromfile(self._address_path(), dtype=np.uint64)
+            values = self._map_values()
+        elif self._chunks:
+            addresses = np.concatenate([x[0] for x in self._chunks])
+            values = np.concatenate([x[1] for x in self._chunks])
+        else:
+            addresses = np.zeros(0, dtype=np.uint64)
+            values = np.zeros((0, max(1, self.width)), dtype=np.uint8)
+        if len(addresses) > 1 and np.any(addresses[1:] < addresses[:-1]):
+            order = np.argsort(addresses, kind='stable')
+            addresses = addresses[order]
+            values = values[order]
+            if self._spilled:
+                self._write_file(values, self._value_path())
+                values = self._map_values()
+        self.addresses = DeltaAddresses.encode(addresses)
+        if self._spilled:
+            self._write_file(self.addresses.stream, self._address_path())
+            self.addresses.stream = np.memmap(self._address_path(), dtype=np.uint8, mode='r') if len(self.addresses.stream) > 0 else self.addresses.stream
+        self._chunks = []
+        self._chunk_size = 0
+        self.values = values
+
+    @staticmethod
+    def _write_file(data, path):
+        tmp = path.with_name(path.name + '.tmp')
+        data.tofile(str(tmp))
+        os.replace(tmp, path)
+
+    def delete(self):
+        self.addresses = None
+        self.values = None
+        self._chunks = []
+        self._pending_addresses = []
+        self._pending_values = bytearray()
+        self._address_path().unlink(missing_ok=True)
+        self._value_path().unlink(missing_ok=True)
+
+
+class ColumnarResults(SearchResults):
+    """
+    Result store that keeps every round as a sorted address column and a value column instead of SQLite rows.
+
+    It keeps the SearchResults interface. db() yields the store itself so callers passing a connection around keep working.
+    """
+    spill_size = 256000000
+
+    def __init__(self, name='results', store_size=4, db_path=memory_directory.joinpath('results.db'), append=False):
+        super().__init__(name, store_size, db_path, append)
+        self.tables = {}
+
+    def __getstate__(self):
+        #worker processes never read results, do not pickle the columns along with the searcher
+        state = self.__dict__.copy()
+        state['tables'] = {}
+        return state
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    @contextmanager
+    def db(self):
+        yield self
+
+    def _table(self, name=None, create=False):
+        name = name if name else self.table_stack[-1]
+        if name not in self.tables and create:
+            self.tables[name] = ResultTable(self.db_path.with_name('{}_{}'.format(self.db_path.stem, name)), self.spill_size)
+        return self.tables.get(name, None)
+
+    def _finished_columns(self, name=None):
+        table = self._table(name)
+        if table is None:
+            return None
+        return table.columns()
+
+    def get_number_of_results(self, connection, index):
+        try:
+            table = self.tables.get(self.table_stack[index], None)
+        except IndexError:
+            return 0
+        return len(table) if table is not None else 0
+
+    def get_results(self, connection, _offset=0, _count=-1, table_name=None):
+        return ResultCursor(self._finished_columns(table_name), _offset, _count)
+
+    def get_results_unordered(self, connection, index=-1):
+        return self.get_results(connection, table_name=self.table_stack[index])
+
+    def get_result_arrays(self, connection, table_name=None):
+        columns = self._finished_columns(table_name)
+        if columns is None:
+            return np.zeros(0, dtype=np.uint64), None
+        return columns[0].decode(), columns[1]
+
+    def delete_database(self):
+        for table in self.tables.values():
+            table.delete()
+        self.tables = {}
+        self.table_stack = [self.table]
+        self.table_count = 1
+
+    def clear_results(self, connection):
+        for tbl in self.table_stack:
+            table = self.tables.pop(tbl, None)
+            if table is not None:
+                table.delete()
+
+    def create_result_table(self, connection):
+        self._table(create=True)
+
+    def create_address_index(self, connection):
+        table = self._table()
+        if table is not None:
+            table.finish()
+
+    def revert_result_table(self, connection):
+        if len(self.table_stack) == 1:
+            return
+        nm = self.table_stack.pop()
+        table = self.tables.pop(nm, None)
+        if table is not None:
+            table.delete()
+        self.table_count -= 1
+
+    def add_results(self, connection, result_list: list):
+        self._table(create=True).add_rows(result_list)
+
+    def add_result_arrays(self, connection, addresses, values):
+        self._table(create=True).add_arrays(addresses, values)
+
+    def get_store_size(self, connection):
+        return self._table(self.table_stack[0]).width
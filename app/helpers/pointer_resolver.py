@@ -0,0 +1,63 @@
+import ctypes
+
+from mem_edit import Process
+
+from app.helpers.scatter_read import read_spans
+
+ADDRESS_END = 1 << 64
+
+
+def _valid_address(address):
+    #an address outside of the 64 bit range would wrap in the iovec and read some other pointer
+    return address if address is not None and 0 <= address < ADDRESS_END else None
+
+
+class PointerResolver:
+    """
+    Resolves many pointer chains at once, one batched read per depth.
+
+    The chains are walked as a trie, chains sharing a base and their first offsets share the node of that prefix, so the
+    pointer of an intermediate node is read once no matter how many chains go through it. All the pointers of one depth
+    are read with a single read_spans call, process_vm_readv on Linux, instead of one read_memory per hop per chain.
+    Like the single chain readers every hop reads the 8 byte pointer and adds the offset to it.
+    """
+
+    def __init__(self, memory: Process):
+        self.memory = memory
+
+    def read_values(self, addresses):
+        """
+        The 8 byte values at the addresses as a dict, unreadable addresses and addresses outside of the 64 bit range
+        are left out.
+        """
+        addresses = sorted({x for x in addresses if _valid_address(x) is not None})
+        if not addresses:
+            return {}
+        buffer = (ctypes.c_uint64 * len(addresses))()
+        readable = read_spans(self.memory, buffer, [(address, i * 8, 8) for i, address in enumerate(addresses)])
+        return {address: buffer[i] for i, (address, ok) in enumerate(zip(addresses, readable)) if ok}
+
+    def resolve(self, chains):
+        """
+        Resolve (base address, offsets) chains. Returns the final address of each chain, or None if a pointer along the
+        chain could not be read or an address along it is outside of the 64 bit range.
+        """
+        chains = [(base, tuple(offsets)) for base, offsets in chains]
+        #the address of every trie node, keyed by (base, offsets up to the node)
+        nodes = {(base,): _valid_address(base) for base, _ in chains}
+        depth = max([len(offsets) for _, offsets in chains], default=0)
+        for level in range(depth):
+            children = {}
+            for base, offsets in chains:
+                if len(offsets) > level:
+                    prefix = (base,) + offsets[:level]
+                    if nodes.get(prefix, None) is not None:
+                        children[prefix + (offsets[level],)] = prefix
+            values = self.read_values([nodes[x] for x in set(children.values())])
+            for child, parent in children.items():
+                value = values.get(nodes[parent], None)
+                nodes[child] = _valid_address(value + child[-1]) if value is not None else None
+        return [nodes.get((base,) + offsets, None) for base, offsets in chains]
+
+    def resolve_one(self, base: int, offsets):
+        return self.resolve([(base, offsets)])[0]
@@ -0,0 +1,119 @@
+import ctypes
+import queue
+import threading
+
+from mem_edit import Process
+
+from app.helpers.buffer_pool import BufferPool
+
+
+class PrefetchReader:
+    """
+    Reads the chunks of a list of regions on a background thread so the next reads overlap the compare of the current one.
+
+    The reader fills buffers from the shared BufferPool and hands them over through a bounded queue, at most depth
+    chunks are read ahead. A buffer goes back to the pool when the consumer asks for the next chunk, so a chunk must not
+    be used after that. Like the sequential scan, a read error skips the rest of its region.
+    """
+    _done = object()
+
+    def __init__(self, memory: Process, regions, chunk_size: int, ctype=ctypes.c_ubyte, depth: int = 2, pool: BufferPool = None):
+        self.memory = memory
+        self.regions = [(start, stop) for start, stop in regions if stop > start]
+        self.chunk_size = chunk_size
+        self.ctype = ctype
+        self.pool = pool if pool is not None else BufferPool.shared()
+        self._slots = threading.Semaphore(depth + 1)
+        self._ready = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = None
+        self._current = None
+        self._error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._release()
+        if self._thread is not None:
+            #unblock a reader waiting on a full queue
+            while self._thread.is_alive():
+                try:
+                    self._discard(self._ready.get(timeout=0.1))
+                except queue.Empty:
+                    pass
+            self._thread = None
+        while not self._ready.empty():
+            self._discard(self._ready.get())
+
+    def __iter__(self):
+        self.start()
+        while True:
+            self._release()
+            item = self._ready.get()
+            if item is self._done:
+                if self._error is not None:
+                    raise self._error
+                return
+            start, self._current = item
+            yield start, self._current
+
+    def _release(self):
+        if self._current is not None:
+            self._discard((0, self._current))
+            self._current = None
+
+    def _discard(self, item):
+        if item is not self._done:
+            self.pool.release(item[1])
+            self._slots.release()
+
+    def _take(self, size: int):
+        while not self._stop.is_set():
+            if self._slots.acquire(timeout=0.1):
+                return self.pool.acquire(size, self.ctype)
+        return None
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            for start, stop in self.regions:
+                pos = start
+                while pos < stop:
+                    size = min(stop - pos, self.chunk_size)
+                    buffer = self._take(size)
+                    if buffer is None:
+                        return
+                    try:
+                        self.memory.read_memory(pos, buffer)
+                    except OSError:
+                        self._discard((pos, buffer))
+                        break
+                    except Exception:
+                        self._discard((pos, buffer))
+                        raise
+                    if not self._put((pos, buffer)):
+                        self._discard((pos, buffer))
+                        return
+                    pos += size
+        except Exception as e:
+            self._error = e
+        self._put(self._done)
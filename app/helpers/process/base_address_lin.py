@@ -3,6 +3,8 @@ import fnmatch
 import mem_edit
 import psutil
 
+from .process_map import ProcessMap
+
 
 def get_process_map(process: mem_edit.Process, writeable_only=True, include_paths=[]):
     regions = []
@@ -57,47 +59,26 @@ def get_process_map(process: mem_edit.Process, writeable_only=True, include_path
             regions.append(item_map)
     return regions
 
+def _maps_signature(process: mem_edit.Process):
+    #the raw maps file, comparing it is much cheaper than parsing it again
+    with open('/proc/{}/maps'.format(process.pid), 'rb') as maps:
+        return maps.read()
+
+def get_cached_process_map(process: mem_edit.Process) -> ProcessMap:
+    return ProcessMap.shared(process, get_process_map, _maps_signature, '/')
+
 def get_base_address(process: mem_edit.Process):
-    pm = sorted(get_process_map(process, writeable_only=False), key=lambda x: x['start'])
-    proc = psutil.Process(process.pid)
-    exe = proc.exe()
-    for p in pm:
+    exe = psutil.Process(process.pid).exe()
+    for p in get_cached_process_map(process).get_regions(writeable_only=False):
         if p['pathname'] == exe:
             return p['start']
     return -1
 
 def get_address_base(process: mem_edit.Process, address: int):
-    pm = sorted(get_process_map(process, writeable_only=False), key=lambda x: x['start'])
-    for p in pm:
-        if p['start'] <= address <= p['stop']:
-            return p
-    return None
+    return get_cached_process_map(process).find(address)
 
 def get_address_path(process: mem_edit.Process, address: int):
-    pm = sorted(get_process_map(process, writeable_only=False), key=lambda x: x['start'])
-    for p in pm:
-        if p['start'] <= address <= p['stop']:
-            if '/' not in p['pathname']:
-                return None
-            offset = address - p['start']
-            stem = p['pathname'].split('/')[-1]
-            index = p['map_index']
-            return '{}:{}+{:X}'.format(stem, index, offset)
-    return None
+    return get_cached_process_map(process).get_address_path(address)
 
 def get_path_address(process: mem_edit.Process, path: str):
-    pm = sorted(get_process_map(process, writeable_only=False), key=lambda x: x['start'])
-    if ':' in path:
-        path = path.strip()
-        pn = path.split(':')[0]
-        index = path.split(':')[1].split('+')[0]
-        offset = path.split(':')[1].split('+')[1]
-        for proc in pm:
-            if proc['pathname'].endswith(pn) and proc['map_index'] == int(index):
-                res = proc['start'] + int(offset, 16)
-                return res
-        return None
-    else:
-        return int(path, 16)
-
-
+    return get_cached_process_map(process).get_path_address(path)
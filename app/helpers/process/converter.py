@@ -3,7 +3,7 @@ import re
 import mem_edit
 
 from app.helpers.memory_hack_exception import MemoryHackException
-from app.helpers.process import get_process_map
+from app.helpers.process import get_cached_process_map
 
 
 class BaseConvertException(MemoryHackException):
@@ -13,8 +13,16 @@ class BaseConvert:
     def __init__(self):
         self.base_lookup_map = {}
         self.process_map = None
+        self.map_version = 0
 
     def convert(self, mem: mem_edit.Process, addr: str, include_paths = []):
+        if ':' in addr:
+            #resolved bases are only valid for the map they were looked up in
+            self.process_map = get_cached_process_map(mem)
+            self.process_map.refresh()
+            if self.process_map.version != self.map_version:
+                self.base_lookup_map = {x: y for x, y in self.base_lookup_map.items() if ':' not in x}
+                self.map_version = self.process_map.version
         if addr in self.base_lookup_map:
             return self.base_lookup_map[addr]
         if ':' not in addr:
@@ -27,9 +35,8 @@ class BaseConvert:
             self.base_lookup_map[addr] = self.base_lookup_map[base_lk] + int(base_data[2], 16)
             return self.base_lookup_map[addr]
 
-        if self.process_map is None:
-            self.process_map = get_process_map(mem, writeable_only=False, include_paths=include_paths)
-        match = [x for x in self.process_map if x['pathname'].endswith(base_data[0]) and x['map_index'] == int(base_data[1])]
+        regions = self.process_map.get_regions(writeable_only=False, include_paths=include_paths)
+        match = [x for x in regions if x['pathname'].endswith(base_data[0]) and x['map_index'] == int(base_data[1])]
         if len(match) == 0:
             raise BaseConvertException("Could not find base of {}".format(addr))
         self.base_lookup_map[base_lk] = match[0]['start']
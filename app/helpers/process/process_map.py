@@ -0,0 +1,113 @@
+import bisect
+import threading
+import time
+
+
+class ProcessMap:
+    """
+    Cached memory map of an attached process, shared by every service working on the same pid.
+
+    The full map is loaded once and kept sorted by start address, so finding the region of an address is a bisect
+    instead of parsing and sorting the map again. Filtered views for writeable_only and include_paths are built from it
+    on demand. The map is checked again at most every max_age seconds and only reloaded when the platform signature,
+    the raw maps file on Linux, changed. Without a signature it is reloaded every max_age seconds.
+    """
+    max_age = 0.5
+    _lock = threading.Lock()
+    _shared = {}
+
+    def __init__(self, process, loader: callable, signature: callable = None, separator: str = '/'):
+        self.process = process
+        self.loader = loader
+        self.signature = signature
+        self.separator = separator
+        self.version = 0
+        self._signature = None
+        self._checked = None
+        self._views = {}
+        self._refresh_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, process, loader: callable, signature: callable = None, separator: str = '/'):
+        with cls._lock:
+            process_map = cls._shared.get(process.pid, None)
+            if process_map is None:
+                process_map = cls._shared[process.pid] = ProcessMap(process, loader, signature, separator)
+            elif process_map.process is not process:
+                #reload through the caller's handle, the one stored first may have been closed since
+                process_map.process = process
+            return process_map
+
+    @classmethod
+    def discard(cls, pid: int):
+        with cls._lock:
+            cls._shared.pop(pid, None)
+
+    def refresh(self, force=False):
+        """
+        Reload the map if it is older than max_age and changed. Returns True if it was reloaded.
+        """
+        if not force and self._checked is not None and time.monotonic() - self._checked < self.max_age:
+            return False
+        with self._refresh_lock:
+            signature = self.signature(self.process) if self.signature else None
+            self._checked = time.monotonic()
+            if not force and self.version > 0 and signature is not None and signature == self._signature:
+                return False
+            regions = sorted(self.loader(self.process, writeable_only=False), key=lambda x: x['start'])
+            self._signature = signature
+            self._views = {(False, ()): (regions, [x['start'] for x in regions])}
+            self.version += 1
+            return True
+
+    def _view(self, writeable_only: bool, include_paths):
+        self.refresh()
+        views = self._views
+        key = (writeable_only, tuple(include_paths) if include_paths else ())
+        view = views.get(key, None)
+        if view is None:
+            regions = [x for x in views[(False, ())][0] if (not writeable_only or 'w' in x['privileges']) and (not include_paths or x['pathname'] in include_paths)]
+            view = views[key] = (regions, [x['start'] for x in regions])
+        return view
+
+    def get_regions(self, writeable_only=True, include_paths=()):
+        """
+        The region dicts of the map sorted by start, filtered like get_process_map.
+        """
+        return self._view(writeable_only, include_paths)[0]
+
+    def find(self, address: int, writeable_only=False, include_paths=()):
+        """
+        The region holding address, or None.
+        """
+        regions, starts = self._view(writeable_only, include_paths)
+        index = bisect.bisect_right(starts, address) - 1
+        if index >= 0 and regions[index]['start'] <= address <= regions[index]['stop']:
+            return regions[index]
+        return None
+
+    def get_address_path(self, address: int):
+        region = self.find(address)
+        if region is None or self.separator not in region['pathname']:
+            return None
+        stem = region['pathname'].split(self.separator)[-1]
+        return '{}:{}+{:X}'.format(stem, region['map_index'], address - region['start'])
+
+    def get_path_base(self, name: str, index: int):
+        """
+        The region of the index-th mapping of a file ending with name, or None.
+        """
+        for region in self.get_regions(writeable_only=False):
+            if region['pathname'].endswith(name) and region['map_index'] == index:
+                return region
+        return None
+
+    def get_path_address(self, path: str):
+        if ':' not in path:
+            return int(path, 16)
+        path = path.strip()
+        name = path.split(':')[0]
+        index = path.split(':')[1].split('+')[0]
+        offset = path.split(':')[1].split('+')[1]
+        region = self.get_path_base(name, int(index))
+        return region['start'] + int(offset, 16) if region is not None else None
@@ -0,0 +1,103 @@
+import ctypes
+import ctypes.util
+import errno
+import platform
+
+from mem_edit import Process
+
+IOV_MAX = 1024
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+_process_vm_readv = None
+if platform.system() == 'Linux':
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _process_vm_readv = _libc.process_vm_readv
+        _process_vm_readv.argtypes = [ctypes.c_int, ctypes.POINTER(_IOVec), ctypes.c_ulong, ctypes.POINTER(_IOVec), ctypes.c_ulong, ctypes.c_ulong]
+        _process_vm_readv.restype = ctypes.c_ssize_t
+    except (AttributeError, OSError):
+        _process_vm_readv = None
+
+
+def coalesce_pages(pages: list, page_size: int):
+    """
+    Turn sorted page addresses into (address, buffer offset, size) spans, merging runs of neighbouring pages.
+    The pages are laid out one after the other in the destination buffer.
+    """
+    spans = []
+    for i, page in enumerate(pages):
+        if spans and spans[-1][0] + spans[-1][2] == page:
+            spans[-1][2] += page_size
+        else:
+            spans.append([page, i * page_size, page_size])
+    return spans
+
+
+def _read_single(memory: Process, buffer: ctypes.Array, span):
+    address, offset, size = span
+    try:
+        memory.read_memory(address, (ctypes.c_ubyte * size).from_buffer(buffer, offset))
+        return True
+    except Exception:
+        return False
+
+
+def _read_vectored(pid: int, buffer: ctypes.Array, spans: list):
+    #returns how many spans were read completely, or -1 if the call itself is not usable
+    base = ctypes.addressof(buffer)
+    local = (_IOVec * len(spans))(*[_IOVec(base + offset, size) for _, offset, size in spans])
+    remote = (_IOVec * len(spans))(*[_IOVec(address, size) for address, _, size in spans])
+    read = _process_vm_readv(pid, local, len(spans), remote, len(spans), 0)
+    if read < 0:
+        return 0 if ctypes.get_errno() == errno.EFAULT else -1 #EFAULT means the first span is not readable
+    done = 0
+    for _, _, size in spans:
+        if read < size:
+            break
+        read -= size
+        done += 1
+    return done
+
+
+def read_spans(memory: Process, buffer: ctypes.Array, spans: list):
+    """
+    Read many (address, buffer offset, size) spans of another process into one buffer.
+
+    On Linux the spans are batched into process_vm_readv calls of up to IOV_MAX iovecs, elsewhere every span is read on
+    its own. Returns a list with a readable flag for each span.
+    """
+    readable = [False] * len(spans)
+    pid = getattr(memory, 'pid', None)
+    pos = 0
+    while _process_vm_readv is not None and isinstance(pid, int) and pos < len(spans):
+        done = _read_vectored(pid, buffer, spans[pos:pos+IOV_MAX])
+        if done < 0:
+            break
+        for i in range(pos, pos + done):
+            readable[i] = True
+        pos += done
+        if pos < len(spans) and done < IOV_MAX:
+            pos += 1 #this span has an unreadable page, skip it
+    for i in range(pos, len(spans)):
+        readable[i] = _read_single(memory, buffer, spans[i])
+    return readable
+
+
+def read_pages(memory: Process, buffer: ctypes.Array, pages: list, page_size: int = 4096):
+    """
+    Read sorted pages into consecutive page_size slots of buffer, returns a readable flag for each page.
+    """
+    spans = coalesce_pages(pages, page_size)
+    readable = read_spans(memory, buffer, spans)
+    flags = []
+    for (address, offset, size), ok in zip(spans, readable):
+        if ok:
+            flags.extend([True] * (size // page_size))
+        else:
+            #part of the span may still be readable, go page by page
+            flags.extend([_read_single(memory, buffer, (address + i, offset + i, page_size)) for i in range(0, size, page_size)])
+    return flags
@@ -1,7 +1,11 @@
+import ctypes
 import time
 from threading import Lock
 
+from mem_edit import Process
+
 from app.helpers.aob_value import AOBValue
+from app.helpers.scatter_read import read_spans
 
 
 class AOB:
@@ -62,4 +66,28 @@ class AOB:
         self.base_lock.release()
 
 
+def verify_bases(memory: Process, aobs) -> dict:
+    """
+    Check the known bases of many AOBs with one batched read. Returns the bases that still match keyed by the AOB.
+    """
+    spans = []
+    owners = []
+    size = 0
+    for aob in aobs:
+        length = aob.aob.aob_item['size']
+        for base in aob.get_bases():
+            spans.append((base, size, length))
+            owners.append(aob)
+            size += length
+    result = {aob: [] for aob in aobs}
+    if not spans:
+        return result
+    buffer = (ctypes.c_ubyte * size)()
+    data = memoryview(buffer).cast('B')
+    for (base, offset, length), aob, readable in zip(spans, owners, read_spans(memory, buffer, spans)):
+        if readable and aob.aob.get_pattern().match(data, offset):
+            result[aob].append(base)
+    return result
+
+
 
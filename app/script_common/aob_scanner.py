@@ -1,6 +1,8 @@
 from threading import Thread, Event, Lock
 from time import time
 
+from app.helpers.aob_matcher import AOBMatcher
+from app.helpers.exceptions import BreakException
 from app.script_common.aob import AOB
 from app.script_common.memory import MemoryManager
 
@@ -55,17 +57,24 @@ class AOBScanner:
         while not self.wait_event.is_set():
             current_time = time()
             if self.aob_map:
-                for aob in self.aob_map.values():
-                    if len(aob.get_bases()) == 0 or (self.auto_refresh_time > 0 and (current_time - self.time_map.get(aob.get_name(), 0) > self.auto_refresh_time)):
-                        self.search_lock.acquire()
-                        self.searcher.search_memory_value(aob.get_aob_string())
-                        results = [x['address'] for x in self.searcher.get_results(limit=100)]
+                due = [aob for aob in self.aob_map.values() if len(aob.get_bases()) == 0 or (self.auto_refresh_time > 0 and (current_time - self.time_map.get(aob.get_name(), 0) > self.auto_refresh_time))]
+                found = {}
+                if due:
+                    #every due AOB is matched in the same pass over memory
+                    self.search_lock.acquire()
+                    try:
+                        found = AOBMatcher([aob.aob for aob in due]).search_memory(self.searcher.memory, self.searcher.get_regions(), limit=100, check_cancel=self.searcher.check_cancel)
+                    except BreakException:
+                        found = {}
+                    finally:
                         self.search_lock.release()
-                        if len(results) > 0:
-                            aob.lock()
-                            aob.set_bases(results)
-                            self.time_map[aob.get_name()] = current_time
-                            aob.unlock()
+                for aob in due:
+                    results = found.get(aob.aob.get_string(), [])
+                    if len(results) > 0:
+                        aob.lock()
+                        aob.set_bases(results)
+                        self.time_map[aob.get_name()] = current_time
+                        aob.unlock()
             self.wait_event.wait(2.0)
 
 
@@ -6,9 +6,10 @@ from typing import Union
 import mem_edit
 
 from app.helpers.exceptions import ScriptException
-from app.helpers.process import get_process_map
+from app.helpers.pointer_resolver import PointerResolver
+from app.helpers.process import get_cached_process_map
 from app.helpers.search_results import SearchResults
-from app.script_common.aob import AOB
+from app.script_common.aob import AOB, verify_bases
 from app.search.searcher_multi import SearcherMulti
 
 ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, ctypes.Union]
@@ -23,11 +24,9 @@ class MemoryManager:
         self.memory = memory
         self.directory = directory
         self.write_only: bool = True
-        self.regions = []
-        if memory is None:
-            self.process_map = {}
-        else:
-            self.process_map = get_process_map(memory, include_paths=include_paths)
+        self.regions = list(include_paths)
+        self.map_version = 0
+        self.process_map = get_cached_process_map(memory) if memory is not None else None
         self.searcher_map: {str, SearcherMulti} = {}
 
     def get_searcher(self, name:str = '_default') -> SearcherMulti:
@@ -39,15 +38,20 @@ class MemoryManager:
         return self.searcher_map[name]
 
     def get_process_map(self):
-        return self.process_map
+        if self.process_map is None:
+            return []
+        return self.process_map.get_regions(self.write_only, self.regions)
 
     def get_address(self, addr: str):
+        pm = self.get_process_map()
+        if self.process_map is not None and self.process_map.version != self.map_version:
+            self.path_cache.clear() #the map changed, resolve the paths again
+            self.map_version = self.process_map.version
         if addr in self.path_cache:
             return self.path_cache[addr]
-        pm = self.process_map
         if ':' in addr:
+            matcher = re.match(self.re_fn, addr.strip(), re.IGNORECASE)
             for process in pm:
-                matcher = re.match(self.re_fn, addr.strip(), re.IGNORECASE)
                 if process['pathname'].endswith(matcher.group(1)) and process['map_index'] == int(matcher.group(2)):
                     res = process['start'] + int(matcher.group(3), 16)
                     self.path_cache[addr] = res
@@ -61,43 +65,43 @@ class MemoryManager:
         if not cv_addr:
             return None
 
-        pm = sorted(self.get_process_map(), key=lambda x: x['start'])
-        for p in pm:
-            if p['start'] <= cv_addr <= p['stop']:
-                return p['start'], p['stop']
-        return None
+        p = self.process_map.find(cv_addr, self.write_only, self.regions)
+        if p is None:
+            return None
+        return p['start'], p['stop']
 
     def get_base(self, addr: str):
         cv_addr = self.get_address(addr)
         if not cv_addr:
             return addr
 
-        pm = sorted(self.get_process_map(), key=lambda x: x['start'])
-        for p in pm:
-            if p['start'] <= cv_addr <= p['stop']:
-                offset = cv_addr - p['start']
-                if self.arch == 'Linux':
-                    stem = p['pathname'].split('/')[-1]
-                else:
-                    stem = p['pathname'].split('\\')[-1]
-                index = p['map_index']
-                return '{}:{}+{:X}'.format(stem, index, offset)
-        return None
+        p = self.process_map.find(cv_addr, self.write_only, self.regions)
+        if p is None:
+            return None
+        offset = cv_addr - p['start']
+        if self.arch == 'Linux':
+            stem = p['pathname'].split('/')[-1]
+        else:
+            stem = p['pathname'].split('\\')[-1]
+        index = p['map_index']
+        return '{}:{}+{:X}'.format(stem, index, offset)
 
     def read_pointer(self, address: str, offsets: str, return_base: bool = False):
         addr = self.get_address(address)
         if addr is None:
             raise ScriptException("Could not translate address: {}".format(address))
         offset_values = self.string_to_offsets(offsets)
-        try:
-            offset = 0
-            for offset in offset_values:
-                read = self.memory.read_memory(addr, ctypes.c_uint64()).value
-                read = read + offset
-                addr = read
-            return addr - offset if return_base else addr
-        except Exception:
+        addr = PointerResolver(self.memory).resolve_one(addr, offset_values)
+        if addr is None:
             return None
+        return addr - offset_values[-1] if return_base else addr
+
+    def read_pointers(self, chains):
+        """
+        Resolve many (address, offsets) chains at once, chains sharing a prefix read it once. Returns the final address
+        of each chain, or None if it could not be resolved.
+        """
+        return PointerResolver(self.memory).resolve(chains)
 
     def write_pointer(self, address: str, offsets: str, value: ctypes_buffer_t, error_func: callable = None):
         addr = self.get_address(address)
@@ -131,13 +135,13 @@ class MemoryManager:
         for searcher in self.searcher_map.values():
             searcher.set_include_paths(regions)
         self.regions = regions
-        self.process_map = get_process_map(self.memory, self.write_only, self.regions)
+        self.path_cache.clear()
 
     def set_write_only(self, write_only: bool):
         for searcher in self.searcher_map.values():
             searcher.set_write_only(write_only)
         self.write_only = write_only
-        self.process_map = get_process_map(self.memory, self.regions, self.write_only)
+        self.path_cache.clear()
 
 
     def copy_pointer(self, pointer: dict):
@@ -146,22 +150,5 @@ class MemoryManager:
         return {'address': address, 'offsets': offsets}
 
     def compare_aob(self, aob: AOB):
-        size = aob.aob.aob_item['size']
-        values = aob.aob.aob_item['aob_bytes']
-        bases = []
-        for base in aob.get_bases():
-            found = True
-            try:
-                buf = self.memory.read_memory(base, (ctypes.c_ubyte * size)())
-                for i in range(0, len(buf)):
-                    if values[i] > 255:
-                        continue
-                    if values[i] != buf[i]:
-                        found = False
-                        break
-                if found:
-                    bases.append(base)
-            except OSError:
-                continue
-        return bases
+        return verify_bases(self.memory, [aob])[aob]
 
@@ -4,9 +4,10 @@ from typing import List, Union
 import mem_edit
 from mem_edit import Process
 
+from app.helpers.aob_matcher import AOBMatcher
 from app.helpers.directory_utils import memory_directory
 from app.helpers.search_results import SearchResults
-from app.script_common.aob import AOB
+from app.script_common.aob import AOB, verify_bases
 from app.search.searcher import Searcher
 from app.search.searcher_multi import SearcherMulti
 from app.helpers.exceptions import BreakException
@@ -14,6 +15,8 @@ from app.helpers.exceptions import BreakException
 ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, ctypes.Union]
 
 class ScriptUtilities:
+    near_windows = (65536, 1048576, 16777216)
+
     def __init__(self, mem: mem_edit.Process, name: str, multi:bool = True):
         self.name = name
         self.multi = multi
@@ -31,30 +34,48 @@ class ScriptUtilities:
         return [x['address'] for x in self.searcher.results[0:40]]
 
     def compare_aob(self, aob: AOB):
+        return verify_bases(self.process, [aob])[aob]
+
+    def compare_aobs(self, aobs: List[AOB]) -> dict:
+        """
+        Verify the bases of every AOB with one batched read, returns the bases that still match keyed by the AOB.
+        """
+        return verify_bases(self.process, aobs)
+
+    def search_aob_near(self, aob: AOB, windows=None) -> List:
+        """
+        Search windows of growing size around the last found bases of an AOB. An AOB that moves usually stays in the
+        same heap arena, so this finds it without a pass over all of memory. Returns an empty list if no window has it.
+        """
+        bases = aob.get_last_found_bases()
+        if not bases:
+            return []
         if self.searcher is None:
             self.create_searcher()
-        size = aob.aob.aob_item['size']
-        values = aob.aob.aob_item['aob_bytes']
-        bases = []
-        for base in aob.get_bases():
-            found = True
+        regions = self.searcher.get_regions()
+        matcher = AOBMatcher([aob.aob])
+        for window in windows if windows is not None else self.near_windows:
+            spans = []
+            for start, stop in regions:
+                for base in bases:
+                    if start <= base < stop:
+                        spans.append((max(start, base - window), min(stop, base + window)))
+            merged = []
+            for start, stop in sorted(spans):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], stop)
+                else:
+                    merged.append([start, stop])
             try:
-                buf = self.process.read_memory(base, (ctypes.c_ubyte * size)())
-                for i in range(0, len(buf)):
-                    if values[i] > 255:
-                        continue
-                    if values[i] != buf[i]:
-                        found = False
-                        break
-                if found:
-                    bases.append(base)
-            except OSError:
-                continue
-        return bases
+                found = matcher.search_memory(self.process, merged, limit=20, check_cancel=self.searcher.check_cancel)[aob.aob.get_string()]
+            except BreakException:
+                return []
+            if found:
+                return found
+        return []
 
     def _filter(self, haystack, lcl_offset, glb_offset, args):
         aob: AOB = args
-        j = 0
         buf = ctypes.cast(haystack, ctypes.POINTER(ctypes.c_ubyte))
         size = aob.aob.aob_item['size']
         start = lcl_offset - aob.aob.get_offset()
@@ -63,13 +84,8 @@ class ScriptUtilities:
             return None
         if end >= len(haystack):
             return None
-        for i in range(start, end):
-            bt = aob.aob.aob_item['aob_bytes'][j]
-            j += 1
-            if bt >= 256:
-                continue
-            if bt != buf[i]:
-                return None
+        if not aob.aob.get_pattern().match(bytes(buf[start:end])):
+            return None
         return {'address': glb_offset + start, 'value': (ctypes.c_ubyte * size)(*buf[start:end])}
 
     def _haystack_search(self, needle_buffer: ctypes_buffer_t, haystack_buffer: ctypes_buffer_t, filter_func = None, filter_args=None, offset=0) -> List:
@@ -123,21 +139,29 @@ class ScriptUtilities:
 
         #return self.search_all_memory(mem, aob, filter_func=self._filter if aob.has_wildcards() else None, filter_args=aob)
 
+    def search_aobs_all_memory(self, aobs: List[AOB], limit=20) -> dict:
+        """
+        Search every AOB in one pass over memory, returns the first limit bases of each AOB keyed by the AOB.
+        """
+        if self.searcher is None:
+            self.create_searcher()
+        matcher = AOBMatcher([aob.aob for aob in aobs])
+        try:
+            found = matcher.search_memory(self.process, self.searcher.get_regions(), limit=limit, check_cancel=self.searcher.check_cancel)
+        except BreakException:
+            return {}
+        for aob in aobs:
+            aob.set_last_searched()
+        return {aob: found.get(aob.aob.get_string(), []) for aob in aobs}
+
     def compare_aob2(self, mem:Process, addr:int, aob:AOB):
-        res = True
         size = aob.aob.aob_item['size']
-        values = aob.aob.aob_item['aob_bytes']
-        new_values = []
         try:
             mem = mem.read_memory(addr, (ctypes.c_ubyte * size)())
         except OSError:
             return False, ['invalid'], aob.aob.aob_item['aob_string']
-        for i in range(0, len(mem)):
-            new_values.append('{0:0{1}X}'.format(mem[i], 2))
-            if values[i] > 255:
-                continue
-            if res and values[i] != mem[i]:
-                res = False
+        new_values = ['{0:0{1}X}'.format(x, 2) for x in mem]
+        res = aob.aob.get_pattern().match(bytes(mem))
         return res, new_values, aob.aob.aob_item['aob_string']
 
     def create_searcher(self):
@@ -0,0 +1,92 @@
+from .pointer_map import PointerMap
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def path_key(pointer: dict):
+    """
+    The hashable (path, node, base_offset, offsets...) tuple of a pointer scan result.
+    """
+    return (pointer['path'], pointer['node'], pointer['base_offset']) + tuple(pointer['offsets'])
+
+
+def key_pointer(key: tuple):
+    return {'path': key[0], 'node': key[1], 'base_offset': key[2], 'offsets': list(key[3:])}
+
+
+class PathIntersection:
+    """
+    Narrows candidate pointer paths down to the ones that hold across game restarts.
+
+    Paths are kept as a set of path_key tuples, so intersecting with the results of another scan is a set operation.
+    A saved PointerMap snapshot with its known target address filters the set without scanning again, every path is
+    resolved against the snapshot one level at a time for all paths at once with a binary search over the address
+    ordered pointer table. Requires numpy.
+    """
+    def __init__(self, candidates=()):
+        self.paths = {path_key(x) for x in candidates}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add_results(self, results):
+        """
+        Keep only the paths that are also in the results of another scan.
+        """
+        self.paths &= {path_key(x) for x in results}
+        return len(self.paths)
+
+    def add_snapshot(self, pointer_map: PointerMap, target: int):
+        """
+        Keep only the paths that resolve to target in the snapshot.
+        """
+        keys = list(self.paths)
+        self.paths = {key for key, address in zip(keys, self.resolve(pointer_map, keys)) if address == target}
+        return len(self.paths)
+
+    def get_pointers(self):
+        return [key_pointer(x) for x in sorted(self.paths, key=lambda x: (len(x), x))]
+
+    @staticmethod
+    def resolve(pointer_map: PointerMap, keys):
+        """
+        The address every path key resolves to in the snapshot, None where a region or a pointer along the path is
+        missing. The offsets are applied like PointerVerify, read the pointer then add the offset.
+        """
+        if not keys:
+            return []
+        count = len(keys)
+        depth = max(len(x) - 3 for x in keys)
+        current = np.zeros(count, dtype=np.int64)
+        valid = np.zeros(count, dtype=bool)
+        lengths = np.array([len(x) - 3 for x in keys], dtype=np.int64)
+        offsets = np.zeros((depth, count), dtype=np.int64)
+        bases = {}
+        for i, key in enumerate(keys):
+            base = bases.get(key[0:2], -1)
+            if base == -1:
+                region = pointer_map.find_region(key[0], key[1])
+                base = bases[key[0:2]] = region['start'] if region is not None else None
+            if base is not None:
+                current[i] = base + key[2]
+                valid[i] = True
+            offsets[0:len(key)-3, i] = key[3:]
+        addresses = pointer_map.pairs['address']
+        values = pointer_map.pairs['value']
+        for level in range(depth):
+            active = np.flatnonzero(valid & (lengths > level))
+            if len(active) == 0:
+                break
+            if len(addresses) == 0:
+                valid[active] = False
+                break
+            wanted = current[active].astype(np.uint64)
+            index = np.minimum(np.searchsorted(addresses, wanted), len(addresses) - 1)
+            found = addresses[index] == wanted
+            valid[active[~found]] = False
+            hits = active[found]
+            current[hits] = values[index[found]].astype(np.int64) + offsets[level, hits]
+        return [int(address) if ok else None for address, ok in zip(current.tolist(), valid.tolist())]
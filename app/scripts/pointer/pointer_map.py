@@ -0,0 +1,197 @@
+import ctypes
+import json
+import struct
+import time
+from pathlib import Path
+
+from mem_edit import Process
+
+from app.helpers.prefetch_reader import PrefetchReader
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class PointerMap:
+    """
+    Reverse pointer map of a process, every aligned 8 byte value that points into a mapped region together with the
+    address holding it.
+
+    The map is built with one pass over the searched regions, the next chunk is read while the current one is filtered,
+    and saved to a file that is memory mapped when it is used. Next to the pointer table the file keeps the process map
+    of the session, so a saved map can be scanned and verified again without the process. Finding every address
+    pointing into (low, high) is two binary searches, reading the pointer stored at an address is one. Requires numpy.
+
+    File layout: magic, length of the JSON header, the JSON header padded to 16 bytes, the (address, value) pairs in
+    address order and the int64 indices of the pairs in value order.
+    """
+    magic = b'MHPTRMAP'
+    version = 1
+    chunk_size = 16 * 1048576
+    copy_block = 4 * 1048576
+    dtype = np.dtype([('address', '<u8'), ('value', '<u8')]) if np is not None else None
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.header = {}
+        self.pairs = None
+        self.order = None
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    def __len__(self):
+        return len(self.pairs) if self.pairs is not None else 0
+
+    def build(self, memory: Process, regions, targets, process_map=(), info: dict = None, check_cancel: callable = None, progress: callable = None):
+        """
+        Collect the pointers stored in the (start, stop) regions whose value is inside one of the (start, stop) targets
+        and save the map. process_map is the list of region dicts saved with it, info is added to the header, like the
+        'target' address the scan looked for. progress is called with the bytes done and the total after every chunk.
+        """
+        self.close()
+        regions = [(start, stop) for start, stop in regions if stop > start]
+        targets = sorted((start, stop) for start, stop in targets if stop > start)
+        starts = np.array([x[0] for x in targets], dtype=np.uint64)
+        stops = np.array([x[1] for x in targets], dtype=np.uint64)
+        total = sum(stop - start for start, stop in regions)
+        done = 0
+        unsorted = self.path.with_suffix('.tmp')
+        try:
+            with unsorted.open('wb') as f, PrefetchReader(memory, regions, self.chunk_size) as reader:
+                for start, buffer in reader:
+                    if check_cancel:
+                        check_cancel()
+                    size = ctypes.sizeof(buffer)
+                    done += size
+                    skip = (-start) % 8
+                    count = (size - skip) // 8
+                    if targets and count > 0:
+                        values = np.frombuffer(buffer, dtype='<u8', count=count, offset=skip)
+                        position = np.searchsorted(starts, values, side='right').astype(np.int64) - 1
+                        hits = np.flatnonzero((position >= 0) & (values < stops[np.maximum(position, 0)]))
+                        pairs = np.empty(len(hits), dtype=self.dtype)
+                        pairs['address'] = hits.astype(np.uint64) * 8 + (start + skip)
+                        pairs['value'] = values[hits]
+                        pairs.tofile(f)
+                    if progress:
+                        progress(done, total)
+            header = {
+                'version': self.version,
+                'created': time.time(),
+                'searched': regions,
+                'regions': [{k: x[k] for k in ('pathname', 'map_index', 'start', 'stop', 'privileges', 'inode')} for x in process_map]
+            }
+            header.update(info or {})
+            self._write(unsorted, header)
+        finally:
+            unsorted.unlink(missing_ok=True)
+        return self.open()
+
+    def _write(self, unsorted: Path, header: dict):
+        #the pairs were written in address order, only the order by value has to be sorted
+        count = unsorted.stat().st_size // self.dtype.itemsize
+        header['count'] = count
+        data = json.dumps(header).encode('utf-8')
+        data += b' ' * (-(len(self.magic) + 8 + len(data)) % 16)
+        table = len(self.magic) + 8 + len(data)
+        with self.path.open('wb') as f:
+            f.write(self.magic)
+            f.write(struct.pack('<Q', len(data)))
+            f.write(data)
+            f.truncate(table + count * (self.dtype.itemsize + 8))
+        if count == 0:
+            return
+        pairs = np.memmap(unsorted, dtype=self.dtype, mode='r')
+        result = np.memmap(self.path, dtype=self.dtype, mode='r+', offset=table, shape=(count,))
+        for pos in range(0, count, self.copy_block):
+            result[pos:pos+self.copy_block] = pairs[pos:pos+self.copy_block]
+        result.flush()
+        order = np.memmap(self.path, dtype='<i8', mode='r+', offset=table + count * self.dtype.itemsize, shape=(count,))
+        order[:] = np.argsort(pairs['value'], kind='stable')
+        order.flush()
+        del pairs, result, order
+
+    def open(self):
+        """
+        Map a saved file, raises ValueError if it is not a pointer map.
+        """
+        with self.path.open('rb') as f:
+            if f.read(len(self.magic)) != self.magic:
+                raise ValueError('{} is not a pointer map'.format(self.path.name))
+            length = struct.unpack('<Q', f.read(8))[0]
+            self.header = json.loads(f.read(length).decode('utf-8'))
+        count = self.header['count']
+        table = len(self.magic) + 8 + length
+        if count == 0:
+            self.pairs = np.zeros(0, dtype=self.dtype)
+            self.order = np.zeros(0, dtype=np.int64)
+        else:
+            self.pairs = np.memmap(self.path, dtype=self.dtype, mode='r', offset=table, shape=(count,))
+            self.order = np.memmap(self.path, dtype='<i8', mode='r', offset=table + count * self.dtype.itemsize, shape=(count,))
+        return self
+
+    @classmethod
+    def load(cls, path: Path):
+        return PointerMap(path).open()
+
+    def close(self):
+        self.pairs = None
+        self.order = None
+
+    def delete(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def get_regions(self):
+        """
+        The process map of the session the map was built in.
+        """
+        for region in self.header.get('regions', []):
+            region.setdefault('size', region['stop'] - region['start'])
+        return self.header.get('regions', [])
+
+    def get_target(self):
+        """
+        The address the scan that built the map looked for, or None.
+        """
+        return self.header.get('target', None)
+
+    def get_searched_regions(self):
+        return [tuple(x) for x in self.header.get('searched', [])]
+
+    def find_region(self, pathname: str, map_index: int):
+        for region in self.get_regions():
+            if region['pathname'] == pathname and region['map_index'] == map_index:
+                return region
+        return None
+
+    def find(self, low: int, high: int):
+        """
+        The (address, value) pairs of every pointer whose value is strictly between low and high, ordered by value. The
+        bounds are exclusive like the Between search the scan runs without a map.
+        """
+        if len(self) == 0 or high <= low + 1 or high <= 0:
+            return []
+        values = self.pairs['value']
+        first = np.searchsorted(values, np.uint64(low), side='right', sorter=self.order) if low >= 0 else 0
+        last = np.searchsorted(values, np.uint64(high), side='left', sorter=self.order) if high < 1 << 64 else len(values)
+        if last <= first:
+            return []
+        found = self.pairs[self.order[first:last]]
+        return list(zip(found['address'].tolist(), found['value'].tolist()))
+
+    def read_pointer(self, address: int):
+        """
+        The pointer stored at address, or None if the address does not hold a pointer into a mapped region.
+        """
+        if len(self) == 0:
+            return None
+        addresses = self.pairs['address']
+        index = np.searchsorted(addresses, np.uint64(address))
+        if index < len(addresses) and addresses[index] == address:
+            return int(self.pairs['value'][index])
+        return None
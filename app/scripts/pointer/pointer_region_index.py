@@ -0,0 +1,88 @@
+import bisect
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class RegionIndex:
+    """
+    Sorted interval index over the process map used to classify pointer scan results.
+
+    The regions are sorted by start address, so the region of an address is found with a binary search instead of
+    testing every mapping. classify() looks up a whole batch of addresses at once with numpy searchsorted. Like the
+    old bounds checks the stop address of a region is inside it, so an address on the stop of one region and the start
+    of the next belongs to both.
+    """
+    def __init__(self, process_map, node_bounds, is_heap_path: callable):
+        self.regions = sorted(process_map, key=lambda x: x['start'])
+        nodes = set(node_bounds)
+        self.starts = [x['start'] for x in self.regions]
+        self.stops = [x['stop'] for x in self.regions]
+        self.static = [(x['start'], x['stop']) in nodes for x in self.regions]
+        self.heap = [is_heap_path(x['pathname']) for x in self.regions]
+        self.map_index = [x['map_index'] for x in self.regions]
+        if np is not None:
+            self._starts = np.array(self.starts, dtype=np.uint64)
+            self._stops = np.array(self.stops, dtype=np.uint64)
+            self._static = np.array(self.static, dtype=bool)
+            self._heap = np.array(self.heap, dtype=bool)
+            self._map_index = np.array(self.map_index, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.regions)
+
+    def _index(self, address: int):
+        index = bisect.bisect_right(self.starts, address) - 1
+        if index >= 0 and address <= self.stops[index]:
+            return index
+        return -1
+
+    def find(self, address: int):
+        """
+        The region dict holding address, or None.
+        """
+        index = self._index(address)
+        return self.regions[index] if index >= 0 else None
+
+    def is_valid(self, address: int):
+        return self._index(address) >= 0
+
+    def is_static(self, address: int):
+        index = self._index(address)
+        if index < 0:
+            return False
+        #the previous region also holds the address when it ends exactly there
+        return self.static[index] or (index > 0 and self.stops[index-1] == address and self.static[index-1])
+
+    def classify(self, addresses):
+        """
+        Classify a batch of addresses. Returns a dict of lists with one entry per address, 'index' into regions (-1 if
+        no region holds it), 'valid', 'static', 'heap', 'map_index' and 'base_offset' from the region start.
+        """
+        if np is None or len(addresses) == 0 or not self.regions:
+            index = [self._index(x) for x in addresses]
+            return {
+                'index': index,
+                'valid': [x >= 0 for x in index],
+                'static': [self.is_static(x) for x in addresses],
+                'heap': [i >= 0 and self.heap[i] for i in index],
+                'map_index': [self.map_index[i] if i >= 0 else -1 for i in index],
+                'base_offset': [a - self.starts[i] if i >= 0 else 0 for a, i in zip(addresses, index)]
+            }
+        values = np.array(addresses, dtype=np.uint64)
+        position = np.searchsorted(self._starts, values, side='right').astype(np.int64) - 1
+        clipped = np.maximum(position, 0)
+        valid = (position >= 0) & (values <= self._stops[clipped])
+        previous = np.maximum(position - 1, 0)
+        static = (valid & self._static[clipped]) | ((position >= 1) & (values == self._stops[previous]) & self._static[previous])
+        index = np.where(valid, position, -1)
+        return {
+            'index': index.tolist(),
+            'valid': valid.tolist(),
+            'static': static.tolist(),
+            'heap': (valid & self._heap[clipped]).tolist(),
+            'map_index': np.where(valid, self._map_index[clipped], -1).tolist(),
+            'base_offset': np.where(valid, values - self._starts[clipped], 0).astype(np.int64).tolist()
+        }
@@ -0,0 +1,228 @@
+import heapq
+import json
+import os
+import struct
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class PointerScanStore:
+    """
+    Disk backed state of a pointer scan, so deep scans do not have to fit in memory and a stopped scan can resume.
+
+    Every level of the scan is an append-only file of (address, offset, parent index) records, a node is linked to its
+    parent in the level before it, so the offsets of a chain are read back by walking the parents. Finished chains are
+    streamed to a NDJSON file as they are found and only the best max_results of them, static bases first and shorter
+    chains first, are kept in memory for the .ptr file. After every level a checkpoint records the scan parameters, the
+    finished level and the size of the chain file, a scan started again with the same parameters continues from there.
+    """
+    record = struct.Struct('<Qqq')
+    max_results = 100000
+    read_block = 65536
+
+    def __init__(self, directory: Path, name: str):
+        self.directory = Path(directory)
+        self.name = name
+        self.params = {}
+        self.level = -1
+        self._levels = {}
+        self._readers = {}
+        self._chains = None
+        self._best = []
+        self._counter = 0
+        self._seen = np.zeros(0, dtype=np.uint64) if np is not None else set()
+        self._level_seen = set()
+
+    def _path(self, suffix: str):
+        return self.directory.joinpath('{}.{}'.format(self.name, suffix))
+
+    def _level_path(self, level: int):
+        return self._path('level{}'.format(level))
+
+    def start(self, params: dict):
+        """
+        Start a new scan, the files of an earlier one are removed.
+        """
+        self.clear()
+        self.params = dict(params)
+        self.level = -1
+        self._chains = self._path('chains').open('w')
+
+    def resume(self, params: dict):
+        """
+        Continue the checkpointed scan if it was started with the same params. Returns the last finished level, or -1 if
+        there is nothing to resume.
+        """
+        checkpoint = self._path('ckpt')
+        if not checkpoint.exists():
+            return -1
+        try:
+            with checkpoint.open('rt') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return -1
+        if any(state['params'].get(k, None) != v for k, v in params.items()):
+            return -1
+        self.params = state['params']
+        self.level = state['level']
+        #drop what was written after the checkpoint
+        for level, count in enumerate(state['counts']):
+            with self._level_path(level).open('ab') as f:
+                f.truncate(count * self.record.size)
+        level = len(state['counts'])
+        while self._level_path(level).exists():
+            self._level_path(level).unlink()
+            level += 1
+        self._chains = self._path('chains').open('a+')
+        self._chains.truncate(state['chains'])
+        self._chains.seek(0)
+        for line in self._chains:
+            self._rank(json.loads(line))
+        for level in range(self.level + 1):
+            self._add_seen([x[0] for x in self.iter_level(level)])
+        return self.level
+
+    def checkpoint(self, level: int):
+        """
+        Mark level as finished. The files are flushed first, so the checkpoint never points past what is on disk.
+        """
+        for f in self._levels.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self._chains.flush()
+        os.fsync(self._chains.fileno())
+        self.level = level
+        self._add_seen(self._level_seen)
+        self._level_seen = set()
+        state = {'params': self.params, 'level': level, 'counts': [self.count(x) for x in range(level + 1)], 'chains': self._chains.tell()}
+        temp = self._path('ckpt.tmp')
+        with temp.open('wt') as f:
+            json.dump(state, f)
+        temp.replace(self._path('ckpt'))
+
+    def finish(self):
+        """
+        The scan is complete, remove the checkpoint and the level files, the chain file stays.
+        """
+        self.close()
+        self._path('ckpt').unlink(missing_ok=True)
+        level = 0
+        while self._level_path(level).exists():
+            self._level_path(level).unlink()
+            level += 1
+
+    def clear(self):
+        self.finish()
+        self._path('chains').unlink(missing_ok=True)
+        self._best = []
+        self._counter = 0
+        self._seen = np.zeros(0, dtype=np.uint64) if np is not None else set()
+        self._level_seen = set()
+
+    def close(self):
+        for f in list(self._levels.values()) + list(self._readers.values()):
+            f.close()
+        self._levels = {}
+        self._readers = {}
+        if self._chains is not None:
+            self._chains.close()
+            self._chains = None
+
+    def _add_seen(self, addresses):
+        if np is None:
+            self._seen.update(addresses)
+        elif addresses:
+            self._seen = np.union1d(self._seen, np.fromiter(addresses, dtype=np.uint64, count=len(addresses)))
+
+    def is_seen(self, address: int):
+        """
+        True if a node of a finished level or of the current one has address.
+        """
+        if address in self._level_seen:
+            return True
+        if np is None:
+            return address in self._seen
+        index = np.searchsorted(self._seen, np.uint64(address))
+        return bool(index < len(self._seen) and self._seen[index] == address)
+
+    def add(self, level: int, address: int, offset: int, parent: int):
+        f = self._levels.get(level, None)
+        if f is None:
+            f = self._levels[level] = self._level_path(level).open('ab')
+        f.write(self.record.pack(address, offset, parent))
+        self._level_seen.add(address)
+
+    def count(self, level: int):
+        f = self._levels.get(level, None)
+        if f is not None:
+            f.flush()
+        path = self._level_path(level)
+        return path.stat().st_size // self.record.size if path.exists() else 0
+
+    def iter_level(self, level: int):
+        """
+        Yield the (address, offset, parent) records of a level in the order they were added.
+        """
+        if level in self._levels:
+            self._levels[level].flush()
+        path = self._level_path(level)
+        if not path.exists():
+            return
+        with path.open('rb') as f:
+            while True:
+                data = f.read(self.read_block * self.record.size)
+                if not data:
+                    break
+                yield from self.record.iter_unpack(data[:len(data) - len(data) % self.record.size])
+
+    def _read(self, level: int, index: int):
+        if level in self._levels:
+            self._levels[level].flush()
+        f = self._readers.get(level, None)
+        if f is None:
+            f = self._readers[level] = self._level_path(level).open('rb')
+        f.seek(index * self.record.size)
+        return self.record.unpack(f.read(self.record.size))
+
+    def get_offsets(self, level: int, index: int):
+        """
+        The offsets of the chain ending at a node, from the node up to the first level, the order PointerVerify uses.
+        """
+        address, offset, parent = self._read(level, index)
+        offsets = [offset]
+        while level > 0:
+            level -= 1
+            address, offset, parent = self._read(level, parent)
+            offsets.append(offset)
+        return offsets
+
+    def _rank(self, chain: dict):
+        #min heap on (static, shorter), its root is the worst kept chain and is replaced by a better one when full
+        self._counter += 1
+        item = (-int(not chain['static']), -len(chain['offsets']), -self._counter, chain)
+        if len(self._best) < self.max_results:
+            heapq.heappush(self._best, item)
+        elif item > self._best[0]:
+            heapq.heapreplace(self._best, item)
+
+    def add_chain(self, chain: dict):
+        """
+        Stream a finished chain, a pointer scan result with a 'static' flag for its base.
+        """
+        self._chains.write(json.dumps(chain) + '\n')
+        self._rank(chain)
+
+    def get_results(self):
+        """
+        The kept chains, best first, without the static flag.
+        """
+        results = []
+        for item in sorted(self._best, reverse=True):
+            chain = dict(item[3])
+            chain.pop('static', None)
+            results.append(chain)
+        return results
@@ -1,5 +1,6 @@
 import json
 import time
+from itertools import islice
 from queue import Queue
 from threading import Thread, Event
 from typing import cast
@@ -8,15 +9,21 @@ import psutil
 from pathlib import Path
 
 from app.helpers.exceptions import BreakException
+from app.helpers.process import get_cached_process_map
 from app.helpers.timer import PollTimer
 from app.script_common import SubScript
 from app.script_ui import controls
 from app.script_ui.validators import address_match, offsets_match
 from app.search.operations import Between
+from .pointer_map import PointerMap
+from .pointer_region_index import RegionIndex
+from .pointer_scan_store import PointerScanStore
 from .pointer_scanner_helpers import *
 
 
 class PointerScanner(SubScript):
+    leaf_batch = 4096
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.search_thread: Thread = None
@@ -41,6 +48,9 @@ class PointerScanner(SubScript):
             controls.Text("Negative Offsets:", width="145px"),
             controls.Toggle(on_toggle=self.ctrl_changed, id='PS_TOGGLE_NEGATIVE_OFFSET')])
 
+        page.add_elements([
+            controls.Text("Pointer Map:", width="145px"),
+            controls.Select(values=[('_new', 'Build New Map')], on_change=self.ctrl_changed, id='PS_SELECT_SAVED_MAP')], id='PS_ROW_SAVED_MAP')
 
         page.add_elements([
             controls.Text("Maximum Depth:", width="145px"),
@@ -72,6 +82,7 @@ class PointerScanner(SubScript):
         [self.ui.get_element(x).set_text("4096") for x in ['PS_INPUT_MAX_OFFSET']]
         self.find_regions()
         self.ui.get_element('PS_SELECT_MAX_DEPTH').set_select_index(2)
+        self.update_map_files()
         self.on_ready()
 
     def on_exit(self):
@@ -104,15 +115,17 @@ class PointerScanner(SubScript):
         offset = int(self.ui.get_element("PS_INPUT_MAX_OFFSET").get_text())
         depth = int(self.ui.get_element("PS_SELECT_MAX_DEPTH").get_selection())
         negative_offset = cast(controls.Toggle, self.ui.get_element("PS_TOGGLE_NEGATIVE_OFFSET")).is_checked()
+        saved_map = self.ui.get_element("PS_SELECT_SAVED_MAP").get_selection()
+        saved_map = saved_map if saved_map and saved_map != '_new' else None
 
-        [self.ui.get_element(ctrl_name).disable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET']]
+        [self.ui.get_element(ctrl_name).disable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET', 'PS_SELECT_SAVED_MAP']]
 
         self.ui.get_element("PS_BUTTON_START").hide()
         self.ui.get_element("PS_BUTTON_STOP").show()
         self.ui.get_element("PS_TEXT_STATUS").set_text('Searching...')
         self.ui.get_element("PS_ROW_STATUS").show()
 
-        self.search_thread = Thread(target=self._search_thread, args=(address, offset, depth, regions, negative_offset, self.get_data("PS_QUEUE")))
+        self.search_thread = Thread(target=self._search_thread, args=(address, offset, depth, regions, negative_offset, saved_map, self.get_data("PS_QUEUE")))
         self.search_thread.start()
 
     def stop_search(self, name, ele_id, data):
@@ -173,30 +186,69 @@ class PointerScanner(SubScript):
         else:
             self.ui.get_element("PS_BUTTON_START").disable()
 
-    def _search_thread(self, address: int, offset: int, depth: int, regions: list, negative_offset:bool, queue: Queue):
+    def get_map_path(self):
+        #one map per process, the maps of earlier game sessions are kept as snapshots to intersect paths with
+        return Path(self.get_directory()).joinpath('{}-{}.pmap'.format(self.get_data('APP_NAME'), self.memory.pid))
+
+    def get_map_files(self):
+        #any saved map can be scanned again, also the ones of earlier sessions, the newest first
+        files = [('_new', 'Build New Map')]
+        if PointerMap.available():
+            paths = sorted(Path(self.get_directory()).glob("*.pmap"), key=lambda x: x.stat().st_mtime, reverse=True)
+            files.extend([(p.name, p.name) for p in paths])
+        return files
+
+    def update_map_files(self):
+        files = self.get_map_files()
+        self.ui.get_element('PS_SELECT_SAVED_MAP').set_values(files)
+        self.ui.get_element('PS_ROW_SAVED_MAP').show() if len(files) > 1 else self.ui.get_element('PS_ROW_SAVED_MAP').hide()
+
+    def _search_thread(self, address: int, offset: int, depth: int, regions: list, negative_offset:bool, saved_map: str, queue: Queue):
         searcher = self.memory_manager.get_searcher()
         searcher.set_search_size('byte_8')
         if '_all' not in regions:
             self.memory_manager.set_include_paths(regions)
-        broke, results = self._perform_search_thread(address, offset, depth, negative_offset)
+        broke, results = self._perform_search_thread(address, offset, depth, negative_offset, regions, saved_map)
         if not broke and len(results) == 0:
             queue.put("ZERO")
             return
-        with Path(Path(self.get_directory()).joinpath('{}.ptr'.format(self.get_data('APP_NAME')))).open("wt") as f:
-            json.dump(results, f, indent=4)
+        if results:
+            with Path(Path(self.get_directory()).joinpath('{}.ptr'.format(self.get_data('APP_NAME')))).open("wt") as f:
+                json.dump(results, f, indent=4)
         if broke:
             queue.put("BREAK")
         else:
             queue.put("SUCCESS")
 
 
-    def _perform_search_thread(self, address, offset, depth, negative_offset):
+    def _perform_search_thread(self, address, offset, depth, negative_offset, regions: list, saved_map: str = None):
+        """
+        Search the pointer levels. The nodes of every level are kept on disk by a PointerScanStore, finished chains are
+        streamed to it and every level is checkpointed, so starting the same search again after it was stopped continues
+        after the last finished level. saved_map names a saved pointer map, of this session or an earlier one, that is
+        searched instead of the process, its saved process map filtered to the selected regions classifies the results.
+        """
         s = self.memory_manager.get_searcher()
         poll_timer = PollTimer(10)
-        proc_map = list(self.memory_manager.get_process_map())
-        print("Searching {} MB".format(sum([x['size'] for x in proc_map]) / 1000000))
-        node_bounds = get_node_bounds(proc_map)
-        valid_bounds = [(x['start'], x['stop']) for x in proc_map]
+        store = PointerScanStore(Path(self.get_directory()), self.get_data('APP_NAME'))
+        params = {'address': address, 'offset': offset, 'negative_offset': negative_offset, 'regions': sorted(regions), 'pid': self.memory.pid, 'map': saved_map}
+        level = store.resume(params)
+        map_path = Path(self.get_directory()).joinpath(saved_map) if saved_map else None
+        if map_path is None and level >= 0:
+            map_path = self.get_map_path() #a resumed search uses the map it built
+        pointer_map = None
+        if PointerMap.available() and map_path is not None and map_path.exists():
+            pointer_map = PointerMap.load(map_path)
+            proc_map = [x for x in pointer_map.get_regions() if '_all' in regions or x['pathname'] in regions]
+            print("Searching saved pointer map of {} pointers".format(len(pointer_map)))
+        else:
+            proc_map = list(self.memory_manager.get_process_map())
+            print("Searching {} MB".format(sum([x['size'] for x in proc_map]) / 1000000))
+        region_index = RegionIndex(proc_map, get_node_bounds(proc_map), is_heap_path)
+        if level >= 0:
+            print("Resuming search after level {}".format(level))
+        else:
+            store.start(params)
         result_counter = 0
         static_counter = 0
         reuse_counter = 0
@@ -205,86 +257,125 @@ class PointerScanner(SubScript):
         start_time = time.time()
         total_search_time = 0
         number_of_searches = 0
-        address_set = set()
-        first_level = []
-        lvl_map = {}
         broke = False
         try:
-            for i in range(0, depth):
+            if pointer_map is None:
+                pointer_map = self._build_pointer_map(s, poll_timer, address)
+            last = level
+            for i in range(level + 1, depth):
                 print("Searching level {}".format(i))
-                if not first_level:
+                if i == 0:
                     stime = time.time()
-                    s.search_memory_operation(Between((address - offset, address + offset if negative_offset else address)))
+                    all_results = self._find_pointers(pointer_map, address - offset, address + offset if negative_offset else address)
                     total_search_time += time.time() - stime
                     number_of_searches += 1
-                    if len(s.results) == 0:
+                    if len(all_results) == 0:
                         zero_counter += 1
+                        store.finish()
                         return False, []
-                    with s.results.db() as conn:
-                        all_results = [{'address': x[0], 'value': x[1]} for x in s.results.get_results(conn).fetchall()]
                     result_indexes = self.generate_result_order(all_results)
+                    classes = region_index.classify([x['address'] for x in all_results])
                     for index in result_indexes:
                         r = all_results[index]
-                        if r['address'] not in address_set:
-                            if not self.is_valid_address(r['address'], valid_bounds):
+                        if not store.is_seen(r['address']):
+                            if not classes['valid'][index]:
                                 invalid_counter += 1
                                 continue
                             if r['address'] % 4 != 0:
                                 continue
-                            item = {'address': r['address'], 'offset': address - int.from_bytes(r['value'], byteorder="little", signed=False), 'children': []}
                             result_counter += 1
-                            if self.is_static_address(r['address'], node_bounds):
+                            if classes['static'][index]:
                                 static_counter += 1
-                            first_level.append(item)
-                            address_set.add(r['address'])
-                            if i not in lvl_map:
-                                lvl_map[i] = []
-                            lvl_map[i].append(item)
+                            store.add(i, r['address'], address - r['value'], -1)
                         if poll_timer.has_elapsed():
                             self.ui.get_element("PS_TEXT_STATUS").set_text('Search level {}<br>Found {} possible pointers.<br>{} potential static pointers.'.format(i, result_counter, static_counter))
                             print("Found {} result and {} static".format(result_counter, static_counter))
                 else:
-                    if i - 1 not in lvl_map:  # no more pointers
-                        break
-                    for p in lvl_map[i - 1]:
-                        nx = []
+                    leaves = []
+                    for parent, (p_address, _, _) in enumerate(store.iter_level(i - 1)):
+                        s.check_cancel()
+                        children = 0
                         stime = time.time()
-                        s.search_memory_operation(Between((p['address'] - offset, p['address'] + offset if negative_offset else p['address'])))
+                        all_results = self._find_pointers(pointer_map, p_address - offset, p_address + offset if negative_offset else p_address)
                         total_search_time += time.time() - stime
                         number_of_searches += 1
-                        if len(s.results) == 0:
+                        if len(all_results) == 0:
                             zero_counter += 1
-                        with s.results.db() as conn:
-                            all_results = [{'address': x[0], 'value': x[1]} for x in s.results.get_results(conn).fetchall()]
                         result_indexes = self.generate_result_order(all_results)
+                        classes = region_index.classify([x['address'] for x in all_results])
                         for index in result_indexes:
                             r = all_results[index]
-                            static_address = self.is_static_address(r['address'], node_bounds)
-                            valid = (r['address'] % 4 == 0) and (static_address or (r['address'] not in address_set and self.is_valid_address(r['address'], valid_bounds)))
+                            static_address = classes['static'][index]
+                            seen = store.is_seen(r['address'])
+                            valid = (r['address'] % 4 == 0) and (static_address or (not seen and classes['valid'][index]))
                             if not valid:
                                 invalid_counter += 1
-                                if r['address'] in address_set:
+                                if seen:
                                     reuse_counter += 1
                                 continue
-                            item = {'address': r['address'], 'offset': p['address'] - int.from_bytes(r['value'], byteorder="little", signed=False), 'children': []}
                             result_counter += 1
                             if static_address:
                                 static_counter += 1
-                            nx.append(item)
-                            address_set.add(r['address'])
-                            if i not in lvl_map:
-                                lvl_map[i] = []
-                            lvl_map[i].append(item)
+                            store.add(i, r['address'], p_address - r['value'], parent)
+                            children += 1
+                        if children == 0:
+                            #a node nothing points to ends its chains
+                            leaves.append((parent, p_address))
+                            if len(leaves) >= self.leaf_batch:
+                                self._add_leaves(store, region_index, i - 1, leaves)
+                                leaves = []
                         if poll_timer.has_elapsed():
                             self.ui.get_element("PS_TEXT_STATUS").set_text('Search level {}<br>Found {} possible pointers.<br>{} potential static pointers.'.format(i, result_counter, static_counter))
                             print("Found {} result and {} static {} invalid {} reused {} zero searches".format(result_counter, static_counter, invalid_counter, reuse_counter, zero_counter))
                             print("Number of searches {} / Average search time: {} / Searches per minute: {}".format(number_of_searches, total_search_time / number_of_searches, 60 * number_of_searches / (time.time() - start_time)))
-                        p['children'] = nx
+                    self._add_leaves(store, region_index, i - 1, leaves)
+                if store.count(i) == 0:  # no more pointers
+                    break
+                store.checkpoint(i)
+                last = i
+            else:
+                #every node of the deepest level ends its chains
+                self._add_leaves(store, region_index, last, ((index, x[0]) for index, x in enumerate(store.iter_level(last))))
+            results = store.get_results()
+            store.finish()
+            return False, results
         except BreakException:
             broke = True
-        holder = []
-        self.organize(first_level, holder)
-        return broke, holder
+        finally:
+            store.close()
+            if pointer_map is not None:
+                pointer_map.close()
+        print("Search stopped after level {}, start it again to resume".format(store.level))
+        return broke, store.get_results()
+
+    def _build_pointer_map(self, s, poll_timer: PollTimer, address: int):
+        if not PointerMap.available():
+            return None
+        #every value that points into any mapping counts, the pointed to node may be outside the searched regions
+        process_map = get_cached_process_map(self.memory_manager.memory).get_regions(writeable_only=False)
+        targets = [(x['start'], x['stop']) for x in process_map]
+        def progress(done, total):
+            if poll_timer.has_elapsed():
+                self.ui.get_element("PS_TEXT_STATUS").set_text('Building pointer map {:.0f}%'.format(100 * done / max(1, total)))
+        #the map is kept next to the .ptr file, so the next scan or a verify can use it without the process
+        pointer_map = PointerMap(self.get_map_path())
+        pointer_map.build(self.memory_manager.memory, s.get_regions(), targets, process_map, {'target': address}, check_cancel=s.check_cancel, progress=progress)
+        print("Pointer map holds {} pointers".format(len(pointer_map)))
+        return pointer_map
+
+    def _find_pointers(self, pointer_map, low: int, high: int):
+        """
+        Every aligned 8 byte value strictly between low and high as {'address', 'value'} dicts, from the pointer map if there
+        is one.
+        """
+        if pointer_map is not None:
+            return [{'address': x[0], 'value': x[1]} for x in pointer_map.find(low, high)]
+        s = self.memory_manager.get_searcher()
+        s.search_memory_operation(Between((low, high)))
+        if len(s.results) == 0:
+            return []
+        with s.results.db() as conn:
+            return [{'address': x[0], 'value': int.from_bytes(x[1], byteorder="little", signed=False)} for x in s.results.get_results(conn).fetchall()]
 
     def generate_result_order(self, results):
         v = list(range(0, len(results)))
@@ -311,37 +402,23 @@ class PointerScanner(SubScript):
                 state = 0
         return g
 
-    def is_static_address(self, address: int, node_bounds: list):
-        return any(x[0] <= address <= x[1] for x in node_bounds)
-
-    def is_valid_address(self, address: int, valid_bounds: list):
-        return any(x[0] <= address <= x[1] for x in valid_bounds)
-
-    def get_base(self, address):
-        pm = self.memory_manager.get_process_map()
-        for item in pm:
-            if item['start'] <= address <= item['stop']:
-                return item
-        return None
-
-
-    def organize(self, pointers, holder):
-        for pointer in pointers:
-            if pointer['children']:
-                ret = self.organize(pointer['children'], [])
-                for r in ret:
-                    r['offsets'].append(pointer['offset'])
-                    holder.append(r)
-            else:
-                base = self.get_base(pointer['address'])
+    def _add_leaves(self, store: PointerScanStore, region_index: RegionIndex, level: int, leaves):
+        """
+        Stream the chains ending at the (index, address) leaves of a level, the ones whose base is not in the heap.
+        """
+        leaves = iter(leaves)
+        batch = list(islice(leaves, self.leaf_batch))
+        while batch:
+            #every leaf of the batch is classified at once instead of searching the map for each of them
+            classes = region_index.classify([x[1] for x in batch])
+            for (index, address), region, static, base_offset in zip(batch, classes['index'], classes['static'], classes['base_offset']):
+                if region < 0:
+                    continue
+                base = region_index.regions[region]
                 pathname = base['pathname'] if base['pathname'] != "" else "anon"
-                node = base['map_index']
-                base_offset = pointer['address'] - base['start']
                 if not is_heap_path(pathname):
-                    holder.append({'address': pointer['address'], 'path': pathname, 'node': node, 'base_offset': base_offset, 'offsets': [pointer['offset']]})
-                #else:
-                #    holder.append({'address': self.memory_manager.get_base("{:X}".format(pointer['address'])), 'path': pathname, 'node': node, 'base_offset': base_offset, 'offsets': [pointer['offset']]})
-        return holder
+                    store.add_chain({'address': address, 'path': pathname, 'node': base['map_index'], 'base_offset': base_offset, 'offsets': store.get_offsets(level, index), 'static': static})
+            batch = list(islice(leaves, self.leaf_batch))
 
     def search_break(self):
         self.memory_manager.get_searcher().reset()
@@ -350,7 +427,7 @@ class PointerScanner(SubScript):
         self.ui.get_element("PS_BUTTON_STOP").hide()
         self.ui.get_element("PS_ROW_STATUS").hide()
         self.ui.get_element("PS_BUTTON_START").show()
-        [self.ui.get_element(ctrl_name).enable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET']]
+        [self.ui.get_element(ctrl_name).enable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET', 'PS_SELECT_SAVED_MAP']]
 
     def search_zero(self):
         self.memory_manager.get_searcher().reset()
@@ -359,13 +436,14 @@ class PointerScanner(SubScript):
         self.ui.get_element("PS_BUTTON_STOP").hide()
         self.ui.get_element("PS_TEXT_STATUS").set_text('No pointers found.')
         self.ui.get_element("PS_BUTTON_START").show()
-        [self.ui.get_element(ctrl_name).enable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET']]
+        [self.ui.get_element(ctrl_name).enable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET', 'PS_SELECT_SAVED_MAP']]
 
 
 
     def search_complete(self):
         print("search complete")
+        self.update_map_files()
         self.ui.get_element("PS_BUTTON_STOP").hide()
         self.ui.get_element("PS_ROW_STATUS").hide()
         self.ui.get_element("PS_BUTTON_START").show()
-        [self.ui.get_element(ctrl_name).enable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET']]
+        [self.ui.get_element(ctrl_name).enable() for ctrl_name in ['PS_INPUT_ADDRESS', 'PS_INPUT_MAX_OFFSET', 'PS_SELECT_MAX_DEPTH', 'PS_SELECT_SEARCH_REGIONS', 'PS_TOGGLE_NEGATIVE_OFFSET', 'PS_SELECT_SAVED_MAP']]
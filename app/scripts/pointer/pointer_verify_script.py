@@ -1,4 +1,3 @@
-import ctypes
 import json
 from pathlib import Path
 
@@ -6,6 +5,8 @@ from app.script_common import SubScript
 from app.script_common.memory import MemoryManager
 from app.script_ui import controls
 from app.script_ui.validators import address_match
+from .pointer_intersect import PathIntersection
+from .pointer_map import PointerMap
 
 
 class PointerVerify(SubScript):
@@ -19,12 +20,18 @@ class PointerVerify(SubScript):
             controls.Text("Pointer File:", width="125px"),
             controls.Select(values=[('none', 'None')], on_change=self.ctrl_changed, id='PV_SELECT_POINTER_FILE')])
 
+        page.add_elements([
+            controls.Text("Pointer Map:", width="125px"),
+            controls.Select(values=[('_live', 'Live Process')], on_change=self.ctrl_changed, id='PV_SELECT_POINTER_MAP')])
+
         page.add_elements([
             controls.Text("Current Address:", width="125px"),
             controls.Input(on_change=self.ctrl_changed, id='PV_INPUT_CURRENT_ADDRESS', trigger_by_focus=False),
             controls.advanced.PasteButton(on_click=self.on_paste, id='PV_PASTE_CURRENT_ADDRESS')])
 
-        page.add_elements([controls.Button("Verify", on_click=self.start_verify, id='PV_BUTTON_VERIFY')], id='PV_ROW_START_VERIFY')
+        page.add_elements([
+            controls.Button("Verify", on_click=self.start_verify, id='PV_BUTTON_VERIFY'),
+            controls.Button("Intersect Snapshots", on_click=self.start_intersect, id='PV_BUTTON_INTERSECT')], id='PV_ROW_START_VERIFY')
 
         page.add_elements([
             controls.Text("Number of Results:", width="145px"),
@@ -35,11 +42,12 @@ class PointerVerify(SubScript):
 
     def on_ready(self):
         [self.ui.get_element(x).hide() for x in ['PV_ROW_NUMBER_OF_RESULTS', 'PV_ROW_RESULTS']]
-        [self.ui.get_element(x).disable() for x in ['PV_BUTTON_VERIFY']]
+        [self.ui.get_element(x).disable() for x in ['PV_BUTTON_VERIFY', 'PV_BUTTON_INTERSECT']]
 
     def on_start(self):
         [self.ui.get_element(x).set_text("") for x in ['PV_INPUT_CURRENT_ADDRESS']]
         self.ui.get_element('PV_SELECT_POINTER_FILE').set_values(self.get_pointer_files())
+        self.ui.get_element('PV_SELECT_POINTER_MAP').set_values(self.get_map_files())
         self.on_ready()
 
     def on_clipboard_copy(self, data):
@@ -87,6 +95,10 @@ class PointerVerify(SubScript):
     def check_for_verify(self):
         addr = self.ui.get_element("PV_INPUT_CURRENT_ADDRESS").get_text()
         fname = self.ui.get_element("PV_SELECT_POINTER_FILE").get_selection()
+        if PointerMap.available() and Path(self.get_directory()).joinpath(fname).is_file() and any(Path(self.get_directory()).glob("*.pmap")):
+            self.ui.get_element("PV_BUTTON_INTERSECT").enable()
+        else:
+            self.ui.get_element("PV_BUTTON_INTERSECT").disable()
         if len(addr) == 0 or not self.address_validator(addr) or not Path(self.get_directory()).joinpath(fname).exists():
             self.ui.get_element("PV_BUTTON_VERIFY").disable()
             return
@@ -99,40 +111,78 @@ class PointerVerify(SubScript):
             files = [('_null', '')]
         return files
 
-    def _find_address(self, ptr):
-        for process in self.memory_manager.get_process_map():
+    def get_map_files(self):
+        files = [('_live', 'Live Process')]
+        if PointerMap.available():
+            files.extend([(p.name, p.name) for p in Path(self.get_directory()).glob("*.pmap")])
+        return files
+
+    def _find_address(self, ptr, process_map):
+        for process in process_map:
             if process['pathname'] == ptr['path'] and process['map_index'] == ptr['node']:
                 return process['start'] + ptr['base_offset']
         return None
 
-    def start_verify(self, name, ele_id, data):
-        current_address = int(self.ui.get_element("PV_INPUT_CURRENT_ADDRESS").get_text(), 16)
+    def _with_addresses(self, items, *process_maps):
+        pointers = []
+        for item in items:
+            for process_map in process_maps:
+                new_address = self._find_address(item, process_map)
+                if new_address:
+                    new_item = item.copy()
+                    new_item['address'] = new_address
+                    pointers.append(new_item)
+                    break
+        return pointers
+
+    def load_ptr_file(self):
         ptr_file = Path(self.get_directory()).joinpath(self.ui.get_element("PV_SELECT_POINTER_FILE").get_selection())
         with ptr_file.open(mode='rt') as f:
-            orig_data = json.load(f)
-        data = orig_data.copy()
+            return json.load(f)
 
-        pointers = []
-        for item in data:
-            new_address = self._find_address(item)
-            if new_address:
-                new_item = item.copy()
-                new_item['address'] = new_address
-                pointers.append(new_item)
-
-        valid_pointers = []
-        for pointer in pointers:
-            address = pointer['address']
+    def start_verify(self, name, ele_id, data):
+        current_address = int(self.ui.get_element("PV_INPUT_CURRENT_ADDRESS").get_text(), 16)
+        data = self.load_ptr_file()
+
+        #a saved pointer map verifies against the session it was built in, without reading the process
+        map_name = self.ui.get_element("PV_SELECT_POINTER_MAP").get_selection()
+        if map_name and map_name != '_live' and Path(self.get_directory()).joinpath(map_name).exists():
+            pointer_map = PointerMap.load(Path(self.get_directory()).joinpath(map_name))
+            intersection = PathIntersection(data)
+            intersection.add_snapshot(pointer_map, current_address)
+            pointer_map.close()
+            self.verify_complete(self._with_addresses(intersection.get_pointers(), self.memory_manager.get_process_map(), pointer_map.get_regions()))
+            return
+
+        pointers = self._with_addresses(data, self.memory_manager.get_process_map())
+        resolved = self.memory_manager.read_pointers([(x['address'], x['offsets']) for x in pointers])
+        self.verify_complete([pointer for pointer, address in zip(pointers, resolved) if address == current_address])
+
+    def get_snapshots(self):
+        """
+        The saved pointer maps that know the address their scan looked for.
+        """
+        snapshots = []
+        for path in sorted(Path(self.get_directory()).glob("*.pmap")):
             try:
-                for offset in pointer['offsets']:
-                    read = self.get_memory().read_memory(address, ctypes.c_uint64()).value
-                    read = read + offset
-                    address = read
-                if address == current_address:
-                    valid_pointers.append(pointer)
-            except Exception:
+                pointer_map = PointerMap.load(path)
+            except (OSError, ValueError):
                 continue
-        self.verify_complete(valid_pointers)
+            if pointer_map.get_target() is not None:
+                snapshots.append(pointer_map)
+        return snapshots
+
+    def start_intersect(self, name, ele_id, data):
+        """
+        Keep the paths of the pointer file that resolve to the target of every saved snapshot.
+        """
+        intersection = PathIntersection(self.load_ptr_file())
+        snapshots = self.get_snapshots()
+        for pointer_map in snapshots:
+            remaining = intersection.add_snapshot(pointer_map, pointer_map.get_target())
+            print("{} paths left after {}".format(remaining, pointer_map.path.name))
+            pointer_map.close()
+        self.verify_complete(self._with_addresses(intersection.get_pointers(), self.memory_manager.get_process_map(), *[x.get_regions() for x in snapshots]))
 
     def get_pointer_list_html(self, valid_pointers):
         html ='hello'
@@ -11,10 +11,15 @@ from math import isnan
 from app.script_common import BaseScript
 from app.script_ui import controls
 from app.script_ui.validators import address_match, region_match
-from .trend_calculator import calculate_trend
+from .trend_calculator import calculate_trend, calculate_trend_array
 from .trend_results import TrendResultsGroup
 from .trend_row import TrendRow
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class TrendSearch(BaseScript):
     TREND_STATE_PROC = 0
@@ -301,11 +306,17 @@ class TrendSearch(BaseScript):
         tp: controls.Select = self.ui.get_element("SELECT_VALUE_TYPE")
         path: Path = self.get_data("CAPTURE_PATH")
         cap_info = json.loads(path.joinpath("capture_info").read_text())
-        data = self.load_captures(size=tp.get_selection(), signed=sg.is_checked())
-        valid_keys = calculate_trend(tr.get_trend_list(), data)
-        new_data = {}
-        for k in valid_keys:
-            new_data[k] = data[k]
+        if np is not None:
+            keys, values = self.load_capture_array(size=tp.get_selection(), signed=sg.is_checked())
+            valid_keys = calculate_trend_array(tr.get_trend_list(), values, keys)
+            columns = {k: i for i, k in enumerate(keys)}
+            new_data = {k: values[:, columns[k]].tolist() for k in valid_keys}
+        else:
+            data = self.load_captures(size=tp.get_selection(), signed=sg.is_checked())
+            valid_keys = calculate_trend(tr.get_trend_list(), data)
+            new_data = {}
+            for k in valid_keys:
+                new_data[k] = data[k]
         self.put_data("CURRENT_TREND_DATA", new_data)
         cast(TrendResultsGroup, self.ui.get_element("GROUP_TREND_RESULTS")).set_trend_data(new_data, cap_info)
         if len(valid_keys) > 0:
@@ -315,6 +326,22 @@ class TrendSearch(BaseScript):
         self.ui.get_element("TEXT_TREND_RESULT_STATUS").show()
 
 
+    def load_capture_array(self, size: str, signed: bool):
+        """
+        The captures as a (samples x addresses) numpy array of the value type and the key, the offset in the capture,
+        of every column. A partial value at the end of the capture is left out.
+        """
+        if size == 'float':
+            dtype = np.dtype('<f4')
+        else:
+            dtype = np.dtype('<{}{}'.format('i' if signed else 'u', {'byte_1': 1, 'byte_2': 2, 'byte_8': 8}.get(size, 4)))
+        files = [f.read_bytes() for f in self.get_capture_files()]
+        length = min([len(x) for x in files], default=0) // dtype.itemsize * dtype.itemsize
+        values = np.array([np.frombuffer(x, dtype=dtype, count=length // dtype.itemsize) for x in files], dtype=dtype).reshape(len(files), length // dtype.itemsize)
+        if size == 'float':
+            values[np.isnan(values)] = 0.0
+        return list(range(0, length, dtype.itemsize)), values
+
     def load_captures(self, size: str, signed: bool) -> dict:
         data = {}
         for f in self.get_capture_files():
@@ -1,3 +1,7 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class TrendBreak(Exception):
     pass
@@ -11,54 +15,73 @@ def fix_trend_list(trend_list: list):
             nt.append(t)
     return nt
 
+TREND_TOKENS = ('flat', 'up', 'incline', 'down', 'decline')
+
+
 def find_trends(data: list):
+    """
+    The trend list of a series of values. Every run of equal steps is one trend, a run of unchanged values is flat, a
+    single rise or fall is up or down and a longer one is an incline or a decline.
+    """
     tl = []
-    ol = data.copy()
-    while True:
-        if len(ol) <= 1:
-            return tl
-        elif len(ol) == 2:
-            if ol[0] == ol[1]:
-                tl.append('flat')
-            elif ol[0] > ol[1]:
-                tl.append('down')
-            else:
-                tl.append('up')
-            return tl
-        else:
-            if ol[0] == ol[1]: #flat
-                tl.append('flat')
-                try:
-                    res = ol.index(list(filter(lambda i: i != ol[0], ol))[0])
-                except IndexError:
-                    return tl
-                ol = ol[res-1:]
-            elif ol[0] < ol[1]: #incline or up
-                if ol[1] < ol[2]: #this is an incline
-                    tl.append('incline')
-                    res = 0
-                    for i in range(0, len(ol) - 1):
-                        if ol[i + 1] > ol[i]:
-                            res += 1
-                        else:
-                            break
-                    ol = ol[res:]
-                else: #spike up ol[2] == ol[1] or ol[2] < ol[1]
-                    tl.append('up')
-                    ol.pop(0)
-            elif ol[0] > ol[1]: #decline or down
-                if ol[1] > ol[2]: #this is an decline
-                    tl.append('decline')
-                    res = 0
-                    for i in range(0, len(ol)-1):
-                        if ol[i+1] < ol[i]:
-                            res += 1
-                        else:
-                            break
-                    ol = ol[res:]
-                else: #spike down ol[2] == ol[1] or ol[2] > ol[1]
-                    tl.append('down')
-                    ol.pop(0)
+    previous = None
+    length = 0
+    for i in range(0, len(data) - 1):
+        step = (data[i+1] > data[i]) - (data[i+1] < data[i])
+        if step == previous:
+            length += 1
+            continue
+        if previous is not None:
+            tl.append(_trend_token(previous, length))
+        previous = step
+        length = 1
+    if previous is not None:
+        tl.append(_trend_token(previous, length))
+    return tl
+
+
+def _trend_token(step: int, length: int):
+    if step == 0:
+        return 'flat'
+    if step > 0:
+        return 'incline' if length > 1 else 'up'
+    return 'decline' if length > 1 else 'down'
+
+
+def find_trends_array(values):
+    """
+    The trend lists of every column of a (samples x addresses) numpy array at once.
+
+    The signs of the steps are run length encoded for all columns together, the runs are coded like find_trends and
+    the codes of each column are packed into one row, so columns with the same trend list share one row.
+    Returns the distinct trend lists and the index of the trend list of every column.
+    """
+    count = values.shape[1]
+    if values.shape[0] < 2 or count == 0:
+        return [[]], np.zeros(count, dtype=np.intp)
+    after, before = values[1:], values[:-1]
+    steps = (after > before).astype(np.int8) - (after < before).astype(np.int8)
+    starts = np.ones(steps.shape, dtype=bool)
+    starts[1:] = steps[1:] != steps[:-1]
+    #only the first step of every run is looked at, sorted by column with the runs of a column in order
+    runs, columns = np.nonzero(starts)
+    order = np.argsort(columns, kind='stable')
+    runs, columns = runs[order], columns[order]
+    step = steps[runs, columns]
+    longer = np.zeros(len(runs), dtype=bool)
+    inside = runs + 1 < len(steps)
+    longer[inside] = ~starts[runs[inside] + 1, columns[inside]]
+    codes = np.where(step == 0, 0, np.where(step > 0, 1, 3) + longer).astype(np.int8)
+    #the n-th run of a column goes to column n of its row
+    first = np.searchsorted(columns, columns)
+    position = np.arange(len(runs)) - first
+    packed = np.full((count, position.max() + 1), -1, dtype=np.int8)
+    packed[columns, position] = codes
+    #rows compared as single byte strings
+    rows = packed.view(np.dtype((np.void, packed.shape[1]))).reshape(-1)
+    unique, inverse = np.unique(rows, return_inverse=True)
+    unique = np.frombuffer(unique.tobytes(), dtype=np.int8).reshape(len(unique), packed.shape[1])
+    return [[TREND_TOKENS[x] for x in row if x >= 0] for row in unique.tolist()], inverse.reshape(-1)
 
 
 def is_sub(sub, lst):
@@ -68,62 +91,84 @@ def is_sub(sub, lst):
             return True, i
     return False, 0
 
-def calculate_trend(trend_list: list, data: dict) -> list:
-    valid_keys = []
-    for key in sorted(data.keys()):
-        tl = find_trends(data[key])
-        ol = tl.copy()
-        dl = trend_list.copy()
-        match_percent = 1.0
-        sub_check = False
-        while True:
-            if len(ol) == 0:
-                break
-            sub, start = is_sub(dl, ol)
-            if dl == ol:
-                valid_keys.append((key, match_percent))
-                break
-            elif sub and not sub_check:
-                sub_check = True
-                after = ol[start+len(dl):]
-                before = ol[:start]
-                had_downs = any(x == 'down' or x == 'decline' for x in before) or any(x == 'down' or x == 'decline' for x in after)
-                had_ups = any(x == 'up' or x == 'incline' for x in before) or any(x == 'up' or x == 'incline' for x in after)
-                if not(had_downs and had_ups):
-                    valid_keys.append((key, match_percent))
-                    break
-            else:
-                sub_check = False
-                if ol[0] == 'flat':
-                    ol.pop(0)
-                    if dl[0] != 'flat':
-                        match_percent -= 0.1
-                    else:
-                        dl.pop(0)
-                    continue
-                elif ol[-1] == 'flat':
-                    ol.pop()
-                    if dl[-1] != 'flat':
-                        match_percent -= 0.1
-                    else:
-                        dl.pop()
-                    continue
-                if 'incline' not in dl and 'incline' in ol:
-                    ol = list(map(lambda x: x.replace('incline', 'up'), ol))
-                    match_percent -= 0.1
-                    continue
-                elif 'decline' not in dl and 'decline' in ol:
-                    ol = list(map(lambda x: x.replace('decline', 'down'), ol))
+def match_trend(trend_list: list, tl: list):
+    """
+    How well the trend list of a value matches the requested trend_list, 1.0 for an exact match and 0.1 less for every
+    flat, incline or decline that had to be ignored. None if it does not match.
+    """
+    ol = tl.copy()
+    dl = trend_list.copy()
+    match_percent = 1.0
+    sub_check = False
+    while True:
+        if len(ol) == 0:
+            return None
+        sub, start = is_sub(dl, ol)
+        if dl == ol:
+            return match_percent
+        elif sub and not sub_check:
+            sub_check = True
+            after = ol[start+len(dl):]
+            before = ol[:start]
+            had_downs = any(x == 'down' or x == 'decline' for x in before) or any(x == 'down' or x == 'decline' for x in after)
+            had_ups = any(x == 'up' or x == 'incline' for x in before) or any(x == 'up' or x == 'incline' for x in after)
+            if not(had_downs and had_ups):
+                return match_percent
+        else:
+            sub_check = False
+            if ol[0] == 'flat':
+                ol.pop(0)
+                if not dl or dl[0] != 'flat':
                     match_percent -= 0.1
-                    continue
-                if 'flat' not in dl and 'incline' not in ol and 'decline' not in ol and 'flat' in ol:
-                    ol = [x for x in ol if x != 'flat']
+                else:
+                    dl.pop(0)
+                continue
+            elif ol[-1] == 'flat':
+                ol.pop()
+                if not dl or dl[-1] != 'flat':
                     match_percent -= 0.1
                 else:
-                    break
+                    dl.pop()
+                continue
+            if 'incline' not in dl and 'incline' in ol:
+                ol = list(map(lambda x: x.replace('incline', 'up'), ol))
+                match_percent -= 0.1
+                continue
+            elif 'decline' not in dl and 'decline' in ol:
+                ol = list(map(lambda x: x.replace('decline', 'down'), ol))
+                match_percent -= 0.1
+                continue
+            if 'flat' not in dl and 'incline' not in ol and 'decline' not in ol and 'flat' in ol:
+                ol = [x for x in ol if x != 'flat']
+                match_percent -= 0.1
+            else:
+                return None
+
+def calculate_trend(trend_list: list, data: dict) -> list:
+    valid_keys = []
+    matches = {}
+    for key in sorted(data.keys()):
+        tl = tuple(find_trends(data[key]))
+        if tl not in matches:
+            matches[tl] = match_trend(trend_list, list(tl))
+        if matches[tl] is not None:
+            valid_keys.append((key, matches[tl]))
     valid_keys.sort(key=lambda x: x[1], reverse=True)
     return [x[0] for x in valid_keys]
 
+def calculate_trend_array(trend_list: list, values, keys: list) -> list:
+    """
+    calculate_trend for a (samples x addresses) numpy array of captures, keys holds the key of every column in
+    ascending order. Every distinct trend list is matched once.
+    """
+    trends, inverse = find_trends_array(values)
+    percents = np.array([match_trend(trend_list, x) for x in trends], dtype=np.float64)
+    percents[np.isnan(percents)] = -np.inf #match_trend returned None
+    column = percents[inverse]
+    matched = np.flatnonzero(column > -np.inf)
+    order = matched[np.argsort(-column[matched], kind='stable')]
+    return [keys[x] for x in order.tolist()]
+
 def calculate_trend2(trend_list: list, data: dict) -> list:
     valid_keys = []
     original_trend_list = fix_trend_list(trend_list)
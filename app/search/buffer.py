@@ -1,11 +1,19 @@
 import ctypes
 from typing import Union
 
+from app.helpers.aob_matcher import AOBMatcher
+from app.helpers.buffer_pool import BufferPool
 from app.helpers.exceptions import BufferException
 from app.search.converters import FloatConvert
 from app.search.operations import ValueOperation, MemoryOperation, EqualFloat
+from app.search.result_transport import ResultArrays
 from app.search.value import Value, FloatValue, IntValue, AOB
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, ctypes.Union]
 
 class SearchBuffer:
@@ -40,13 +48,62 @@ class SearchBuffer:
             self.result_callback(results)
             results.clear()
 
+    def add_indexed_results(self, results, indices, values):
+        if len(indices) == 0:
+            return
+        offsets = self._index_to_address(indices) if self.aligned else indices
+        if isinstance(results, ResultArrays):
+            results.append_arrays(offsets + self.start_offset, values)
+            if self.result_callback and len(results) >= self.result_threshold:
+                self.result_callback(results)
+                results.clear()
+            return
+        addresses = (offsets + self.start_offset).tolist()
+        data = values.tobytes()
+        width = len(data) // len(addresses)
+        step = max(1, self.result_threshold)
+        for pos in range(0, len(addresses), step):
+            batch = addresses[pos:pos+step]
+            start = pos * width
+            results.extend(zip(batch, [data[i:i+width] for i in range(start, start + len(batch)*width, width)]))
+            if self.result_callback and len(results) >= self.result_threshold:
+                self.result_callback(results)
+                results.clear()
+
+    def as_array(self):
+        dtype = np.dtype(self.store_type)
+        size = memoryview(self.buffer).nbytes
+        if self.aligned:
+            return np.frombuffer(self.buffer, dtype=dtype, count=size // dtype.itemsize)
+        #unaligned values start at every byte, so view the buffer with a one byte stride
+        return np.ndarray(shape=(max(0, size - dtype.itemsize + 1),), dtype=dtype, buffer=self.buffer, strides=(1,))
+
+    def run_operation(self, operation, results: list, compare_buffer: "SearchBuffer" = None):
+        if np is not None:
+            current = self.as_array()
+            if compare_buffer is None:
+                hits = operation.mask(current)
+            else:
+                previous = compare_buffer.as_array()
+                length = min(len(current), len(previous))
+                current = current[:length]
+                hits = operation.mask(current, previous[:length])
+            if hits is not None:
+                indices = np.nonzero(hits)[0]
+                self.add_indexed_results(results, indices, operation.select(current, indices))
+                return
+        if compare_buffer is None:
+            operation.run(self, self.fb_cb, results)
+        else:
+            operation.run(self, compare_buffer, self.fb_cb, results)
+
     def compare_by_operation(self, compare_buffer: "SearchBuffer", operation: MemoryOperation):
         if type(self) != type(compare_buffer):
             raise BufferException("Cannot compare buffers of type {} and {}".format(str(type(self)), str(type(compare_buffer))))
         if not isinstance(operation, MemoryOperation):
             raise BufferException('Comparing buffers require a memory operation.')
         length = min(len(self), len(compare_buffer))
-        operation.run(self, compare_buffer, self.fb_cb, self.results)
+        self.run_operation(operation, self.results, compare_buffer)
         return length*self.store_size
 
     def read(self, index):
@@ -66,6 +123,14 @@ class SearchBuffer:
     def get_store_size(self):
         return self.store_size
 
+    def _haystack(self):
+        #pooled buffers are searched in place, anything else is copied to bytes once
+        source = BufferPool.shared().source(self.buffer)
+        if source is not None:
+            return source, ctypes.sizeof(self.buffer)
+        haystack = bytes(self.buffer)
+        return haystack, len(haystack)
+
     def get_start_offset(self):
         return self.start_offset
 
@@ -127,25 +192,25 @@ class IntSearchBuffer(SearchBuffer):
         return bytes(self.type_map[self.store_size](value))
 
     def _haystack_search(self, value: IntValue):
-        haystack = bytes(self.buffer)
+        haystack, length = self._haystack()
         needle = value.bytes
         start = 0
-        result = haystack.find(needle, start)
-        while start < len(haystack) and result != -1:
+        result = haystack.find(needle, start, length)
+        while start < length and result != -1:
             if (result+self.start_offset) % self.store_size == 0:
                 self.results.append((result+self.start_offset, needle))
                 if self.result_callback and len(self.results) >= self.result_threshold:
                     self.result_callback(self.results)
                     self.results.clear()
             start = result + 1
-            result = haystack.find(needle, start)
+            result = haystack.find(needle, start, length)
         if self.result_callback and len(self.results) >= self.result_threshold:
             self.result_callback(self.results)
             self.results.clear()
-        return len(haystack)
+        return length
 
     def find_by_operation(self, operation:ValueOperation, args=None):
-        operation.run(self, self.fb_cb, self.results)
+        self.run_operation(operation, self.results)
         return len(self.buffer)
 
 
@@ -164,12 +229,12 @@ class FloatSearchBuffer(SearchBuffer):
         search_value = value.get_comparable_value()
         length = self.__len__()
         op = EqualFloat(search_value)
-        op.run(self, self.fb_cb, self.results)
+        self.run_operation(op, self.results)
         return length*self.store_size
 
     def find_by_operation(self, operation: ValueOperation, args=None):
         length = self.__len__()
-        operation.run(self, self.fb_cb, self.results)
+        self.run_operation(operation, self.results)
         return length * self.store_size
 
     def _read(self, index):
@@ -187,57 +252,26 @@ class AOBSearchBuffer(SearchBuffer):
     def find_value(self, value: AOB):
         return self._haystack_search(value)
 
-    def aob_match(self, haystack, aob_bytes, start: int):
-        aob_index = -1
-        for i in range(start, start + len(aob_bytes)):
-            aob_index += 1
-            if aob_bytes[aob_index] >= 256:
-                continue
-            if int(haystack[i]) != aob_bytes[aob_index]:
-                return False
-        return True
-
-    def _haystack_find(self, haystack: bytes, needle: bytes, start: int, aob_bytes, search_offset: int):
-        while True:
-            result = haystack.find(needle, start)
-            if result == -1:
-                return -1
-            start = result-search_offset
-            if start < 0:
-                return -1
-            if start+len(aob_bytes) >= len(haystack):
-                return -1
-            if not self.aob_match(haystack, aob_bytes, start):
-                start += len(aob_bytes)
-                if start >= len(haystack):
-                    return -1
-                continue
-            break
-        return start
-
     def _haystack_search(self, value: AOB):
-        haystack = bytes(self.buffer)
-        needle = bytes(value.value.get_search_value())
-        start = 0
-        result = self._haystack_find(haystack, needle, start, value.value.aob_item['aob_bytes'], value.value.get_offset())
+        haystack, length = self._haystack()
         value_length = len(value.value.get_array())
-        while start < len(haystack) and result != -1:
-            self.results.append( (result+self.start_offset, bytes(self.buffer[result:result+value_length])) )
+        #the matcher finds the anchor run with find() and checks the wildcard pattern on every hit at once
+        found = AOBMatcher([value.value]).search(haystack, 0, length).get(value.value.get_string(), [])
+        for result in found:
+            self.results.append( (result+self.start_offset, bytes(haystack[result:result+value_length])) )
             if self.result_callback and len(self.results) >= self.result_threshold:
                 self.result_callback(self.results)
                 self.results.clear()
-            start = result + 1 + value.value.get_offset()
-            result = self._haystack_find(haystack, needle, start, value.value.aob_item['aob_bytes'], value.value.get_offset())
         if self.result_callback and len(self.results) > 0:
             self.result_callback(self.results)
             self.results.clear()
-        return len(haystack)
+        return length
 
     def find_by_operation(self, operation:ValueOperation, args=None):
         _type = ctypes.c_byte
         results = []
         length = len(self.buffer) - self.store_size
-        operation.run(self, self.fb_cb, results)
+        self.run_operation(operation, results)
         if self.result_callback and len(results) > 0:
             self.result_callback(results)
             results.clear()
@@ -1,7 +1,14 @@
 import ctypes
 from app.search.operations import MemoryOperation
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class ConstraintOperationFloat(MemoryOperation):
+    skip_unchanged = True
+
     def __init__(self, low_value, high_value, max_change):
         self.low = low_value
         self.high = high_value
@@ -13,6 +20,11 @@ class IncreaseOperationConstraintFloat(ConstraintOperationFloat):
         diff = current_and_previous_read[0] - current_and_previous_read[1]
         return 0.001 < diff <= self.max_change and self.low <= current_and_previous_read[0] <= self.high
 
+    def mask(self, current, previous):
+        current, previous = current.astype(np.float64), previous.astype(np.float64)
+        diff = current - previous
+        return (diff > 0.001) & (diff <= self.max_change) & (current >= self.low) & (current <= self.high)
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -36,6 +48,11 @@ class DecreaseOperationConstraintFloat(ConstraintOperationFloat):
         diff = current_and_previous_read[1] - current_and_previous_read[0]
         return 0.001 < diff <= self.max_change and self.low <= current_and_previous_read[0] <= self.high
 
+    def mask(self, current, previous):
+        current, previous = current.astype(np.float64), previous.astype(np.float64)
+        diff = previous - current
+        return (diff > 0.001) & (diff <= self.max_change) & (current >= self.low) & (current <= self.high)
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -1,8 +1,14 @@
 import ctypes
 from typing import TYPE_CHECKING, Union
 
+from app.helpers.aob_pattern import AOBPattern
 from app.helpers.exceptions import OperationException
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 if TYPE_CHECKING:
     from app.search.buffer import SearchBuffer
 
@@ -10,12 +16,36 @@ ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, cty
 
 
 class Operation:
+    #True when no value can match if memory did not change since the capture
+    skip_unchanged = False
+    #True when every value matches if memory did not change since the last round
+    keep_unchanged = False
+
     def __init__(self):
         pass
 
     def operation(self, *current_read) -> bool:
         return False
 
+    def mask(self, *current_read):
+        # vectorized form of operation() over NumPy views, None if the operation has none
+        return None
+
+    def select(self, current, indices):
+        return current[indices]
+
+def _as_float(values):
+    return values.astype(np.float64)
+
+def _difference_equals(current, previous, delta):
+    if current.dtype.itemsize < 8:
+        return current.astype(np.int64) - previous.astype(np.int64) == delta
+    # 8 byte values cannot be widened, so compare the wrapped difference and check the sign separately
+    wrapped = current - previous
+    if delta >= 0:
+        return (wrapped == (delta % (1 << 64))) & (current >= previous)
+    return (wrapped == (delta % (1 << 64))) & (current < previous)
+
 class MemoryOperation(Operation):
     def __init__(self):
         super().__init__()
@@ -27,9 +57,14 @@ class MemoryOperation(Operation):
         pass
 
 class DecreaseOperation(MemoryOperation):
+    skip_unchanged = True
+
     def operation(self, *current_and_previous_read):
         return current_and_previous_read[0] < current_and_previous_read[1]
 
+    def mask(self, current, previous):
+        return current < previous
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -47,9 +82,14 @@ class DecreaseOperation(MemoryOperation):
                     result_callback(result_list, i, buf1.ptr[i])
 
 class IncreaseOperation(MemoryOperation):
+    skip_unchanged = True
+
     def operation(self, *current_and_previous_read):
         return current_and_previous_read[0] > current_and_previous_read[1]
     
+    def mask(self, current, previous):
+        return current > previous
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -67,9 +107,14 @@ class IncreaseOperation(MemoryOperation):
                     result_callback(result_list, i, buf1.ptr[i])
 
 class UnchangedOperation(MemoryOperation):
+    keep_unchanged = True
+
     def operation(self, *current_and_previous_read):
         return current_and_previous_read[0] == current_and_previous_read[1]
 
+    def mask(self, current, previous):
+        return current == previous
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -87,9 +132,14 @@ class UnchangedOperation(MemoryOperation):
                     result_callback(result_list, i, buf1.ptr[i])
 
 class ChangedOperation(MemoryOperation):
+    skip_unchanged = True
+
     def operation(self, *current_and_previous_read):
         return current_and_previous_read[0] != current_and_previous_read[1]
 
+    def mask(self, current, previous):
+        return current != previous
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -109,9 +159,15 @@ class ChangedOperation(MemoryOperation):
 
 
 class DecreaseOperationFloat(MemoryOperation):
+    skip_unchanged = True
+
     def operation(self, *current_and_previous_read):
         return current_and_previous_read[1] - current_and_previous_read[0] > 0.001
     
+    def mask(self, current, previous):
+        current, previous = _as_float(current), _as_float(previous)
+        return previous - current > 0.001
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -129,9 +185,15 @@ class DecreaseOperationFloat(MemoryOperation):
                     result_callback(result_list, i, buf1.ptr[i])
 
 class IncreaseOperationFloat(MemoryOperation):
+    skip_unchanged = True
+
     def operation(self, *current_and_previous_read):
         return current_and_previous_read[0] - current_and_previous_read[1] > 0.001
 
+    def mask(self, current, previous):
+        current, previous = _as_float(current), _as_float(previous)
+        return current - previous > 0.001
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -152,6 +214,10 @@ class UnchangedOperationFloat(MemoryOperation):
     def operation(self, *current_and_previous_read):
         return -0.001 < current_and_previous_read[0] - current_and_previous_read[1] < 0.001
 
+    def mask(self, current, previous):
+        current, previous = _as_float(current), _as_float(previous)
+        return np.abs(current - previous) < 0.001
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -173,6 +239,10 @@ class ChangedOperationFloat(MemoryOperation):
     def operation(self, *current_and_previous_read):
         return not (-0.001 < current_and_previous_read[0] - current_and_previous_read[1] < 0.001)
 
+    def mask(self, current, previous):
+        current, previous = _as_float(current), _as_float(previous)
+        return ~(np.abs(current - previous) < 0.001)
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -193,10 +263,14 @@ class ChangedByOperation(MemoryOperation):
     def __init__(self, delta):
         super().__init__()
         self.delta = delta
+        self.skip_unchanged = abs(delta) > 0.001
 
     def operation(self, *current_and_previous_read):
         return current_and_previous_read[0] - current_and_previous_read[1] == self.delta
 
+    def mask(self, current, previous):
+        return _difference_equals(current, previous, self.delta)
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -218,6 +292,9 @@ class ChangedByOperationFloat(ChangedByOperation):
     def operation(self, *current_and_previous_read):
         return -0.001 <= (current_and_previous_read[0] - current_and_previous_read[1]) - self.delta <= 0.001
 
+    def mask(self, current, previous):
+        return np.abs((_as_float(current) - _as_float(previous)) - self.delta) <= 0.001
+
     def run(self, buf1: "SearchBuffer", buf2: "SearchBuffer", result_callback: callable, result_list: list):
         length = min(len(buf1), len(buf2))
         if not buf1.aligned:
@@ -253,11 +330,39 @@ class ArrayValueOperation(ValueOperation):
             self.user_args = v.aob_item['aob_bytes']
         elif type(args) is not list:
             raise OperationException("Array previous read is unknown.")
+        self.pattern = AOBPattern.compile(self.user_args)
+
+    def matches(self, current) -> bool:
+        if len(current) >= len(self.user_args):
+            return self.pattern.match(bytes(current))
+        #a short read only has to match the bytes it has
+        for i in range(0, len(current)):
+            if self.user_args[i] <= 255 and self.user_args[i] != current[i]:
+                return False
+        return True
+
+    def match_mask(self, current):
+        u_len = len(self.user_args)
+        count = len(current) - u_len + 1
+        if count <= 0:
+            return np.zeros(0, dtype=bool)
+        matches = np.ones(count, dtype=bool)
+        for j in range(0, u_len):
+            if self.user_args[j] > 255:
+                continue
+            matches &= current[j:j+count] == self.user_args[j]
+        return matches
+
+    def select(self, current, indices):
+        return np.lib.stride_tricks.sliding_window_view(current, len(self.user_args))[indices]
 
 class LessThan(ValueOperation):
     def operation(self, *current_read):
         return current_read[0] < self.user_args
 
+    def mask(self, current):
+        return current < self.user_args
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -277,6 +382,9 @@ class GreaterThan(ValueOperation):
     def operation(self, *current_read):
         return current_read[0] > self.user_args
 
+    def mask(self, current):
+        return current > self.user_args
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -296,6 +404,9 @@ class LessThanFloat(ValueOperation):
     def operation(self, *current_read):
         return self.user_args - current_read[0] > 0.001
 
+    def mask(self, current):
+        return self.user_args - _as_float(current) > 0.001
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -315,6 +426,9 @@ class GreaterThanFloat(ValueOperation):
     def operation(self, *current_read):
         return current_read[0] - self.user_args > 0.001
 
+    def mask(self, current):
+        return _as_float(current) - self.user_args > 0.001
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -335,6 +449,9 @@ class NotEqualInt(ValueOperation):
     def operation(self, *current_read) -> bool:
         return current_read[0] != self.user_args
 
+    def mask(self, current):
+        return current != self.user_args
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -354,6 +471,9 @@ class EqualInt(ValueOperation):
     def operation(self, *current_read) -> bool:
         return current_read[0] == self.user_args
 
+    def mask(self, current):
+        return current == self.user_args
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -371,14 +491,10 @@ class EqualInt(ValueOperation):
 
 class NotEqualArray(ArrayValueOperation):
     def operation(self, *current_read) -> bool:
-        for i in range(0, len(self.user_args)):
-            if i >= len(current_read[0]):
-                continue
-            if self.user_args[i] > 255:
-                continue
-            if self.user_args[i] != current_read[0][i]:
-                return True
-        return False
+        return not self.matches(current_read[0])
+
+    def mask(self, current):
+        return ~self.match_mask(current)
 
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         u_len = len(self.user_args)
@@ -397,38 +513,24 @@ class NotEqualArray(ArrayValueOperation):
 
 class EqualArray(NotEqualArray):
     def operation(self, *current_read) -> bool:
-        for i in range(0, len(self.user_args)):
-            if i >= len(current_read[0]):
-                continue
-            if self.user_args[i] > 255:
-                continue
-            if self.user_args[i] != current_read[0][i]:
-                return False
-        return True
+        return self.matches(current_read[0])
+
+    def mask(self, current):
+        return self.match_mask(current)
 
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         u_len = len(self.user_args)
-        length = len(buffer)
-        i = 0
-        while i < length-u_len:
-            read = buffer.ptr[i:i+u_len]
-            i += 1
-            found = True
-            for j in range(0, len(self.user_args)):
-                if self.user_args[j] > 255:
-                    continue
-                if self.user_args[j] != read[j]:
-                    i += j
-                    found = False
-                    break
-            if found:
-                i += u_len-1
-                result_callback(result_list, i, read)
+        haystack, length = buffer._haystack()
+        for i in self.pattern.finditer(haystack, length):
+            result_callback(result_list, i, buffer.ptr[i:i+u_len])
 
 class NotEqualFloat(ValueOperation):
     def operation(self, *current_read) -> bool:
         return not (-0.001 < self.user_args - current_read[0] < 0.001)
 
+    def mask(self, current):
+        return ~(np.abs(self.user_args - _as_float(current)) < 0.001)
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -448,6 +550,9 @@ class EqualFloat(NotEqualFloat):
     def operation(self, *current_read) -> bool:
         return -0.001 < self.user_args - current_read[0] < 0.001
 
+    def mask(self, current):
+        return np.abs(self.user_args - _as_float(current)) < 0.001
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -467,6 +572,9 @@ class Between(ValueOperation):
     def operation(self, *current_read) -> bool:
         return self.user_args[0] < current_read[0] < self.user_args[1]
 
+    def mask(self, current):
+        return (current > self.user_args[0]) & (current < self.user_args[1])
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -486,6 +594,10 @@ class BetweenFloat(ValueOperation):
     def operation(self, *current_read) -> bool:
         return self.user_args[0] < current_read[0] < self.user_args[1]
 
+    def mask(self, current):
+        current = _as_float(current)
+        return (current > self.user_args[0]) & (current < self.user_args[1])
+
     def run(self, buffer: "SearchBuffer", result_callback: callable, result_list: list):
         length = len(buffer)
         if not buffer.aligned:
@@ -0,0 +1,82 @@
+import zlib
+from array import array
+from bisect import bisect_left
+
+
+class PageHashes:
+    """
+    CRC32 of every 4 KiB page that held a result in the last continue round.
+
+    Pages are kept sorted in two flat arrays. A page whose hash did not move since the last round still holds the values
+    stored in the previous result table, so its results can be dropped or kept without comparing them one by one.
+    """
+    PAGE_SIZE = 4096
+
+    def __init__(self, pages: array = None, hashes: array = None, table: str = None):
+        self.pages = pages if pages is not None else array('Q')
+        self.hashes = hashes if hashes is not None else array('I')
+        self.table = table
+
+    def __getstate__(self):
+        #hashes are handed to worker processes as slices, do not pickle them along with the searcher
+        return {'pages': array('Q'), 'hashes': array('I'), 'table': self.table}
+
+    def __len__(self):
+        return len(self.pages)
+
+    @staticmethod
+    def page(address: int):
+        return address & ~(PageHashes.PAGE_SIZE - 1)
+
+    @staticmethod
+    def hash(data):
+        return zlib.crc32(data)
+
+    @staticmethod
+    def group_by_page(rows):
+        page = None
+        group = []
+        for row in rows:
+            row_page = row[0] & ~(PageHashes.PAGE_SIZE - 1)
+            if row_page != page:
+                if group:
+                    yield page, group
+                page = row_page
+                group = []
+            group.append(row)
+        if group:
+            yield page, group
+
+    def clear(self):
+        self.pages = array('Q')
+        self.hashes = array('I')
+        self.table = None
+
+    def valid_for(self, table: str):
+        return self.table == table and len(self.pages) > 0
+
+    def get(self, page: int):
+        index = bisect_left(self.pages, page)
+        if index < len(self.pages) and self.pages[index] == page:
+            return self.hashes[index]
+        return None
+
+    def add(self, page: int, crc: int):
+        self.pages.append(page)
+        self.hashes.append(crc)
+
+    def slice(self, first_page: int, last_page: int):
+        start = bisect_left(self.pages, first_page)
+        stop = bisect_left(self.pages, last_page + 1)
+        return self.pages[start:stop], self.hashes[start:stop]
+
+    def merge(self, pages: array, hashes: array):
+        self.pages.extend(pages)
+        self.hashes.extend(hashes)
+
+    def sort(self):
+        if all(self.pages[i] < self.pages[i+1] for i in range(0, len(self.pages) - 1)):
+            return
+        ordered = sorted(zip(self.pages, self.hashes))
+        self.pages = array('Q', [x[0] for x in ordered])
+        self.hashes = array('I', [x[1] for x in ordered])
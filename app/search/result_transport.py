@@ -0,0 +1,110 @@
+try:
+    import numpy as np
+    from multiprocessing import shared_memory
+except ImportError:
+    np = None
+
+
+class ResultArrays:
+    """
+    Collects search hits as address and value arrays instead of (address, bytes) tuples.
+
+    Scan workers hand the arrays to the parent through a SharedMemory block, so only the block name and the hit count
+    travel through the pool pipe. It also accepts tuples for the search paths that still produce them.
+    """
+    def __init__(self):
+        self.addresses = []
+        self.values = []
+        self.width = 0
+        self.count = 0
+        self._rows = []
+
+    def __len__(self):
+        return self.count + len(self._rows)
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    def append(self, row):
+        self._rows.append(row)
+
+    def extend(self, rows):
+        self._rows.extend(rows)
+
+    def clear(self):
+        self.addresses = []
+        self.values = []
+        self.count = 0
+        self._rows = []
+
+    def append_arrays(self, addresses, values):
+        if len(addresses) == 0:
+            return
+        self._flush_rows()
+        values = np.ascontiguousarray(values).view(np.uint8).reshape(len(addresses), -1)
+        self.width = values.shape[1]
+        self.addresses.append(np.asarray(addresses, dtype=np.uint64))
+        self.values.append(values)
+        self.count += len(addresses)
+
+    def _flush_rows(self):
+        if not self._rows:
+            return
+        rows = self._rows
+        self._rows = []
+        self.width = len(rows[0][1])
+        self.addresses.append(np.array([x[0] for x in rows], dtype=np.uint64))
+        self.values.append(np.frombuffer(b''.join([x[1] for x in rows]), dtype=np.uint8).reshape(len(rows), self.width))
+        self.count += len(rows)
+
+    def arrays(self):
+        """
+        All hits as one address array and one (count, width) value array, None when there are no hits.
+        """
+        self._flush_rows()
+        if self.count == 0:
+            return None
+        return np.concatenate(self.addresses), np.concatenate(self.values)
+
+    def share(self):
+        """
+        Copy the hits into a new SharedMemory block and return its handle, the receiver unlinks the block.
+        """
+        self._flush_rows()
+        if self.count == 0:
+            return None
+        block = shared_memory.SharedMemory(create=True, size=self.count * (8 + self.width))
+        try:
+            addresses = np.ndarray((self.count,), dtype=np.uint64, buffer=block.buf)
+            values = np.ndarray((self.count, self.width), dtype=np.uint8, buffer=block.buf, offset=self.count * 8)
+            pos = 0
+            for chunk_addresses, chunk_values in zip(self.addresses, self.values):
+                addresses[pos:pos+len(chunk_addresses)] = chunk_addresses
+                values[pos:pos+len(chunk_addresses)] = chunk_values
+                pos += len(chunk_addresses)
+            del addresses, values
+            return {'name': block.name, 'count': self.count, 'width': self.width}
+        finally:
+            block.close()
+
+    @staticmethod
+    def receive(handle):
+        """
+        Attach to a block made by share() and return copies of its address and value arrays. The block is unlinked.
+        """
+        block = shared_memory.SharedMemory(name=handle['name'])
+        try:
+            count, width = handle['count'], handle['width']
+            addresses = np.ndarray((count,), dtype=np.uint64, buffer=block.buf).copy()
+            values = np.ndarray((count, width), dtype=np.uint8, buffer=block.buf, offset=count * 8).copy()
+        finally:
+            block.close()
+            block.unlink()
+        return addresses, values
+
+    @staticmethod
+    def discard(handle):
+        block = shared_memory.SharedMemory(name=handle['name'])
+        block.close()
+        block.unlink()
@@ -0,0 +1,88 @@
+import time
+
+
+class RegionScheduler:
+    """
+    Splits memory regions into scan tasks for the worker pool.
+
+    Big regions are cut into chunks, tiny mappings are merged into one task and the tasks are queued largest first. The
+    pool hands out one task at a time, so a worker that is done pulls the next task from the shared queue and the
+    small tasks at the end of the queue fill the gaps instead of one worker scanning a 2GB heap alone.
+    """
+    tasks_per_worker = 8
+    min_chunk = 1048576
+    max_chunk = 32 * 1048576
+    page_size = 4096
+
+    def __init__(self, workers: int, store_size: int = 1):
+        self.workers = max(1, workers)
+        self.store_size = max(1, store_size)
+
+    def chunk_size(self, total: int):
+        size = total // (self.workers * self.tasks_per_worker)
+        size = min(self.max_chunk, max(self.min_chunk, size))
+        #keep chunks page aligned and a multiple of the value size so aligned values never straddle two tasks
+        step = self.page_size * self.store_size
+        return max(step, size - (size % step))
+
+    def schedule(self, regions):
+        """
+        Build the tasks for a list of (start, stop) regions. Each task is a list of {'start', 'size'} dicts.
+        """
+        regions = [(start, stop - start) for start, stop in regions if stop > start]
+        chunk = self.chunk_size(sum(size for _, size in regions))
+        tasks = []
+        small = []
+        small_size = 0
+        for start, size in regions:
+            if size < chunk // 2:
+                small.append({'start': start, 'size': size})
+                small_size += size
+                if small_size >= chunk:
+                    tasks.append(small)
+                    small = []
+                    small_size = 0
+                continue
+            pos = start
+            while pos < start + size:
+                part = min(chunk, start + size - pos)
+                if start + size - pos - part < chunk // 2:
+                    part = start + size - pos #do not leave a sliver behind
+                tasks.append([{'start': pos, 'size': part}])
+                pos += part
+        if small:
+            tasks.append(small)
+        tasks.sort(key=lambda x: sum(r['size'] for r in x), reverse=True)
+        return tasks
+
+
+class WorkerStats:
+    """
+    Busy and idle time of every pool worker during one search.
+
+    Busy time is measured inside the worker around each task, idle time is the rest of the search wall time.
+    """
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+        self.start = time.perf_counter()
+        self.stop = None
+        self.busy = {}
+        self.tasks = {}
+
+    def record(self, worker, busy: float):
+        self.busy[worker] = self.busy.get(worker, 0.0) + busy
+        self.tasks[worker] = self.tasks.get(worker, 0) + 1
+
+    def finish(self):
+        if self.stop is None:
+            self.stop = time.perf_counter()
+
+    def elapsed(self):
+        return (self.stop if self.stop is not None else time.perf_counter()) - self.start
+
+    def get(self):
+        elapsed = self.elapsed()
+        workers = [{'worker': worker, 'tasks': self.tasks[worker], 'busy': busy, 'idle': max(0.0, elapsed - busy)} for worker, busy in sorted(self.busy.items())]
+        count = max(self.workers, len(workers))
+        utilization = sum(self.busy.values()) / (elapsed * count) if elapsed > 0 and count > 0 else 0.0
+        return {'elapsed': elapsed, 'utilization': min(1.0, utilization), 'workers': workers}
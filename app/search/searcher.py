@@ -9,14 +9,26 @@ from mem_edit import Process
 
 import app.helpers.process as ps
 from app.helpers.aob_value import AOBValue
+from app.helpers.buffer_pool import BufferPool
+from app.helpers.byte_frequency import ByteFrequency
+from app.helpers.columnar_results import ColumnarResults
 from app.helpers.directory_utils import memory_directory
 from app.helpers.exceptions import BreakException
 from app.helpers.exceptions import SearchException
+from app.helpers.prefetch_reader import PrefetchReader
 from app.helpers.progress import Progress
+from app.helpers.scatter_read import read_pages
 from app.helpers.search_results import SearchResults
 from app.search.buffer import SearchBuffer
 from app.search.operations import Operation, MemoryOperation, EqualInt, EqualFloat, EqualArray
-from app.search.value import Value, IntValue
+from app.search.page_hashes import PageHashes
+from app.search.snapshot import Snapshot, CompressedSnapshot
+from app.search.value import Value, IntValue, FloatValue, AOB
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, ctypes.Union]
 
@@ -45,14 +57,16 @@ class Searcher:
         self.search_size = None
         self.signed = False
         self.results: SearchResults = None
-        self.capture_files = []
         self.cancel_search = False
         self.cancel_event = None
         self.max_capture_size = 25600000
         self.mem_path = directory
+        self.snapshot = Snapshot(directory.joinpath('capture.snap'))
+        self.page_hashes = PageHashes()
         self.last_search_type = Searcher.SEARCH_RETURN_NONE
         self.result_progress_threshold = 1000
         self.result_write_threshold = 10000
+        self.byte_frequency = None
         if results is None:
             self.results = SearchResults('results', db_path=directory.joinpath('scripts.db'))
         else:
@@ -77,6 +91,7 @@ class Searcher:
                 self.progress.add_constraint(0, self.total_size, 1.0)
         elif search_type == self.SEARCH_TYPE_COMPARE_CAPTURE:
             #self.signed = False
+            self.page_hashes.clear()
             if self.progress:
                 self.progress.reset()
                 self.progress.add_constraint(0, self.total_size, 1.0)
@@ -84,6 +99,7 @@ class Searcher:
             with self.results.db() as conn:
                 self.results.create_result_table(conn)
         elif search_type == self.SEARCH_TYPE_VALUE or search_type == self.SEARCH_TYPE_OPERATION:
+            self.page_hashes.clear()
             self.results.delete_database()
             with self.results.db() as conn:
                 self.results.create_result_table(conn)
@@ -157,6 +173,18 @@ class Searcher:
     def set_aligned(self, aligned):
         self.aligned = aligned
 
+    def set_capture_compression(self, enabled: bool):
+        if enabled == isinstance(self.snapshot, CompressedSnapshot):
+            return
+        self.snapshot.delete()
+        if enabled:
+            self.snapshot = CompressedSnapshot(self.mem_path.joinpath('capture.snapz'))
+        else:
+            self.snapshot = Snapshot(self.mem_path.joinpath('capture.snap'))
+
+    def get_capture_compression(self):
+        return isinstance(self.snapshot, CompressedSnapshot)
+
     def get_aligned(self):
         return self.aligned
 
@@ -176,6 +204,19 @@ class Searcher:
             return [(self.proximity['start'], self.proximity['stop'])]
         return self.memory.list_mapped_regions(writeable_only=self.write_only, include_paths=self.include_paths)
 
+    def get_byte_frequency(self):
+        """
+        Byte histogram of the searched regions, sampled once per process and used to anchor AOB searches.
+        """
+        if self.byte_frequency is None:
+            self.byte_frequency = ByteFrequency.sample(self.memory, self.get_regions())
+        return self.byte_frequency
+
+    def _prepare_value(self, sv: Value):
+        if isinstance(sv, AOB):
+            sv.value.select_anchor(self.get_byte_frequency())
+        return sv
+
     def setup_by_value(self, sv: Value):
         self.set_search_size(sv.get_store_type())
 
@@ -192,7 +233,7 @@ class Searcher:
         ls = list(self.get_regions())
         _start = ls[0][0]
         _end = ls[-1][1]
-        for start, stop in self.get_regions():
+        for start, stop in ls:
             total += (stop-start)
         average = int(total / len(ls))
         return total, _start, _end, average
@@ -203,9 +244,10 @@ class Searcher:
     def clear_captures(self):
         if not self.mem_path.absolute().exists():
             self.mem_path.mkdir(exist_ok=True)
+        #remove captures left over from the per-chunk capture format
         for f in self.mem_path.glob("*.cap"):
             os.unlink(f)
-        self.capture_files.clear()
+        self.snapshot.delete()
 
     def has_results(self):
         try:
@@ -215,37 +257,34 @@ class Searcher:
 
 
     def has_captures(self):
-        return len(self.capture_files) > 0
+        return self.snapshot.exists()
 
-    def capture_memory(self):
-        self.on_search_start(self.SEARCH_TYPE_CAPTURE)
+    def get_capture_chunks(self):
+        chunks = []
         for start, stop in self.get_regions():
-            size = stop-start
             pos = start
-            iterations = [size]
-            if size > self.max_capture_size:
-                iterations = [self.max_capture_size] * int(size/self.max_capture_size)
-                iterations.append(size - int(size/self.max_capture_size) * self.max_capture_size)
+            while pos < stop:
+                size = min(stop - pos, self.max_capture_size)
+                chunks.append((pos, size))
+                pos += size
+        return chunks
 
-            for it in iterations:
-                cap_file = self.mem_path.joinpath('capture_{:016X}_{:016X}.cap'.format(pos, pos+it))
-                try:
+    def capture_memory(self):
+        self.on_search_start(self.SEARCH_TYPE_CAPTURE)
+        self.snapshot.create(self.get_capture_chunks())
+        try:
+            with self.snapshot.open(writable=True):
+                for entry in self.snapshot.entries:
                     self.check_cancel()
-                    region_buffer = (ctypes.c_byte * it)()
-                    self.memory.read_memory(pos, region_buffer)
-                except OSError:
-                    if self.progress:
-                        self.progress.increment(it)
-                    continue
-                except BreakException:
-                    self.on_search_cancel(self.SEARCH_TYPE_CAPTURE)
-                    raise
-                with open(cap_file, 'wb') as f:
-                    f.write(bytes(region_buffer))
-                    self.capture_files.append(cap_file)
+                    try:
+                        self.snapshot.store(entry, self.snapshot.read_entry(self.memory, entry))
+                    except OSError:
+                        pass
                     if self.progress:
-                        self.progress.increment(it)
-                    pos += it
+                        self.progress.increment(entry['size'])
+        except BreakException:
+            self.on_search_cancel(self.SEARCH_TYPE_CAPTURE)
+            raise
         self.on_search_end(self.SEARCH_TYPE_CAPTURE)
 
     def capture_memory_range(self, _position, _range):
@@ -265,14 +304,14 @@ class Searcher:
 
         _start = int(max((_position - _range/2), loc_start))
         _end = int(min((_position + _range/2), loc_stop))
-        cap_file = self.mem_path.joinpath('capture_{:016X}_{:016X}.cap'.format(_start, _start+(_end-_start)))
+        self.snapshot.create([(_start, _end - _start)])
         try:
             self.check_cancel()
-            region_buffer = (ctypes.c_byte * (_end - _start))()
-            self.memory.read_memory(_start, region_buffer)
-            cap_file.write_bytes(bytes(region_buffer))
-            self.capture_files.append(cap_file)
+            with self.snapshot.open(writable=True):
+                entry = self.snapshot.entries[0]
+                self.snapshot.store(entry, self.snapshot.read_entry(self.memory, entry))
         except OSError:
+            self.snapshot.delete()
             raise SearchException("Could read memory location to capture")
         except BreakException:
             self.on_search_cancel(self.SEARCH_TYPE_CAPTURE)
@@ -283,30 +322,22 @@ class Searcher:
         if self.results is None:
             raise SearchException('No results associated with the searcher')
         self.on_search_start(self.SEARCH_TYPE_VALUE)
-        sv = Value.create(value, self.search_size)
+        sv = self._prepare_value(Value.create(value, self.search_size))
         self.signed = sv.is_signed() if isinstance(sv, IntValue) else False
         _batch_results = []
         with self.results.db() as conn:
             def result_callback(results: list):
                 self.results.add_results(conn, results)
-            for start, stop in self.get_regions():
+            #the next chunks are read on a background thread while the current one is searched
+            with PrefetchReader(self.memory, self.get_regions(), self.max_capture_size, sv.get_ctype()) as reader:
                 try:
                     self.check_cancel()
-                    i_start = start
-                    while True:
-                        size = min(stop - i_start, self.max_capture_size)
-                        if size <= 0:
-                            break
-                        region_buffer = (sv.get_ctype() * size)()
-                        self.memory.read_memory(i_start, region_buffer)
+                    for i_start, region_buffer in reader:
                         search_buffer = SearchBuffer.create(region_buffer, i_start, sv, result_callback, _batch_results, self.result_write_threshold, aligned=self.aligned)
                         count = search_buffer.find_value(sv)
                         if self.progress:
                             self.progress.increment(count)
                         self.check_cancel()
-                        i_start += size
-                except OSError:
-                    continue
                 except BreakException:
                     self.on_search_cancel(self.SEARCH_TYPE_VALUE)
                     raise
@@ -325,26 +356,15 @@ class Searcher:
             def result_callback(results: list):
                 self.results.add_results(conn, results)
 
-            regions = self.get_regions()
-
-            for start, stop in regions:
+            with PrefetchReader(self.memory, self.get_regions(), self.max_capture_size, sv.get_ctype()) as reader:
                 try:
                     self.check_cancel()
-                    i_start = start
-                    while True:
-                        size = min(stop - i_start, self.max_capture_size)
-                        if size <= 0:
-                            break
-                        region_buffer = (sv.get_ctype() * size)()
-                        self.memory.read_memory(i_start, region_buffer)
+                    for i_start, region_buffer in reader:
                         search_buffer = SearchBuffer.create(region_buffer, i_start, sv, result_callback, _batch_results, self.result_write_threshold, aligned=self.aligned)
                         sz = search_buffer.find_by_operation(operation, args)
                         if self.progress:
                             self.progress.increment(sz)
                         self.check_cancel()
-                        i_start += size
-                except OSError:
-                    pass
                 except BreakException:
                     self.on_search_cancel(self.SEARCH_TYPE_OPERATION)
                     raise
@@ -378,6 +398,122 @@ class Searcher:
         self.on_search_end(self.SEARCH_TYPE_CONTINUE)
 
 
+    def _compare_result_pages(self, memory: Process, sv: Value, operation: Operation, rows, previous_hashes: PageHashes, results: list):
+        #rows must be ordered by address, returns the hashes of every page that was read
+        hashes = PageHashes()
+        page_size = PageHashes.PAGE_SIZE
+        groups = list(PageHashes.group_by_page(rows))
+        pages = [x[0] for x in groups]
+        with BufferPool.shared().buffer(len(groups) * page_size) as page_buffer:
+            readable = read_pages(memory, page_buffer, pages, page_size)
+            self._compare_page_rows(memory, sv, operation, groups, readable, memoryview(page_buffer).cast('B'), previous_hashes, results, hashes)
+        return hashes
+
+    def _compare_page_rows(self, memory: Process, sv: Value, operation: Operation, groups, readable, data: memoryview, previous_hashes: PageHashes, results: list, hashes: PageHashes):
+        memory_operation = isinstance(operation, MemoryOperation)
+        page_size = PageHashes.PAGE_SIZE
+        pages = [x[0] for x in groups]
+        for i, (page, page_rows) in enumerate(groups):
+            if not readable[i]:
+                continue
+            page_offset = i * page_size
+            crc = PageHashes.hash(data[page_offset:page_offset+page_size])
+            hashes.add(page, crc)
+            unchanged = memory_operation and previous_hashes.get(page) == crc
+            #a value running into the next page can be taken from the buffer when that page was read right after this one
+            next_page_read = i + 1 < len(groups) and pages[i+1] == page + page_size and readable[i+1]
+            for addr, prev in page_rows:
+                offset = addr - page
+                if offset + sv.store_size > page_size and not next_page_read:
+                    try:
+                        read = sv.read_bytes_from_memory(memory, addr)
+                    except OSError:
+                        continue
+                elif offset + sv.store_size > page_size:
+                    read = bytes(data[page_offset+offset:page_offset+offset+sv.store_size])
+                elif unchanged and operation.skip_unchanged:
+                    continue
+                elif unchanged and operation.keep_unchanged:
+                    results.append((addr, prev))
+                    continue
+                else:
+                    read = bytes(data[page_offset+offset:page_offset+offset+sv.store_size])
+                if memory_operation:
+                    matched = operation.operation(sv.from_bytes(read), sv.from_bytes(prev))
+                else:
+                    matched = operation.operation(sv.from_bytes(read))
+                if matched:
+                    results.append((addr, read))
+
+    def has_columnar_results(self):
+        return isinstance(self.results, ColumnarResults)
+
+    @staticmethod
+    def _value_dtype(sv: Value):
+        if type(sv) == FloatValue:
+            return np.dtype(np.float32)
+        if type(sv) == IntValue:
+            return np.dtype('{}{}'.format('i' if sv.is_signed() else 'u', sv.store_size))
+        return None
+
+    def _search_continue_operation_columns(self, operation: Operation, sv: Value, pages_per_read=256):
+        #filters the previous columns with the vectorized operation, returns False if the operation has no vectorized form
+        dtype = self._value_dtype(sv)
+        if dtype is None or operation.mask(*([np.zeros(1, dtype=dtype)] * (2 if isinstance(operation, MemoryOperation) else 1))) is None:
+            return False
+        previous_table = self.results.table_stack[-2]
+        previous_hashes = self.page_hashes if self.page_hashes.valid_for(previous_table) else PageHashes()
+        hashes = PageHashes(table=self.results.get_table())
+        page_size = PageHashes.PAGE_SIZE
+        width = dtype.itemsize
+        with self.results.db() as conn:
+            addresses, values = self.results.get_result_arrays(conn, previous_table)
+            pages = addresses & np.uint64(~(page_size - 1) & 0xFFFFFFFFFFFFFFFF)
+            page_rows = np.flatnonzero(np.concatenate(([True], pages[1:] != pages[:-1]))) if len(pages) > 0 else np.zeros(0, dtype=np.int64)
+            page_rows = np.append(page_rows, len(pages))
+            with BufferPool.shared().buffer(pages_per_read * page_size + width) as page_buffer:
+                page_data = np.frombuffer(page_buffer, dtype=np.uint8)
+                columns = np.arange(width)
+                for first in range(0, len(page_rows) - 1, pages_per_read):
+                    last = min(first + pages_per_read, len(page_rows) - 1)
+                    row_start, row_stop = page_rows[first], page_rows[last]
+                    batch_pages = [int(pages[page_rows[i]]) for i in range(first, last)]
+                    readable = np.array(read_pages(self.memory, page_buffer, batch_pages, page_size), dtype=bool)
+                    unchanged = np.zeros(last - first, dtype=bool)
+                    for i in np.flatnonzero(readable):
+                        crc = PageHashes.hash(page_data[i * page_size:(i + 1) * page_size])
+                        hashes.add(batch_pages[i], crc)
+                        unchanged[i] = previous_hashes.get(batch_pages[i]) == crc
+                    row_pages = np.repeat(np.arange(last - first), np.diff(page_rows[first:last + 1]))
+                    row_addresses = addresses[row_start:row_stop]
+                    in_page = (row_addresses - pages[row_start:row_stop]).astype(np.int64)
+                    current = page_data[(row_pages * page_size + in_page)[:, None] + columns]
+                    valid = readable[row_pages]
+                    #values running into the next page are already in the buffer when that page was read right after this one
+                    next_read = np.zeros(last - first, dtype=bool)
+                    next_read[:-1] = readable[1:] & (np.diff(np.array(batch_pages, dtype=np.uint64)) == page_size)
+                    straddle = in_page + width > page_size
+                    for j in np.flatnonzero(valid & straddle & ~next_read[row_pages]):
+                        try:
+                            current[j] = np.frombuffer(sv.read_bytes_from_memory(self.memory, int(row_addresses[j])), dtype=np.uint8)
+                        except OSError:
+                            valid[j] = False
+                    row_pages[straddle] = -1
+                    if isinstance(operation, MemoryOperation):
+                        hits = operation.mask(current.view(dtype).reshape(-1), values[row_start:row_stop].view(dtype).reshape(-1))
+                        if operation.skip_unchanged:
+                            hits &= ~(unchanged[row_pages] & (row_pages >= 0))
+                    else:
+                        hits = operation.mask(current.view(dtype).reshape(-1))
+                    hits &= valid
+                    self.results.add_result_arrays(conn, row_addresses[hits], current[hits])
+                    if self.progress:
+                        self.progress.increment(int(row_stop - row_start))
+                    self.check_cancel()
+            self.results.create_address_index(conn)
+        self.page_hashes = hashes
+        return True
+
     def _search_continue_operation_result(self, operation: Operation, store_size=4):
         if self.search_size == 'array':
             sv = Value.create(" ".join(["00"]*store_size), self.search_size)
@@ -385,27 +521,51 @@ class Searcher:
             sv = Value.create("0", self.search_size)
             if isinstance(sv, IntValue):
                 sv.set_signed(self.signed)
+        if self.has_columnar_results() and self._search_continue_operation_columns(operation, sv):
+            return
+        previous_table = self.results.table_stack[-2]
+        previous_hashes = self.page_hashes if self.page_hashes.valid_for(previous_table) else PageHashes()
+        hashes = PageHashes(table=self.results.get_table())
         _update_list = []
-        read_counter = 0
         with self.results.db() as conn:
-            for (addr, data) in self.results.get_results(conn, table_name=self.results.table_stack[-2]):
-                try:
-                    prev = sv.from_bytes(data)
-                    read = sv.read_bytes_from_memory(self.memory, addr)
-                    if operation.operation(sv.from_bytes(read), prev):
-                        _update_list.append((addr, read))
-                    if len(_update_list) >= self.result_write_threshold:
-                        self.results.add_results(conn, _update_list)
-                        _update_list.clear()
-                    read_counter += 1
-                    if read_counter % self.result_progress_threshold == 0:
-                        if self.progress:
-                            self.progress.increment(self.result_progress_threshold)
-                        self.check_cancel()
-                except OSError:
-                    pass
+            def compare_rows(rows: list):
+                compared = self._compare_result_pages(self.memory, sv, operation, rows, previous_hashes, _update_list)
+                hashes.merge(compared.pages, compared.hashes)
+                if len(_update_list) >= self.result_write_threshold:
+                    self.results.add_results(conn, _update_list)
+                    _update_list.clear()
+                if self.progress:
+                    self.progress.increment(len(rows))
+                self.check_cancel()
+
+            #batches end on page boundaries so every page is read and hashed once
+            batch = []
+            for page, page_rows in PageHashes.group_by_page(self.results.get_results(conn, table_name=previous_table)):
+                batch.extend(page_rows)
+                if len(batch) >= self.result_progress_threshold:
+                    compare_rows(batch)
+                    batch = []
+            if len(batch) > 0:
+                compare_rows(batch)
             if len(_update_list) > 0:
                 self.results.add_results(conn, _update_list)
+        self.page_hashes = hashes
+
+    def _compare_capture_entry(self, memory: Process, entry, sv: Value, operation: MemoryOperation, result_callback: callable = None, _results: list = None):
+        with BufferPool.shared().buffer(entry['size'], sv.get_ctype()) as region_buffer:
+            return self._compare_capture_buffer(memory, entry, sv, operation, region_buffer, result_callback, _results)
+
+    def _compare_capture_buffer(self, memory: Process, entry, sv: Value, operation: MemoryOperation, region_buffer: ctypes.Array, result_callback: callable = None, _results: list = None):
+        memory.read_memory(entry['start'], region_buffer)
+        capture_buffer = self.snapshot.compare_buffer(entry, region_buffer)
+        if capture_buffer is None:
+            #no page of this region changed since the capture
+            if operation.skip_unchanged:
+                return entry['size']
+            capture_buffer = region_buffer
+        search_buffer = SearchBuffer.create(region_buffer, entry['start'], sv, result_callback, _results, self.result_write_threshold, aligned=self.aligned)
+        compare_buffer = SearchBuffer.create(capture_buffer, entry['start'], sv, result_write_threshold=self.result_write_threshold, aligned=self.aligned)
+        return search_buffer.compare_by_operation(compare_buffer, operation)
 
     def _search_continue_capture_operation(self, operation: MemoryOperation, store_size=4):
         if self.search_size == 'array':
@@ -418,27 +578,17 @@ class Searcher:
         with self.results.db() as conn:
             def result_callback(results: list):
                 self.results.add_results(conn, results)
-            for f in self.capture_files:
-                parts = f.stem.split('_')
-                start = int(parts[1], 16)
-                stop = int(parts[2], 16)
-                cap_file = f
-                try:
-                    self.check_cancel()
-                    read_bytes = cap_file.read_bytes()
-                    capture_buffer = (sv.get_ctype() * len(read_bytes))()
-                    ctypes.memmove(ctypes.pointer(capture_buffer), read_bytes, len(read_bytes))
-                    region_buffer = (sv.get_ctype() * (stop - start))()
-                    self.memory.read_memory(start, region_buffer)
-                    search_buffer = SearchBuffer.create(region_buffer, start, sv, result_callback, _batch_results, self.result_write_threshold, aligned=self.aligned)
-                    compare_buffer = SearchBuffer.create(capture_buffer, start, sv, result_callback, result_write_threshold=self.result_write_threshold, aligned=self.aligned)
-                    count = search_buffer.compare_by_operation(compare_buffer, operation)
-                    if self.progress:
-                        self.progress.increment(count)
-                except OSError:
-                    if self.progress:
-                        self.progress.increment(stop-start)
-                    continue
+            with self.snapshot.open():
+                for entry in self.snapshot.valid_entries():
+                    try:
+                        self.check_cancel()
+                        count = self._compare_capture_entry(self.memory, entry, sv, operation, result_callback, _batch_results)
+                        if self.progress:
+                            self.progress.increment(count)
+                    except OSError:
+                        if self.progress:
+                            self.progress.increment(entry['size'])
+                        continue
             if len(_batch_results) > 0:
                 result_callback(_batch_results)
             self.results.create_address_index(conn)
@@ -454,7 +604,7 @@ class Searcher:
                 self.on_search_cancel(self.SEARCH_TYPE_CONTINUE)
                 raise
             self.on_search_end(self.SEARCH_TYPE_CONTINUE)
-        elif self.last_search_type == Searcher.SEARCH_RETURN_CAPTURE and len(self.capture_files) > 0: #we will do a capture comparison
+        elif self.last_search_type == Searcher.SEARCH_RETURN_CAPTURE and self.has_captures(): #we will do a capture comparison
             if not isinstance(operation, MemoryOperation):
                 raise SearchException('Cannot continue search with this type of operation.')
             self.on_search_start(self.SEARCH_TYPE_COMPARE_CAPTURE)
@@ -482,14 +632,10 @@ class Searcher:
 
 
     def delete_captures(self):
-        for res in self.capture_files:
-            res.unlink(missing_ok=True)
-        self.capture_files.clear()
+        self.snapshot.delete()
 
     def delete_previous_results_and_captures(self):
-        for res in self.capture_files:
-            res.unlink(missing_ok=True)
-        self.capture_files.clear()
+        self.snapshot.delete()
         if self.results is not None:
             with self.results.db() as conn:
                 self.results.clear_results(conn)
@@ -502,6 +648,7 @@ class Searcher:
 
     def set_memory(self, mem: mem_edit.Process):
         self.memory = mem
+        self.byte_frequency = None
 
     def reset(self):
         if self.progress:
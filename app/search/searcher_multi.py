@@ -1,21 +1,26 @@
 import ctypes
 import multiprocessing
 import os
-import platform
 import traceback
+from contextlib import contextmanager
 from typing import Union
 
 from mem_edit import Process
 
 from app.helpers.aob_value import AOBValue
+from app.helpers.buffer_pool import BufferPool
 from app.helpers.directory_utils import memory_directory
 from app.helpers.exceptions import SearchException, BreakException
 from app.helpers.progress import Progress
 from app.helpers.search_results import SearchResults
 from app.search.buffer import SearchBuffer
 from app.search.operations import Operation, MemoryOperation, EqualInt, EqualFloat, EqualArray
+from app.search.page_hashes import PageHashes
+from app.search.result_transport import ResultArrays
+from app.search.scheduler import RegionScheduler, WorkerStats
 from app.search.searcher import Searcher
-from app.search.value import Value, IntValue
+from app.search.value import Value, IntValue, AOB
+from app.search.worker_pool import WorkerPool, ThreadWorkerPool, worker_cancelled, worker_memory
 
 logger = multiprocessing.log_to_stderr()
 #logger.setLevel(multiprocess.SUBDEBUG)
@@ -24,178 +29,175 @@ logger = multiprocessing.log_to_stderr()
 ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, ctypes.Union]
 
 class SearcherMulti(Searcher):
+    PARALLEL_PROCESS = 'process'
+    PARALLEL_THREAD = 'thread'
+
     def __init__(self, memory: Process, progress: Progress = None, write_only=True, directory=memory_directory, results: SearchResults=None):
         super().__init__(memory, progress, write_only, directory, results)
         self.multiprocessing_event = None
         multiprocessing.set_start_method('spawn', force=True)
-        self.round_robin_size = 4096000
         self.single_process = False
+        self.worker_pool = WorkerPool.shared()
+        self.worker_stats = WorkerStats()
 
     def check_multi_clear(self):
         if self.multiprocessing_event.is_set():
             raise BreakException
 
     def get_mp_memory(self):
-        if platform.system() == "Windows":
-            return Process(self.memory.pid)
-        return self.memory
+        if self.worker_pool.threaded:
+            return self.memory #threads share the searcher's handle
+        return worker_memory(self.memory)
 
     def release_mp_memory(self, proc: Process):
-        if platform.system() == "Windows":
-            proc.close()
+        pass #worker handles stay open until the pid changes
+
+    def set_worker_pool(self, pool: WorkerPool):
+        self.worker_pool = pool
+
+    def set_parallel_mode(self, mode: str):
+        """
+        Select the parallel backend, PARALLEL_PROCESS scans in spawned worker processes and PARALLEL_THREAD in threads
+        of this process.
+        """
+        if mode == self.PARALLEL_PROCESS:
+            self.worker_pool = WorkerPool.shared()
+        elif mode == self.PARALLEL_THREAD:
+            self.worker_pool = ThreadWorkerPool.shared()
+        else:
+            raise SearchException('Unknown parallel mode {}'.format(mode))
+
+    def get_parallel_mode(self):
+        return self.PARALLEL_THREAD if self.worker_pool.threaded else self.PARALLEL_PROCESS
+
+    @contextmanager
+    def _value_search_pool(self, sv: Value):
+        #exact int and AOB scans spend their time in bytes.find, which holds the GIL, on threads they would run one at
+        #a time, so they always go to the process pool
+        pool = self.worker_pool
+        if pool.threaded and isinstance(sv, (IntValue, AOB)):
+            self.worker_pool = WorkerPool.shared()
+        try:
+            yield
+        finally:
+            self.worker_pool = pool
+
+    def get_worker_stats(self):
+        return self.worker_stats.get()
+
+    def _start_tasks(self, func, process_args, chunksize=1):
+        #the stats of the last search of this searcher, the pool itself is shared with other searches
+        job = self.worker_pool.imap_unordered(func, process_args, chunksize=chunksize)
+        self.worker_stats = job.stats
+        return job
+
+    @staticmethod
+    def _worker_results():
+        return ResultArrays() if ResultArrays.available() else []
+
+    def _share_results(self, results):
+        if not isinstance(results, ResultArrays):
+            return {'results': results}
+        if self.worker_pool.threaded:
+            return {'results': [], 'arrays': results.arrays()}
+        #dense hits go back through shared memory, only the block handle is pickled
+        return {'results': [], 'shared': results.share()}
+
+    @contextmanager
+    def _worker_snapshot(self):
+        if self.worker_pool.threaded:
+            yield self.snapshot #opened once by the caller for all threads
+            return
+        with self.snapshot.open():
+            yield self.snapshot
+
+    def _add_worker_results(self, conn, res):
+        if res.get('arrays', None) is not None:
+            addresses, values = res['arrays']
+        elif res.get('shared', None) is not None:
+            addresses, values = ResultArrays.receive(res['shared'])
+        else:
+            self.results.add_results(conn, res['results'])
+            return
+        if self.has_columnar_results():
+            self.results.add_result_arrays(conn, addresses, values)
+            return
+        data = values.tobytes()
+        width = values.shape[1]
+        self.results.add_results(conn, zip(addresses.tolist(), [data[i:i+width] for i in range(0, len(data), width)]))
 
     def set_single_process(self, p):
         self.single_process = p
 
-    def _create_uniform_rounds(self, sv: Value, max_size=40000000):
-        mem_map = {0: []}
-        current_size = max_size
-        region_index = 0
-        region_list = list(self.get_regions())
-        for ri in range(0, len(region_list)):
-            region = region_list[ri]
-            current_start = region[0]
-            while True:
-                size = region[1]-current_start
-                if current_size - size <= 0: #next worker
-                    size = current_size
-                    size -= (size % sv.store_size)
-                    mem_map[region_index].append({'region_index': region_index, 'start': current_start, 'size': size})
-                    region_index += 1
-                    mem_map[region_index] = []
-                    current_start += size
-                    current_size = max_size
-                elif current_size - size > 0: #next region
-                    if size > 0:
-                        mem_map[region_index].append({'region_index': region_index, 'start': current_start, 'size': size})
-                    else:
-                        del mem_map[region_index]
-                    current_size -= size
-                    break
-                else:
-                    size = current_size
-                    mem_map[region_index].append({'region_index': region_index, 'start': current_start, 'size': size})
-                    region_index += 1
-                    mem_map[region_index] = []
-                    current_size = max_size
-                    break
-        return mem_map
-
-    def _create_round_robin(self, sv: Value):
-        cpus = max(1, multiprocessing.cpu_count() - 1)
-        mem_map = {}
-        for i in range(0, cpus):
-            mem_map[i] = []
-        region_list = list(self.get_regions())
-        current_size = self.round_robin_size
-        cpu_index = 0
-        for ri in range(0, len(region_list)):
-            region = region_list[ri]
-            current_start = region[0]
-            while True:
-                size = region[1]-current_start
-                if current_size - size <= 0: #next cpu
-                    size = current_size
-                    size -= (size % sv.store_size)
-                    mem_map[cpu_index].append({'cpu': cpu_index, 'start': current_start, 'size': size})
-                    cpu_index += 1
-                    cpu_index %= cpus
-                    current_start += size
-                    current_size = self.round_robin_size
-                elif current_size - size > 0: #next region
-                    mem_map[cpu_index].append({'cpu': cpu_index, 'start': current_start, 'size': size})
-                    current_size -= size
-                    break
-                else:
-                    size = current_size
-                    mem_map[cpu_index].append({'cpu': cpu_index, 'start': current_start, 'size': size})
-                    cpu_index += 1
-                    cpu_index %= cpus
-                    current_size = self.round_robin_size
-                    break
-        return mem_map
-
-
+    def _create_scheduled_rounds(self, sv: Value):
+        scheduler = RegionScheduler(self.worker_pool.processes, sv.store_size)
+        return dict(enumerate(scheduler.schedule(self.get_regions())))
 
     def _capture_memory_thread(self, args):
-        capture_data = args[0]
+        entry = args[0]
         pid = os.getpid()
-        cap_file = self.mem_path.joinpath(capture_data['file'])
-        size = capture_data['size']
-        pos = capture_data['position']
+        if worker_cancelled():
+            return {"pid": pid, "size": entry['size'], "index": entry['index'], "payload": None, "error": True}
         memory = self.get_mp_memory()
         try:
-            region_buffer = (ctypes.c_byte * size)()
-            memory.read_memory(pos, region_buffer)
-            self.release_mp_memory(memory)
+            payload = self.snapshot.read_entry(memory, entry)
         except OSError:
-            return {"pid": pid, "size": size, "filename": cap_file, "error": True}
-        with open(cap_file, 'wb') as f:
-            f.write(bytes(region_buffer))
-        return {"pid": pid, "size": size, "filename": cap_file, "error": False}
+            return {"pid": pid, "size": entry['size'], "index": entry['index'], "payload": None, "error": True}
+        finally:
+            self.release_mp_memory(memory)
+        return {"pid": pid, "size": entry['size'], "index": entry['index'], "payload": payload, "error": False}
 
     def capture_memory(self):
         if self.total_size < 500000000 or self.single_process:
             super().capture_memory()
             return
         self.on_search_start(self.SEARCH_TYPE_CAPTURE)
-        captures = []
-        for start, stop in self.get_regions():
-            size = stop-start
-            pos = start
-            iterations = [size]
-            if size > self.max_capture_size:
-                iterations = [self.max_capture_size] * int(size/self.max_capture_size)
-                iterations.append(size - int(size/self.max_capture_size) * self.max_capture_size)
-
-            for it in iterations:
-                captures.append({'position': pos, 'size': it, 'file': 'capture_{:016X}_{:016X}.cap'.format(pos, pos+it)})
-                pos += it
+        self.snapshot.create(self.get_capture_chunks())
 
         process_args = []
-        for cap in captures:
-            process_args.append((cap,))
-        with multiprocessing.Pool(processes=max(1, multiprocessing.cpu_count() - 1)) as pool:
+        for entry in sorted(self.snapshot.entries, key=lambda x: x['size'], reverse=True):
+            process_args.append((entry,))
+        chunksize = max(1, min(100, len(process_args) // (self.worker_pool.processes * RegionScheduler.tasks_per_worker)))
+        with self.snapshot.open(writable=True):
+            tasks = self._start_tasks(self._capture_memory_thread, process_args, chunksize=chunksize)
             try:
-                for res in pool.imap_unordered(self._capture_memory_thread, process_args, chunksize=100):
+                for res in tasks:
                     self.check_cancel()
+                    if not res['error']:
+                        self.snapshot.store(self.snapshot.entries[res['index']], res['payload'])
                     if self.progress:
                         self.progress.increment(res['size'])
-                    self.capture_files.append(res['filename'])
             except BreakException:
-                pool.terminate()
-                pool.join()
+                self.worker_pool.cancel(tasks)
                 self.on_search_cancel(self.SEARCH_TYPE_CAPTURE)
                 raise
+            finally:
+                tasks.close()
         self.on_search_end(self.SEARCH_TYPE_CAPTURE)
 
     def _search_continue_capture_operation_thread(self, args):
-        files = args['files']
+        entries = args['entries']
         sv = Value.create(args['value']['string'], args['value']['size'])
         _id = args['id']
         operation = args['operation']
-        results = []
+        results = self._worker_results()
         total_read = 0
         memory = self.get_mp_memory()
 
-        for cap_file, start, stop in files:
-            try:
-                read_bytes = cap_file.read_bytes()
-                capture_buffer = (sv.get_ctype() * len(read_bytes))()
-                ctypes.memmove(ctypes.pointer(capture_buffer), read_bytes, len(read_bytes))
-                region_buffer = (sv.get_ctype() * (stop - start))()
-                memory.read_memory(start, region_buffer)
-                search_buffer = SearchBuffer.create(region_buffer, start, sv, _results=results, aligned=self.aligned)
-                compare_buffer = SearchBuffer.create(capture_buffer, start, sv, aligned=self.aligned)
-                search_buffer.compare_by_operation(compare_buffer, operation)
-                total_read += len(read_bytes)
-            except OSError as e1:
-                continue
-            except Exception as e:
-                self.release_mp_memory(memory)
-                return {'id': _id, 'results': [], 'count': 0, 'error': traceback.format_exc()}
+        with self._worker_snapshot():
+            for entry in entries:
+                if worker_cancelled():
+                    break
+                try:
+                    self._compare_capture_entry(memory, entry, sv, operation, _results=results)
+                    total_read += entry['size']
+                except OSError:
+                    continue
+                except Exception as e:
+                    self.release_mp_memory(memory)
+                    return {'id': _id, 'results': [], 'count': 0, 'error': traceback.format_exc()}
         self.release_mp_memory(memory)
-        return {'id': _id, 'results': results, 'count': total_read}
+        return {'id': _id, **self._share_results(results), 'count': total_read}
 
     def _search_continue_capture_operation(self, operation: MemoryOperation, store_size=4):
         if self.total_size < 12000000 or self.single_process:
@@ -213,71 +215,73 @@ class SearcherMulti(Searcher):
         #max_size = int(self.total_size / (multiprocessing.cpu_count()-1))+4096 #self.max_capture_size
         max_size = 10000000
         current_size = max_size
-        files = []
-
-        for f in sorted(self.capture_files, key=lambda x: x.stat().st_size):
-            parts = f.stem.split('_')
-            start = int(parts[1], 16)
-            stop = int(parts[2], 16)
-            size = stop-start
-            cap_file = f
+        entries = []
+
+        with self.snapshot.open():
+            valid_entries = self.snapshot.valid_entries()
+        for entry in sorted(valid_entries, key=lambda x: x['size']):
+            size = entry['size']
             if size >= max_size:
-                if len(files) > 0:
-                    process_args.append({'files': files, 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
+                if len(entries) > 0:
+                    process_args.append({'entries': entries, 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
                     _id += 1
-                    files = []
-                process_args.append({'files': [(cap_file, start, stop)], 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
+                    entries = []
+                process_args.append({'entries': [entry], 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
                 _id += 1
             elif current_size - size < 0:
-                process_args.append({'files': files, 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
+                process_args.append({'entries': entries, 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
                 _id += 1
-                files = [(cap_file, start, stop)]
+                entries = [entry]
                 current_size = max_size - size
             elif current_size - size >= 0:
-                files.append((cap_file, start, stop))
+                entries.append(entry)
                 current_size -= size
-        if len(files) > 0:
-            process_args.append({'files': files, 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
+        if len(entries) > 0:
+            process_args.append({'entries': entries, 'value': {'string': sv.raw_value, 'size': self.search_size}, 'operation': operation, 'id': _id})
+        process_args.sort(key=lambda x: sum(e['size'] for e in x['entries']), reverse=True)
 
-        with self.results.db() as conn:
-            with multiprocessing.Pool(processes=max(1, multiprocessing.cpu_count() - 1)) as pool:
-                try:
-                    for res in pool.imap_unordered(self._search_continue_capture_operation_thread, process_args):
-                        self.check_cancel()
-                        if self.progress:
-                            self.progress.increment(res['count'])
-                        if 'error' in res:
-                            logger.error("{} - {}".format(res['id'], res['error']))
-                        else:
-                            self.results.add_results(conn, res['results'])
-                except BreakException:
-                    pool.terminate()
-                    pool.join()
-                    raise
+        with self.results.db() as conn, self.snapshot.open():
+            tasks = self._start_tasks(self._search_continue_capture_operation_thread, process_args)
+            try:
+                for res in tasks:
+                    if self.progress:
+                        self.progress.increment(res['count'])
+                    if 'error' in res:
+                        logger.error("{} - {}".format(res['id'], res['error']))
+                    else:
+                        self._add_worker_results(conn, res)
+                    self.check_cancel()
+            except BreakException:
+                self.worker_pool.cancel(tasks)
+                raise
+            finally:
+                tasks.close()
 
     def _search_memory_value_thread(self, args):
         regions = args['region']
-        sv = Value.create(args['value']['string'], args['value']['size'])
+        sv = self._prepare_value(Value.create(args['value']['string'], args['value']['size']))
         _id = args['id']
         memory = self.get_mp_memory()
-        results = []
+        results = self._worker_results()
         count = 0
         for region in regions:
+            if worker_cancelled():
+                break
             start = region['start']
             size = region['size']
             try:
-                region_buffer = (sv.get_ctype() * size)()
-                memory.read_memory(start, region_buffer)
-                search_buffer = SearchBuffer.create(region_buffer, start, sv, _results=results, aligned=self.aligned)
-                count += search_buffer.find_value(sv)
+                with BufferPool.shared().buffer(size, sv.get_ctype()) as region_buffer:
+                    memory.read_memory(start, region_buffer)
+                    search_buffer = SearchBuffer.create(region_buffer, start, sv, _results=results, aligned=self.aligned)
+                    count += search_buffer.find_value(sv)
             except OSError as e1:
                 self.release_mp_memory(memory)
-                return {'id': _id, 'results': results, 'count': 0, 'error': e1}
+                return {'id': _id, 'results': [], 'count': 0, 'error': e1}
             except Exception as e:
                 self.release_mp_memory(memory)
-                return {'id': _id, 'results': results, 'count': 0, 'error': traceback.format_exc()}
+                return {'id': _id, 'results': [], 'count': 0, 'error': traceback.format_exc()}
         self.release_mp_memory(memory)
-        return {'id': _id, 'results': results, 'count': count}
+        return {'id': _id, **self._share_results(results), 'count': count}
 
     def search_memory_value(self, value: str):
         if self.results is None:
@@ -286,29 +290,31 @@ class SearcherMulti(Searcher):
             super().search_memory_value(value)
             return
         self.on_search_start(self.SEARCH_TYPE_VALUE)
-        sv = Value.create(value, self.search_size)
+        #sampled here so the workers get the histogram with the searcher instead of sampling memory again
+        sv = self._prepare_value(Value.create(value, self.search_size))
         self.signed = sv.is_signed() if isinstance(sv, IntValue) else False
 
-        process_args = []
-        mem_map = self._create_uniform_rounds(sv, max_size=self.mem_average)
-        for i in range(0, len(mem_map)):
-            process_args.append({'region': mem_map[i], 'value': {'string': value, 'size': self.search_size}, 'id': i})
-        with self.results.db() as conn:
-            with multiprocessing.Pool(processes=max(1, multiprocessing.cpu_count() - 1)) as pool:
-                try:
-                    for res in pool.imap_unordered(self._search_memory_value_thread, process_args):
-                        self.check_cancel()
-                        if self.progress:
-                            self.progress.increment(res['count'])
-                        if 'error' in res:
-                            logger.error("{} - {}".format(res['id'], res['error']))
-                        else:
-                            self.results.add_results(conn, res['results'])
-                except BreakException:
-                    pool.terminate()
-                    pool.join()
-                    self.on_search_cancel(self.SEARCH_TYPE_VALUE)
-                    raise
+        with self._value_search_pool(sv), self.results.db() as conn:
+            process_args = []
+            mem_map = self._create_scheduled_rounds(sv)
+            for i in range(0, len(mem_map)):
+                process_args.append({'region': mem_map[i], 'value': {'string': value, 'size': self.search_size}, 'id': i})
+            tasks = self._start_tasks(self._search_memory_value_thread, process_args)
+            try:
+                for res in tasks:
+                    if self.progress:
+                        self.progress.increment(res['count'])
+                    if 'error' in res:
+                        logger.error("{} - {}".format(res['id'], res['error']))
+                    else:
+                        self._add_worker_results(conn, res)
+                    self.check_cancel()
+            except BreakException:
+                self.worker_pool.cancel(tasks)
+                self.on_search_cancel(self.SEARCH_TYPE_VALUE)
+                raise
+            finally:
+                tasks.close()
             self.results.create_address_index(conn)
             self.on_search_end(self.SEARCH_TYPE_VALUE)
 
@@ -317,26 +323,28 @@ class SearcherMulti(Searcher):
         sv = Value.create(args['value']['string'], args['value']['size'])
         _id = args['id']
         operation = args['operation']
-        results = []
+        results = self._worker_results()
         count = 0
         memory = self.get_mp_memory()
 
         for region in regions:
+            if worker_cancelled():
+                break
             start = region['start']
             size = region['size']
             try:
-                region_buffer = (sv.get_ctype() * size)()
-                memory.read_memory(start, region_buffer)
-                search_buffer = SearchBuffer.create(region_buffer, start, sv, _results=results, aligned=self.aligned)
-                count += search_buffer.find_by_operation(operation, args)
+                with BufferPool.shared().buffer(size, sv.get_ctype()) as region_buffer:
+                    memory.read_memory(start, region_buffer)
+                    search_buffer = SearchBuffer.create(region_buffer, start, sv, _results=results, aligned=self.aligned)
+                    count += search_buffer.find_by_operation(operation, args)
             except OSError as e1:
                 self.release_mp_memory(memory)
-                return {'id': _id, 'results': results, 'count': 0, 'error': e1}
+                return {'id': _id, 'results': [], 'count': 0, 'error': e1}
             except Exception as e:
                 self.release_mp_memory(memory)
-                return {'id': _id, 'results': results, 'count': 0, 'error': traceback.format_exc()}
+                return {'id': _id, 'results': [], 'count': 0, 'error': traceback.format_exc()}
         self.release_mp_memory(memory)
-        return {'id': _id, 'results': results, 'count': count}
+        return {'id': _id, **self._share_results(results), 'count': count}
 
     def search_memory_operation(self, operation, args=None):
         if self.results is None:
@@ -347,27 +355,28 @@ class SearcherMulti(Searcher):
         self.on_search_start(self.SEARCH_TYPE_OPERATION)
         sv = Value.create("0", self.search_size)
         process_args = []
-        mem_map = self._create_uniform_rounds(sv, max_size=self.mem_average)
+        mem_map = self._create_scheduled_rounds(sv)
 
         for i in range(0, len(mem_map)):
             process_args.append({'region': mem_map[i], 'value': {'string': "0", "size": self.search_size}, 'operation': operation, 'id': i})
 
         with self.results.db() as conn:
-            with multiprocessing.Pool(processes=max(1, multiprocessing.cpu_count() - 1)) as pool:
-                try:
-                    for res in pool.imap_unordered(self._search_memory_operation_thread, process_args):
-                        self.check_cancel()
-                        if self.progress:
-                            self.progress.increment(res['count'])
-                        if 'error' in res:
-                            logger.error("{} - {}".format(res['id'], res['error']))
-                        else:
-                            self.results.add_results(conn, res['results'])
-                except BreakException:
-                    pool.terminate()
-                    pool.join()
-                    self.on_search_cancel(self.SEARCH_TYPE_OPERATION)
-                    raise
+            tasks = self._start_tasks(self._search_memory_operation_thread, process_args)
+            try:
+                for res in tasks:
+                    if self.progress:
+                        self.progress.increment(res['count'])
+                    if 'error' in res:
+                        logger.error("{} - {}".format(res['id'], res['error']))
+                    else:
+                        self._add_worker_results(conn, res)
+                    self.check_cancel()
+            except BreakException:
+                self.worker_pool.cancel(tasks)
+                self.on_search_cancel(self.SEARCH_TYPE_OPERATION)
+                raise
+            finally:
+                tasks.close()
             self.results.create_address_index(conn)
             self.on_search_end(self.SEARCH_TYPE_OPERATION)
 
@@ -391,30 +400,16 @@ class SearcherMulti(Searcher):
         sv.signed = self.signed
         operation = args['operation']
         input_results = args['results']
+        previous_hashes = PageHashes(args['pages'], args['hashes'])
         memory = self.get_mp_memory()
         results = []
 
+        if worker_cancelled():
+            return {'id': args['id'], 'results': [], 'count': 0, 'pages': [], 'hashes': []}
         try:
-            if isinstance(operation, MemoryOperation):
-                def run_op(_results):
-                    for res in _results:
-                        addr = res[0]
-                        read = sv.read_bytes_from_memory(memory, addr)
-                        prev_value = sv.from_bytes(res[1])
-                        op_test = operation.operation(sv.from_bytes(read), prev_value)
-                        if op_test:
-                            results.append((addr, read))
-            else:
-                def run_op(_results):
-                    for res in _results:
-                        addr = res[0]
-                        read = sv.read_bytes_from_memory(memory, addr)
-                        op_test = operation.operation(sv.from_bytes(read))
-                        if op_test:
-                            results.append((addr, read))
-            run_op(input_results)
+            hashes = self._compare_result_pages(memory, sv, operation, input_results, previous_hashes, results)
             self.release_mp_memory(memory)
-            return {'id': args['id'], 'results': results, 'count': size}
+            return {'id': args['id'], 'results': results, 'count': size, 'pages': hashes.pages, 'hashes': hashes.hashes}
         except Exception as e:
             self.release_mp_memory(memory)
             return {'id': args['id'], 'results': results, 'count': 0, 'error': traceback.format_exc()}
@@ -422,8 +417,8 @@ class SearcherMulti(Searcher):
     def _search_continue_operation_result(self, operation: Operation, store_size=4):
         with self.results.db() as conn:
             result_count = self.results.get_number_of_results(conn, -2)
-        if result_count < 300 or self.single_process:
-            super()._search_continue_operation_result(operation)
+        if result_count < 300 or self.single_process or self.has_columnar_results():
+            super()._search_continue_operation_result(operation, store_size=store_size)
             return
 
         if self.search_size == 'array':
@@ -433,33 +428,46 @@ class SearcherMulti(Searcher):
             if isinstance(sv, IntValue):
                 sv.set_signed(self.signed)
 
-        segments = min(10000, int(result_count / (multiprocessing.cpu_count()-1)))
-        regions = int(result_count / segments)
+        segments = min(10000, int(result_count / self.worker_pool.processes))
 
         process_args = []
 
+        previous_table = self.results.table_stack[-2]
+        previous_hashes = self.page_hashes if self.page_hashes.valid_for(previous_table) else PageHashes()
+        hashes = PageHashes(table=self.results.get_table())
+
+        def create_args(results: list, i: int):
+            pages, page_hashes = previous_hashes.slice(PageHashes.page(results[0][0]), PageHashes.page(results[-1][0]))
+            return {'results': results, 'size': len(results), 'value': {"string": sv.raw_value, "size": self.search_size}, 'operation': operation, 'id': i, 'pages': pages, 'hashes': page_hashes}
+
         with self.results.db() as conn:
-            results_cursor = self.results.get_results_unordered(conn, -2)
-            for i in range(0, regions):
-                if i == regions-1:
-                    results = results_cursor.fetchall()
-                else:
-                    results = results_cursor.fetchmany(segments)
-                process_args.append({'results': results, 'size': len(results), 'value': {"string": sv.raw_value, "size": self.search_size}, 'operation': operation, 'id': i})
-            with multiprocessing.Pool(processes=max(1, multiprocessing.cpu_count() - 1)) as pool:
-                try:
-                    for res in pool.imap_unordered(self._search_continue_operation_results_thread, process_args):
-                        self.check_cancel()
-                        if self.progress:
-                            self.progress.increment(res['count'])
-                        if 'error' in res:
-                            logger.error("{} - {}".format(res['id'], res['error']))
-                        else:
-                            self.results.add_results(conn, res['results'])
-                except BreakException:
-                    pool.terminate()
-                    pool.join()
-                    raise
+            #segments are ordered by address and end on page boundaries so no page is hashed by two workers
+            results = []
+            for page, page_rows in PageHashes.group_by_page(self.results.get_results(conn, table_name=previous_table)):
+                results.extend(page_rows)
+                if len(results) >= segments:
+                    process_args.append(create_args(results, len(process_args)))
+                    results = []
+            if len(results) > 0:
+                process_args.append(create_args(results, len(process_args)))
+            tasks = self._start_tasks(self._search_continue_operation_results_thread, process_args)
+            try:
+                for res in tasks:
+                    self.check_cancel()
+                    if self.progress:
+                        self.progress.increment(res['count'])
+                    if 'error' in res:
+                        logger.error("{} - {}".format(res['id'], res['error']))
+                    else:
+                        self.results.add_results(conn, res['results'])
+                        hashes.merge(res['pages'], res['hashes'])
+            except BreakException:
+                self.worker_pool.cancel(tasks)
+                raise
+            finally:
+                tasks.close()
+        hashes.sort()
+        self.page_hashes = hashes
 
 
 
@@ -0,0 +1,288 @@
+import ctypes
+import mmap
+import struct
+import zlib
+from pathlib import Path
+
+from mem_edit import Process
+
+from app.helpers.buffer_pool import BufferPool
+from app.helpers.exceptions import SearchException
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+class Snapshot:
+    """
+    Single file capture of process memory.
+
+    The file starts with a header and a region index followed by the page aligned data of every region.
+    The file is memory-mapped, so process memory is read straight into the mapping and compared without copies.
+    """
+    MAGIC = b'MHSNAP01'
+    FLAG_VALID = 0x01
+
+    _header = struct.Struct('<8sQ')
+    _entry = struct.Struct('<QQQQ')
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = []
+        self._file = None
+        self._map = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_file'] = None
+        state['_map'] = None
+        return state
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _align(offset: int):
+        return (offset + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+
+    def exists(self):
+        return len(self.entries) > 0 and self.path.exists()
+
+    def create(self, chunks: list):
+        self.delete()
+        self.path.parent.mkdir(exist_ok=True)
+        offset = self._align(self._header.size + self._entry.size * len(chunks))
+        for start, size in chunks:
+            self.entries.append({'index': len(self.entries), 'start': start, 'size': size, 'offset': offset, 'flags': 0})
+            offset = self._align(offset + size)
+        with open(self.path, 'wb') as f:
+            f.write(self._header.pack(self.MAGIC, len(self.entries)))
+            for entry in self.entries:
+                f.write(self._entry.pack(entry['start'], entry['size'], entry['offset'], entry['flags']))
+            f.truncate(offset)
+
+    def open(self, writable=False):
+        self.close()
+        self._file = open(self.path, 'r+b' if writable else 'rb')
+        #read only snapshots are mapped copy-on-write so ctypes buffers can be created over them
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_COPY)
+        self._read_index()
+        return self
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass #a buffer still references the mapping, it is released with the last buffer
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def delete(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self.entries = []
+
+    def _read_index(self):
+        magic, count = self._header.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            raise SearchException('{} is not a valid capture snapshot'.format(self.path))
+        self.entries = []
+        for i in range(0, count):
+            start, size, offset, flags = self._entry.unpack_from(self._map, self._header.size + self._entry.size * i)
+            self.entries.append({'index': i, 'start': start, 'size': size, 'offset': offset, 'flags': flags})
+
+    def _write_entry(self, entry):
+        self._entry.pack_into(self._map, self._header.size + self._entry.size * entry['index'], entry['start'], entry['size'], entry['offset'], entry['flags'])
+
+    def valid_entries(self):
+        return [x for x in self.entries if x['flags'] & self.FLAG_VALID]
+
+    def buffer(self, entry) -> ctypes.Array:
+        return (ctypes.c_ubyte * entry['size']).from_buffer(self._map, entry['offset'])
+
+    def read_entry(self, memory: Process, entry):
+        if self._map is None:
+            with self.open(writable=True):
+                return self.read_entry(memory, entry)
+        memory.read_memory(entry['start'], self.buffer(entry))
+        entry['flags'] |= self.FLAG_VALID
+        self._write_entry(entry)
+        return None
+
+    def store(self, entry, payload):
+        pass
+
+    def compare_buffer(self, entry, live_buffer: ctypes.Array):
+        return self.buffer(entry)
+
+
+class CompressedSnapshot(Snapshot):
+    """
+    Sparse, compressed capture of process memory.
+
+    Every region is stored as a zero page bitmap, a CRC32 hash for each page and independently compressed blocks of the
+    non-zero pages. Pages whose hash still matches the live page are taken from live memory instead of being decompressed.
+    """
+    MAGIC = b'MHSNAPZ1'
+    PAGE_SIZE = 4096
+    BLOCK_PAGES = 16
+
+    CODEC_ZLIB = 0
+    CODEC_ZSTD = 1
+    CODEC_LZ4 = 2
+
+    _trailer = struct.Struct('<QQ8s')
+    _record = struct.Struct('<QQ')
+    _zero_page = bytes(PAGE_SIZE)
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        if zstandard is not None:
+            self.codec = self.CODEC_ZSTD
+        elif lz4 is not None:
+            self.codec = self.CODEC_LZ4
+        else:
+            self.codec = self.CODEC_ZLIB
+        self._writable = False
+
+    def _compress(self, data: bytes):
+        if self.codec == self.CODEC_ZSTD:
+            return zstandard.ZstdCompressor(level=1).compress(data)
+        if self.codec == self.CODEC_LZ4:
+            return lz4.frame.compress(data)
+        return zlib.compress(data, 1)
+
+    def _decompress(self, data):
+        if self.codec == self.CODEC_ZSTD:
+            return zstandard.ZstdDecompressor().decompress(data)
+        if self.codec == self.CODEC_LZ4:
+            return lz4.frame.decompress(data)
+        return zlib.decompress(data)
+
+    def create(self, chunks: list):
+        self.delete()
+        self.path.parent.mkdir(exist_ok=True)
+        for start, size in chunks:
+            self.entries.append({'index': len(self.entries), 'start': start, 'size': size, 'offset': 0, 'flags': 0})
+        with open(self.path, 'wb') as f:
+            f.write(self._header.pack(self.MAGIC, self.codec))
+
+    def open(self, writable=False):
+        self.close()
+        self._writable = writable
+        if writable:
+            self._file = open(self.path, 'r+b')
+            self._file.seek(0, 2)
+            return self
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._read_index()
+        return self
+
+    def close(self):
+        if self._writable and self._file is not None:
+            self._write_index()
+        self._writable = False
+        super().close()
+
+    def _write_index(self):
+        index_offset = self._file.seek(0, 2)
+        for entry in self.entries:
+            self._file.write(self._entry.pack(entry['start'], entry['size'], entry['offset'], entry['flags']))
+        self._file.write(self._trailer.pack(index_offset, len(self.entries), self.MAGIC))
+
+    def _read_index(self):
+        magic, self.codec = self._header.unpack_from(self._map, 0)
+        index_offset, count, trailer_magic = self._trailer.unpack_from(self._map, len(self._map) - self._trailer.size)
+        if magic != self.MAGIC or trailer_magic != self.MAGIC:
+            raise SearchException('{} is not a valid capture snapshot'.format(self.path))
+        self.entries = []
+        for i in range(0, count):
+            start, size, offset, flags = self._entry.unpack_from(self._map, index_offset + self._entry.size * i)
+            self.entries.append({'index': i, 'start': start, 'size': size, 'offset': offset, 'flags': flags})
+
+    def _pages(self, size: int):
+        return [(pos, min(self.PAGE_SIZE, size - pos)) for pos in range(0, size, self.PAGE_SIZE)]
+
+    def read_entry(self, memory: Process, entry):
+        with BufferPool.shared().buffer(entry['size']) as region_buffer:
+            memory.read_memory(entry['start'], region_buffer)
+            return self._pack_entry(entry, memoryview(region_buffer).cast('B'))
+
+    def _pack_entry(self, entry, data: memoryview):
+        pages = self._pages(entry['size'])
+        zero_map = bytearray((len(pages) + 7) // 8)
+        hashes = []
+        blocks = []
+        for block in range(0, len(pages), self.BLOCK_PAGES):
+            parts = []
+            for i in range(block, min(block + self.BLOCK_PAGES, len(pages))):
+                pos, length = pages[i]
+                page = data[pos:pos+length]
+                hashes.append(zlib.crc32(page))
+                if page == self._zero_page[:length]:
+                    zero_map[i >> 3] |= 1 << (i & 7)
+                else:
+                    parts.append(page)
+            blocks.append(self._compress(b''.join(parts)) if parts else b'')
+        header = self._record.pack(len(pages), len(blocks))
+        lengths = struct.pack('<{}I'.format(len(blocks)), *[len(x) for x in blocks])
+        return b''.join([header, bytes(zero_map), struct.pack('<{}I'.format(len(hashes)), *hashes), lengths] + blocks)
+
+    def store(self, entry, payload):
+        if payload is None:
+            return
+        entry = self.entries[entry['index']]
+        entry['offset'] = self._file.tell()
+        entry['flags'] |= self.FLAG_VALID
+        self._file.write(payload)
+
+    def compare_buffer(self, entry, live_buffer: ctypes.Array):
+        page_count, block_count = self._record.unpack_from(self._map, entry['offset'])
+        pos = entry['offset'] + self._record.size
+        zero_map = self._map[pos:pos + (page_count + 7) // 8]
+        pos += len(zero_map)
+        hashes = struct.unpack_from('<{}I'.format(page_count), self._map, pos)
+        pos += 4 * page_count
+        lengths = struct.unpack_from('<{}I'.format(block_count), self._map, pos)
+        pos += 4 * block_count
+
+        live = memoryview(live_buffer).cast('B')
+        pages = self._pages(entry['size'])
+        dirty_blocks = {i // self.BLOCK_PAGES for i in range(0, page_count) if zlib.crc32(live[pages[i][0]:pages[i][0]+pages[i][1]]) != hashes[i]}
+        if not dirty_blocks:
+            return None
+
+        #start from the live memory, every clean page is identical to the capture
+        capture_buffer = (ctypes.c_ubyte * entry['size']).from_buffer_copy(live_buffer)
+        capture = memoryview(capture_buffer).cast('B')
+        block_offsets = [pos]
+        for length in lengths:
+            block_offsets.append(block_offsets[-1] + length)
+        for block in sorted(dirty_blocks):
+            data = self._decompress(self._map[block_offsets[block]:block_offsets[block + 1]]) if lengths[block] else b''
+            data_pos = 0
+            for i in range(block * self.BLOCK_PAGES, min((block + 1) * self.BLOCK_PAGES, page_count)):
+                page_pos, length = pages[i]
+                if zero_map[i >> 3] & (1 << (i & 7)):
+                    capture[page_pos:page_pos+length] = self._zero_page[:length]
+                else:
+                    capture[page_pos:page_pos+length] = data[data_pos:data_pos+length]
+                    data_pos += length
+        return capture_buffer
@@ -379,14 +379,7 @@ class AOB(Value):
     def compare_memory(self, memory: mem_edit.Process, address: int):
         try:
             read = memory.read_memory(address, (ctypes.c_ubyte * self.store_size)())
-            _bytes = bytes(read)
-            for i in range(0, len(self.value.aob_item['aob_bytes'])):
-                v = self.value.aob_item['aob_bytes'][i]
-                if v >= 256:
-                    continue
-                if v != _bytes[i]:
-                    return -1
-            return 0
+            return 0 if self.value.get_pattern().match(bytes(read)) else -1
         except OSError:
             return -1
 
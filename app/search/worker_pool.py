@@ -0,0 +1,250 @@
+import functools
+import multiprocessing
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from mem_edit import Process
+
+from app.search.result_transport import ResultArrays
+from app.search.scheduler import WorkerStats
+
+_cancel_flags = None
+_memory = None
+_task_state = threading.local()
+
+
+def _init_worker(cancel_flags):
+    global _cancel_flags
+    _cancel_flags = cancel_flags
+
+
+class _SlotToken:
+    """
+    Cancel token of a process pool job, its slot in the cancel flags shared with the workers.
+    """
+    def __init__(self, slot: int):
+        self.slot = slot
+
+    def is_set(self):
+        return _cancel_flags is not None and _cancel_flags[self.slot] != 0
+
+
+def worker_cancelled():
+    token = getattr(_task_state, 'token', None)
+    return token is not None and token.is_set()
+
+
+def _thread_name():
+    return threading.current_thread().name
+
+
+def _timed_task(func, token, args, worker=os.getpid):
+    #the token of the job the task belongs to, worker_cancelled checks it while the task runs
+    _task_state.token = token
+    start = time.perf_counter()
+    try:
+        res = func(args)
+    finally:
+        _task_state.token = None
+    if isinstance(res, dict):
+        res['worker'] = {'id': worker(), 'busy': time.perf_counter() - start}
+    return res
+
+
+def worker_memory(memory: Process):
+    """
+    Process handle for a worker. On Windows every worker keeps its own handle open and only reopens it when the pid changes.
+    """
+    global _memory
+    if platform.system() != "Windows":
+        return memory
+    if _memory is None or _memory.pid != memory.pid:
+        if _memory is not None:
+            _memory.close()
+        _memory = Process(memory.pid)
+    return _memory
+
+
+class WorkerJob:
+    """
+    The tasks of one imap_unordered call. Every job has its own cancel token and stats, so searches sharing a pool only
+    cancel and measure their own tasks.
+    """
+    def __init__(self, pool, token, tasks):
+        self.pool = pool
+        self.token = token
+        self.stats = WorkerStats(pool.processes)
+        self.done = False
+        self._results = self._record(tasks)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._results)
+
+    def _record(self, tasks):
+        try:
+            for res in tasks:
+                worker = res.pop('worker', None) if isinstance(res, dict) else None
+                if worker:
+                    self.stats.record(worker['id'], worker['busy'])
+                yield res
+        finally:
+            self.done = True
+            self.stats.finish()
+            self.pool.release_token(self.token)
+
+    def close(self):
+        """
+        Cancel and drain what is left of the job so its cancel token goes back to the pool, nothing to do once the
+        job is done. Callers that stop iterating early, on any exception, close the job in a finally block.
+        """
+        if not self.done:
+            self.pool.cancel(self)
+
+
+class WorkerPool:
+    """
+    Long lived pool of spawn workers shared by every SearcherMulti.
+
+    The pool starts on first use and is kept between searches so workers only import the app once. Every search gets
+    a slot in an array of cancel flags shared with the workers, cancelling a search sets its flag and the workers check
+    it between regions, the remaining tasks of that search finish early while other searches on the pool keep running.
+    """
+    _shared = None
+    threaded = False
+    max_jobs = 64
+
+    def __init__(self, processes: int = None):
+        self.processes = processes if processes else max(1, multiprocessing.cpu_count() - 1)
+        self._pool = None
+        self._flags = None
+        self._lock = threading.Lock()
+        self._free = list(range(self.max_jobs))
+
+    def __getstate__(self):
+        #worker processes never use the pool itself
+        return {'processes': self.processes, '_pool': None, '_flags': None, '_lock': None, '_free': []}
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context('spawn')
+                self._flags = context.RawArray('b', self.max_jobs)
+                self._pool = context.Pool(processes=self.processes, initializer=_init_worker, initargs=(self._flags,))
+            return self._pool
+
+    def acquire_token(self):
+        with self._lock:
+            if not self._free:
+                raise RuntimeError('More than {} searches are running on the worker pool'.format(self.max_jobs))
+            slot = self._free.pop()
+            self._flags[slot] = 0
+        return _SlotToken(slot)
+
+    def release_token(self, token):
+        with self._lock:
+            self._free.append(token.slot)
+
+    def cancel_token(self, token):
+        with self._lock:
+            if self._flags is not None:
+                self._flags[token.slot] = 1
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        """
+        Queue the tasks on the pool, idle workers take the next task as soon as they are done. Returns the WorkerJob of
+        the tasks, the busy time of every task is recorded in its stats.
+        """
+        pool = self.pool()
+        token = self.acquire_token()
+        return WorkerJob(self, token, pool.imap_unordered(functools.partial(_timed_task, func, token), iterable, chunksize=chunksize))
+
+    def cancel(self, job: WorkerJob):
+        #let the queued tasks of the job return early and drain them, the jobs of other searches are not touched
+        self.cancel_token(job.token)
+        try:
+            for res in job:
+                if isinstance(res, dict) and res.get('shared', None) is not None:
+                    ResultArrays.discard(res['shared'])
+        except Exception:
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+                self._flags = None
+
+
+class ThreadWorkerPool(WorkerPool):
+    """
+    Thread backed pool with the WorkerPool interface.
+
+    Process reads and the numpy operation kernels release the GIL, so threads scan in parallel without spawning
+    interpreters. Tasks share the searcher, its process handle and its results directly, nothing is pickled. The cancel
+    token of every search is its own threading.Event. bytes.find and the re module hold the GIL, scans built on them
+    run one at a time here, SearcherMulti sends exact int and AOB value searches to the process pool for that reason.
+    """
+    _shared = None
+    threaded = True
+
+    def __init__(self, threads: int = None):
+        super().__init__(threads if threads else max(1, multiprocessing.cpu_count()))
+        self._tokens = set()
+
+    def __getstate__(self):
+        return {'processes': self.processes, '_pool': None, '_lock': None, '_free': [], '_tokens': set()}
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.processes, thread_name_prefix='scan')
+            return self._pool
+
+    def acquire_token(self):
+        token = threading.Event()
+        with self._lock:
+            self._tokens.add(token)
+        return token
+
+    def release_token(self, token):
+        with self._lock:
+            self._tokens.discard(token)
+
+    def cancel_token(self, token):
+        token.set()
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        pool = self.pool()
+        token = self.acquire_token()
+        futures = [pool.submit(_timed_task, func, token, args, _thread_name) for args in iterable]
+        return WorkerJob(self, token, (future.result() for future in as_completed(futures)))
+
+    def cancel(self, job: WorkerJob):
+        self.cancel_token(job.token)
+        try:
+            for _ in job:
+                pass
+        except Exception:
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                for token in self._tokens:
+                    token.set()
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
@@ -11,7 +11,7 @@ from typing import Union
 from falcon import Request, Response
 from falcon.app_helpers import MEDIA_JSON
 
-from app.helpers import DynamicHTML, MemoryHandler
+from app.helpers import DynamicHTML, MemoryHandler, PointerResolver
 from app.helpers import memory_utils
 from app.helpers.directory_utils import codes_directory
 from app.helpers.exceptions import AOBException
@@ -28,6 +28,7 @@ ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, cty
 class CodeList(MemoryHandler):
     directory = codes_directory
     _FILE_VERSION = __version__
+    aob_full_scan_interval = 5
     def __init__(self):
         super().__init__('codelist')
         self.handle_map = {
@@ -599,20 +600,36 @@ class CodeList(MemoryHandler):
             del self.code_data[index]
 
     def update_aobs(self):
-        for aob in self.aob_map.values():
-            if aob.is_found():
-                bases = self.utilities.compare_aob(aob)
-                aob.set_bases(bases)
-            #if not aob.is_found() and aob.get_last_searched() > random.randint(8, 12):
-            else:
-                bases = self.utilities.search_aob_all_memory(aob)
-                aob.set_bases(bases)
+        #the known bases of every AOB are checked with one read, an AOB that moved is searched for near its old bases
+        #and only the AOBs still lost after that are left to the full scan of _aob_process
+        found = [aob for aob in self.aob_map.values() if aob.is_found()]
+        for aob, bases in self.utilities.compare_aobs(found).items():
+            if not bases:
+                bases = self.utilities.search_aob_near(aob)
+            aob.set_bases(bases)
+
+    def resolve_pointers(self):
+        #every pointer code is resolved in one batch, codes sharing a base and their first offsets read them once
+        chains = {}
+        for key, code in self.code_data.items():
+            if code['Source'] != 'pointer':
+                continue
+            try:
+                chains[key] = (self.base_converter.convert(self.mem(), code['Address']), [int(x.strip(), 16) for x in code['Offsets'].split(',')])
+            except (ProcessLookupError, PermissionError):
+                self.update_event.set()
+                return {}
+            except (OSError, BaseConvertException, ValueError):
+                continue
+        return dict(zip(chains.keys(), PointerResolver(self.mem()).resolve(chains.values())))
+
     def _update_process(self):
         while not self.update_event.is_set():
             with self.update_lock:
                 self.result_map.clear()
                 if self.aob_map:
                     self.update_aobs()
+                pointers = self.resolve_pointers()
                 for key, code in self.code_data.items():
                     if code['Source'] == 'address':
                         try:
@@ -630,17 +647,14 @@ class CodeList(MemoryHandler):
                             read = None
                         self.result_map[key] = {'Value': {'Actual': read.value if read is not None else None, 'Display': str(read.value) if read is not None else '??'}}
                     elif code['Source'] == 'pointer':
-                        offsets = [int(x.strip(), 16) for x in code['Offsets'].split(',')]
-                        buf = ctypes.c_uint64()
+                        addr = pointers.get(key, None)
+                        read = None
                         try:
-                            addr = self.base_converter.convert(self.mem(), code['Address'])
-                            for offset in offsets:
-                                self.mem().read_memory(addr, buf)
-                                addr = buf.value+offset
-                            read = self.get_read(code, addr)
-                            code['Resolved'] = addr if addr > 0xffff else 0
-                            if addr <= 0xffff:
-                                addr = None
+                            if addr is not None:
+                                read = self.get_read(code, addr)
+                                code['Resolved'] = addr if addr > 0xffff else 0
+                                if addr <= 0xffff:
+                                    addr = None
                         except (ProcessLookupError, PermissionError):
                             self.update_event.set()
                             read = None
@@ -651,9 +665,6 @@ class CodeList(MemoryHandler):
                         except CodelistException:
                             read = None
                             addr = None
-                        except BaseConvertException:
-                            read = None
-                            addr = None
                         self.result_map[key] = {'Value': {'Actual': read.value if read is not None else None, 'Display': str(read.value) if read is not None else '??'},
                                                 'Resolved': {'Actual': addr, 'Display': "{:X}".format(addr) if addr is not None else '????????'}}
                     else:
@@ -794,15 +805,13 @@ class CodeList(MemoryHandler):
 
     def _aob_process(self):
         self.aob_searcher.create_searcher()
-        base_list = {}
         while not self.aob_event.is_set():
-            base_list.clear()
-            if self.aob_map:
-                for aob in self.aob_map.values():
-                    bases = self.aob_searcher.search_aob_all_memory(aob)
-                    base_list[aob] = bases
+            #lost AOBs share one pass over memory, at most every aob_full_scan_interval seconds per AOB
+            lost = [aob for aob in list(self.aob_map.values()) if not aob.is_found() and aob.get_last_searched() >= self.aob_full_scan_interval]
+            if lost:
+                base_list = self.aob_searcher.search_aobs_all_memory(lost)
                 with self.update_lock:
                     for aob, bases in base_list.items():
                         aob.set_bases(bases)
-            self.aob_event.wait(15)
+            self.aob_event.wait(1)
 
@@ -12,6 +12,7 @@ from falcon import Request, Response, MEDIA_JSON
 
 from app.helpers.exceptions import ProcessException
 from app.helpers.memory_utils import is_process_valid
+from app.helpers.process.process_map import ProcessMap
 from app.helpers.process_utils import is_pid_valid, can_attach
 from app.services.service import Service
 
@@ -131,6 +132,8 @@ class Process(Service):
                 proc.close()
             except mem_edit.MemEditError:
                 pass
+        #the cached map holds the closed handle, a reattach or a new process reusing the pid loads a fresh one
+        ProcessMap.discard(pid)
 
     def open_process(self, p: str, service: str):
         p_data = None
@@ -12,6 +12,8 @@ from falcon.app_helpers import MEDIA_JSON
 
 from app.helpers import DynamicHTML, MemoryHandler, Progress
 from app.helpers import memory_utils
+from app.helpers.columnar_results import ColumnarResults
+from app.helpers.directory_utils import memory_directory
 from app.helpers.exceptions import SearchException, BreakException
 from app.search.operations import GreaterThan, LessThan, GreaterThanFloat, LessThanFloat, IncreaseOperation, \
     DecreaseOperation, \
@@ -30,6 +32,12 @@ class Search(MemoryHandler):
     FLOW_RESULTS = 0
     FLOW_NO_RESULTS = 2
     FLOW_INITIALIZE_UNKNOWN = 1
+    #default backend of the parallel scans, a search request can pick another one with its 'parallel' field
+    parallel_mode = SearcherMulti.PARALLEL_PROCESS
+    #unknown value captures use the compressed snapshot codec, a search request can turn it off with its 'compression'
+    #field, False keeps the plain Snapshot
+    capture_compression = True
+
     def __init__(self):
         super().__init__('search')
         self.handle_map = {
@@ -194,8 +202,14 @@ class Search(MemoryHandler):
                 self.flow = self.FLOW_START
             raise SearchException("Search type {} is not valid".format(req.media['type']))
         if not self.searcher:
-            self.searcher = SearcherMulti(self.mem(), self.progress)
+            results = ColumnarResults('results', db_path=memory_directory.joinpath('scripts.db')) if ColumnarResults.available() else None
+            self.searcher = SearcherMulti(self.mem(), self.progress, results=results)
             self.searcher.reset()
+        self.searcher.set_parallel_mode(req.media.get('parallel', self.parallel_mode))
+        if self.round == 0:
+            #the codec can only change before a capture, later rounds compare against the snapshot already taken
+            compression = req.media.get('compression', None)
+            self.searcher.set_capture_compression(self.capture_compression if compression is None else compression in (True, 'true'))
         if (self.flow == self.FLOW_START and self.size == 'float') or \
                 (self.flow == self.FLOW_INITIALIZE_UNKNOWN and self.size != 'byte_1') or \
                 (self.flow == self.FLOW_START and (self.type == 'greater_than' or self.type == 'less_than') and self.size != 'byte_1'):
@@ -298,6 +312,7 @@ class Search(MemoryHandler):
                 self.searcher.clear_proximity()
             self.searcher.set_aligned(self.aligned)
             searcher(copy.deepcopy(self.value))
+            logging.debug("Search worker stats {}".format(self.searcher.get_worker_stats()))
         except BreakException:
             return
         except SearchException:
@@ -6,6 +6,7 @@ from falcon_multipart.middleware import MultipartMiddleware
 from app import ScriptResource, SearchResource, MainResource, AOBResource, InfoResource, CodeListResource
 from app.main import initialize
 from app.helpers.data_store import DataStore
+from app.search.worker_pool import WorkerPool, ThreadWorkerPool
 from wsgiref.simple_server import make_server, WSGIRequestHandler
 
 class NoLoggingWSGIRequestHandler(WSGIRequestHandler):
@@ -31,3 +32,7 @@ if __name__ == '__main__':
             httpd.serve_forever()
     except KeyboardInterrupt:
         DataStore().kill()
+    finally:
+        #the shared pools belong to the application, not to one service, their workers must not outlive it
+        WorkerPool.shared().close()
+        ThreadWorkerPool.shared().close()